@@ -0,0 +1,73 @@
+"""
+Concurrent request throughput of an async handler doing one DB round trip,
+using the old blocking sync Session versus the AsyncSession dependency.
+
+Each simulated request runs `SELECT pg_sleep(...)` to model query latency, so
+the numbers show how much the event loop is serialized by blocking calls.
+
+    python -m benchmarks.async_db_benchmark --requests 500 --concurrency 50 --query-ms 5
+"""
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from config import settings
+from database import AsyncSessionLocal, async_engine
+
+
+async def run(handler, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(requests)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, concurrency: int, query_ms: float) -> None:
+    query = text("SELECT pg_sleep(:seconds)").bindparams(seconds=query_ms / 1000.0)
+
+    sync_engine = create_engine(settings.DATABASE_URL, pool_size=concurrency, pool_pre_ping=True)
+    SyncSession = sessionmaker(bind=sync_engine)
+
+    async def sync_handler():
+        # What the routers did before: a blocking call inside `async def`
+        db = SyncSession()
+        try:
+            db.execute(query).all()
+        finally:
+            db.close()
+
+    async def async_handler():
+        async with AsyncSessionLocal() as db:
+            (await db.execute(query)).all()
+
+    # Warm both pools so connection setup is not measured
+    await run(sync_handler, concurrency, concurrency)
+    await run(async_handler, concurrency, concurrency)
+
+    before = await run(sync_handler, requests, concurrency)
+    after = await run(async_handler, requests, concurrency)
+
+    print(f"{requests} requests, concurrency {concurrency}, {query_ms:g} ms per query")
+    print(f"  sync Session (before):  {before:8.1f} req/s")
+    print(f"  AsyncSession (after):   {after:8.1f} req/s")
+    print(f"  speedup:                {after / before:8.2f}x")
+
+    sync_engine.dispose()
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--query-ms", type=float, default=5.0)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency, args.query_ms))
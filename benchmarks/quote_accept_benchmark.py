@@ -0,0 +1,126 @@
+"""
+Stress test for quote acceptance: parallel accepts fired at one shipment.
+
+Each round creates --quotes pending quotes on an existing shipment and sends
+--concurrency accept attempts at them at once, each on its own session, the
+way concurrent requests would. A round is correct when exactly one attempt
+succeeds, exactly one quote ends up accepted and all others are rejected.
+The quotes are deleted and the shipment status restored afterwards.
+
+    python -m benchmarks.quote_accept_benchmark --shipment-id <uuid> --forwarder-id <uuid> --rounds 20 --concurrency 50
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select, update
+
+from database import AsyncSessionLocal, async_engine
+from shipments.models import Shipment
+from quotes.models import Quote
+from quotes.acceptance import accept_pending_quote
+
+
+async def attempt(shipment_id, quote_id) -> tuple:
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        shipment = await db.get(Shipment, shipment_id)
+        try:
+            await accept_pending_quote(db, shipment, quote_id)
+            outcome = "accepted"
+        except HTTPException as e:
+            outcome = str(e.status_code)
+    return outcome, time.perf_counter() - started
+
+
+async def run_round(shipment_id, forwarder_id, quotes: int, concurrency: int) -> tuple:
+    quote_ids = [uuid.uuid4() for _ in range(quotes)]
+    valid_until = datetime.now(timezone.utc) + timedelta(days=7)
+    async with AsyncSessionLocal() as db:
+        await db.execute(insert(Quote), [
+            {
+                "id": quote_id,
+                "shipment_id": shipment_id,
+                "forwarder_id": forwarder_id,
+                "freight_amount_usd": 1000.0,
+                "total_amount_usd": 1000.0,
+                "validity_date": valid_until,
+                "transit_time_days": 20,
+                "routing": "benchmark",
+                "status": "pending"
+            }
+            for quote_id in quote_ids
+        ])
+        await db.commit()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        attempt(shipment_id, random.choice(quote_ids)) for _ in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(Quote.status, func.count()).filter(Quote.id.in_(quote_ids)).group_by(Quote.status)
+        )
+        statuses = dict(result.all())
+        await db.execute(delete(Quote).filter(Quote.id.in_(quote_ids)))
+        await db.commit()
+
+    outcomes = Counter(outcome for outcome, _ in results)
+    correct = (
+        outcomes["accepted"] == 1
+        and statuses.get("accepted") == 1
+        and statuses.get("rejected", 0) == quotes - 1
+    )
+    return correct, outcomes, elapsed, [latency for _, latency in results]
+
+
+async def main(shipment_id: str, forwarder_id: str, rounds: int, quotes: int, concurrency: int) -> None:
+    async with AsyncSessionLocal() as db:
+        original_status = (await db.execute(select(Shipment.status).filter(Shipment.id == shipment_id))).scalar_one()
+
+    failures = 0
+    outcomes: Counter = Counter()
+    latencies = []
+    elapsed = 0.0
+    try:
+        for _ in range(rounds):
+            correct, round_outcomes, round_elapsed, round_latencies = await run_round(
+                shipment_id, forwarder_id, quotes, concurrency
+            )
+            failures += not correct
+            outcomes.update(round_outcomes)
+            latencies.extend(round_latencies)
+            elapsed += round_elapsed
+    finally:
+        async with AsyncSessionLocal() as db:
+            await db.execute(update(Shipment).filter(Shipment.id == shipment_id).values(status=original_status))
+            await db.commit()
+        await async_engine.dispose()
+
+    latencies.sort()
+    attempts = rounds * concurrency
+    print(f"{rounds} rounds x {concurrency} parallel accepts over {quotes} quotes")
+    print(f"  incorrect rounds:  {failures}")
+    print(f"  outcomes:          {dict(outcomes)}")
+    print(f"  throughput:        {attempts / elapsed:8.1f} attempts/s")
+    print(f"  latency p50:       {statistics.median(latencies) * 1000:8.1f} ms")
+    print(f"  latency p99:       {latencies[int(len(latencies) * 0.99) - 1] * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--shipment-id", required=True)
+    parser.add_argument("--forwarder-id", required=True)
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--quotes", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+    asyncio.run(main(args.shipment_id, args.forwarder_id, args.rounds, args.quotes, args.concurrency))
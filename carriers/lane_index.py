@@ -0,0 +1,224 @@
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Deque, Dict, List, Optional, Tuple
+
+from sqlalchemy import event, inspect, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from . import schemas
+from .models import CarrierBooking
+from .prediction import booking_rate, normalize_code
+
+# Most recent observations kept per lane and series
+WINDOW_SIZE = 500
+# How far back the startup rebuild reads
+REBUILD_LOOKBACK_DAYS = 180
+
+LaneKey = Tuple[str, str, str]
+
+
+class RollingWindow:
+    """Last `size` rate observations, kept sorted for O(1) percentile reads"""
+
+    def __init__(self, size: int = WINDOW_SIZE):
+        self.size = size
+        self.values: Deque[float] = deque()
+        self.sorted: List[float] = []
+        self.count = 0
+        self.last_updated: Optional[datetime] = None
+
+    def add(self, value: float, observed_at: datetime) -> None:
+        self.values.append(value)
+        insort(self.sorted, value)
+        if len(self.values) > self.size:
+            oldest = self.values.popleft()
+            del self.sorted[bisect_left(self.sorted, oldest)]
+        self.count += 1
+        if self.last_updated is None or observed_at > self.last_updated:
+            self.last_updated = observed_at
+
+    def percentile(self, q: float) -> Optional[float]:
+        if not self.sorted:
+            return None
+        position = q * (len(self.sorted) - 1)
+        lower = int(position)
+        upper = min(lower + 1, len(self.sorted) - 1)
+        return self.sorted[lower] + (self.sorted[upper] - self.sorted[lower]) * (position - lower)
+
+    def stats(self) -> schemas.RateWindowStats:
+        return schemas.RateWindowStats(
+            count=self.count,
+            windowSize=len(self.values),
+            p10=self.percentile(0.10),
+            p50=self.percentile(0.50),
+            p90=self.percentile(0.90),
+            lastUpdated=self.last_updated
+        )
+
+
+class LaneRateIndex:
+    """
+    Rolling rate percentiles per (origin, destination, container_type).
+
+    Two series are kept per lane: `quoted` (every forwarder quote) and
+    `booked` (accepted quotes and carrier bookings). The index is rebuilt from
+    the DB at startup and then kept current by ORM events on commit.
+    """
+
+    QUOTED = "quoted"
+    BOOKED = "booked"
+
+    def __init__(self):
+        self._lanes: Dict[LaneKey, Dict[str, RollingWindow]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, lane: LaneKey, series: str, rate: float, observed_at: Optional[datetime] = None) -> None:
+        if not rate or rate <= 0 or not all(lane):
+            return
+        observed_at = observed_at or datetime.now(timezone.utc)
+        with self._lock:
+            windows = self._lanes.setdefault(lane, {self.QUOTED: RollingWindow(), self.BOOKED: RollingWindow()})
+            windows[series].add(float(rate), observed_at)
+
+    def lookup(self, origin: str, destination: str, container_type: str) -> Optional[schemas.LaneRateStats]:
+        lane = (normalize_code(origin), normalize_code(destination), normalize_code(container_type))
+        with self._lock:
+            windows = self._lanes.get(lane)
+            if windows is None:
+                return None
+            return schemas.LaneRateStats(
+                origin=lane[0],
+                destination=lane[1],
+                containerType=lane[2],
+                quoted=windows[self.QUOTED].stats(),
+                booked=windows[self.BOOKED].stats()
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._lanes.clear()
+
+    async def rebuild(self, db: AsyncSession) -> int:
+        """Reload recent quotes and bookings; returns the number of observations"""
+        from quotes.models import Quote
+        from shipments.models import Shipment
+
+        since = datetime.now(timezone.utc) - timedelta(days=REBUILD_LOOKBACK_DAYS)
+        self.clear()
+        observations = 0
+
+        quotes = await db.execute(
+            select(
+                Shipment.origin_port,
+                Shipment.destination_port,
+                Quote.container_type,
+                Shipment.container_type,
+                Quote.total_amount_usd,
+                Quote.container_quantity,
+                Quote.status,
+                Quote.created_at
+            ).join(Shipment, Quote.shipment_id == Shipment.id).filter(
+                Quote.created_at >= since
+            ).order_by(Quote.created_at)
+        )
+        for origin, destination, quote_container, shipment_container, total, quantity, status, created_at in quotes:
+            lane = (normalize_code(origin), normalize_code(destination), normalize_code(quote_container or shipment_container))
+            rate = (total or 0) / max(quantity or 1, 1)
+            self.record(lane, self.QUOTED, rate, created_at)
+            if status == "accepted":
+                self.record(lane, self.BOOKED, rate, created_at)
+            observations += 1
+
+        bookings = await db.execute(
+            select(
+                CarrierBooking.origin,
+                CarrierBooking.destination,
+                CarrierBooking.container_type,
+                CarrierBooking.metadata_,
+                CarrierBooking.created_at
+            ).filter(CarrierBooking.created_at >= since).order_by(CarrierBooking.created_at)
+        )
+        for origin, destination, container_type, metadata, created_at in bookings:
+            rate = booking_rate(metadata)
+            if rate:
+                lane = (normalize_code(origin), normalize_code(destination), normalize_code(container_type))
+                self.record(lane, self.BOOKED, rate, created_at)
+                observations += 1
+
+        return observations
+
+
+lane_rate_index = LaneRateIndex()
+
+_PENDING_KEY = "lane_rate_index_pending"
+
+
+def quote_lane(shipment, quote) -> LaneKey:
+    return (
+        normalize_code(shipment.origin_port),
+        normalize_code(shipment.destination_port),
+        normalize_code(quote.container_type or shipment.container_type)
+    )
+
+
+def quote_rate(quote) -> float:
+    """Per-container rate of a quote"""
+    return (quote.total_amount_usd or 0) / max(quote.container_quantity or 1, 1)
+
+
+def record_accepted_quote(shipment, quote) -> None:
+    """
+    Count an acceptance written with a Core UPDATE, which the flush listener
+    below never sees. Call after the commit.
+    """
+    lane_rate_index.record(quote_lane(shipment, quote), LaneRateIndex.BOOKED, quote_rate(quote))
+
+
+def _quote_lane(session: Session, quote) -> Optional[LaneKey]:
+    from shipments.models import Shipment
+
+    # Usually already in the identity map (loaded for the permission checks)
+    shipment = session.get(Shipment, quote.shipment_id)
+    if shipment is None:
+        return None
+    return quote_lane(shipment, quote)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_rate_observations(session: Session, flush_context) -> None:
+    from quotes.models import Quote
+
+    pending = session.info.setdefault(_PENDING_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, Quote):
+            lane = _quote_lane(session, obj)
+            if lane:
+                rate = quote_rate(obj)
+                pending.append((lane, LaneRateIndex.QUOTED, rate))
+                if obj.status == "accepted":
+                    pending.append((lane, LaneRateIndex.BOOKED, rate))
+        elif isinstance(obj, CarrierBooking):
+            rate = booking_rate(obj.metadata_)
+            if rate:
+                lane = (normalize_code(obj.origin), normalize_code(obj.destination), normalize_code(obj.container_type))
+                pending.append((lane, LaneRateIndex.BOOKED, rate))
+
+    for obj in session.dirty:
+        if isinstance(obj, Quote) and "accepted" in inspect(obj).attrs.status.history.added:
+            lane = _quote_lane(session, obj)
+            if lane:
+                pending.append((lane, LaneRateIndex.BOOKED, quote_rate(obj)))
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_rate_observations(session: Session) -> None:
+    for lane, series, rate in session.info.pop(_PENDING_KEY, []):
+        lane_rate_index.record(lane, series, rate)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_rate_observations(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
@@ -0,0 +1,316 @@
+import asyncio
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+
+RATE_MODEL_PATH = os.getenv("RATE_MODEL_PATH", os.path.join("models", "rate_model.npz"))
+
+# Predictions look this many days ahead of the current rate
+HORIZON_DAYS = 30
+# Relative change that counts as an UP/DOWN trend
+TREND_THRESHOLD = 0.03
+# Observations at which a lane's history is weighted 50/50 against the current rate
+CONFIDENCE_PRIOR = 5.0
+# Cap on log-rate drift per day so sparse lanes don't extrapolate wildly
+MAX_DAILY_SLOPE = 0.01
+# Confidence reported for lanes with no history of their own
+UNKNOWN_LANE_CONFIDENCE = 0.2
+
+RECOMMENDATIONS = {
+    "UP": "Book early before rates increase",
+    "DOWN": "Rates are softening; consider waiting before booking",
+    "STABLE": "Rates are stable; book at your convenience",
+}
+
+# (origin, destination, container_type, carrier, rate_usd, observed_at)
+RateSample = Tuple[str, str, str, Optional[str], float, datetime]
+
+
+def normalize_code(value: Optional[str]) -> str:
+    """Upper-case, trimmed port/carrier/container code"""
+    return (value or "").strip().upper()
+
+
+class RatePredictionModel:
+    """
+    Per-lane log-linear rate model.
+
+    For every (origin, destination, container_type) lane it stores the current
+    log-rate level, its daily drift and residual spread, plus a shrunk
+    multiplicative factor per carrier. Scoring is a handful of NumPy gathers
+    and element-wise ops, so thousands of lanes score in one pass.
+    """
+
+    def __init__(self, origins: np.ndarray, destinations: np.ndarray, container_types: np.ndarray,
+                 level: np.ndarray, slope: np.ndarray, spread: np.ndarray, count: np.ndarray,
+                 carriers: np.ndarray, carrier_factor: np.ndarray, global_slope: float, trained_at: float):
+        self.origins = origins
+        self.destinations = destinations
+        self.container_types = container_types
+        self.level = level
+        self.slope = slope
+        self.spread = spread
+        self.count = count
+        self.carriers = carriers
+        self.carrier_factor = carrier_factor
+        self.global_slope = float(global_slope)
+        self.trained_at = float(trained_at)
+        self.lane_index: Dict[Tuple[str, str, str], int] = {
+            lane: i for i, lane in enumerate(zip(origins.tolist(), destinations.tolist(), container_types.tolist()))
+        }
+        self.carrier_index: Dict[str, int] = {c: i for i, c in enumerate(carriers.tolist())}
+
+    @property
+    def trained_at_datetime(self) -> datetime:
+        return datetime.fromtimestamp(self.trained_at, tz=timezone.utc)
+
+    @classmethod
+    def fit(cls, samples: Sequence[RateSample]) -> "RatePredictionModel":
+        if not samples:
+            raise ValueError("No rate history to train on")
+
+        origins, destinations, container_types, carriers, rates, observed = zip(*samples)
+        lanes = np.array([f"{o}|{d}|{c}" for o, d, c in zip(origins, destinations, container_types)])
+        lane_keys, inv = np.unique(lanes, return_inverse=True)
+        n_lanes = len(lane_keys)
+
+        y = np.log(np.asarray(rates, dtype=np.float64))
+        ts = np.array([o.timestamp() for o in observed], dtype=np.float64)
+        t = (ts - ts.max()) / 86400.0  # days relative to the newest observation
+
+        count = np.bincount(inv, minlength=n_lanes).astype(np.float64)
+        mean_y = np.bincount(inv, weights=y, minlength=n_lanes) / count
+        mean_t = np.bincount(inv, weights=t, minlength=n_lanes) / count
+        dt = t - mean_t[inv]
+        dy = y - mean_y[inv]
+        sxx = np.bincount(inv, weights=dt * dt, minlength=n_lanes)
+        sxy = np.bincount(inv, weights=dt * dy, minlength=n_lanes)
+        slope = np.where(sxx > 1e-9, sxy / np.maximum(sxx, 1e-9), 0.0)
+        slope = np.clip(slope, -MAX_DAILY_SLOPE, MAX_DAILY_SLOPE)
+        # Level at t=0, i.e. the lane's rate as of the newest observation
+        level = mean_y - slope * mean_t
+
+        residual = y - (level[inv] + slope[inv] * t)
+        spread = np.sqrt(np.bincount(inv, weights=residual * residual, minlength=n_lanes) / count)
+
+        carrier_names = np.array([normalize_code(c) or "*" for c in carriers])
+        carrier_keys, carrier_inv = np.unique(carrier_names, return_inverse=True)
+        carrier_count = np.bincount(carrier_inv).astype(np.float64)
+        carrier_factor = np.bincount(carrier_inv, weights=residual) / carrier_count
+        carrier_factor *= carrier_count / (carrier_count + CONFIDENCE_PRIOR)
+
+        multi = count >= 3
+        global_slope = float(np.average(slope[multi], weights=count[multi])) if multi.any() else 0.0
+
+        split = np.char.split(lane_keys, "|")
+        return cls(
+            origins=np.array([s[0] for s in split]),
+            destinations=np.array([s[1] for s in split]),
+            container_types=np.array([s[2] for s in split]),
+            level=level,
+            slope=slope,
+            spread=spread,
+            count=count,
+            carriers=carrier_keys,
+            carrier_factor=carrier_factor,
+            global_slope=global_slope,
+            trained_at=datetime.now(timezone.utc).timestamp(),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            origins=self.origins,
+            destinations=self.destinations,
+            container_types=self.container_types,
+            level=self.level,
+            slope=self.slope,
+            spread=self.spread,
+            count=self.count,
+            carriers=self.carriers,
+            carrier_factor=self.carrier_factor,
+            global_slope=np.array(self.global_slope),
+            trained_at=np.array(self.trained_at),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "RatePredictionModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                origins=data["origins"],
+                destinations=data["destinations"],
+                container_types=data["container_types"],
+                level=data["level"],
+                slope=data["slope"],
+                spread=data["spread"],
+                count=data["count"],
+                carriers=data["carriers"],
+                carrier_factor=data["carrier_factor"],
+                global_slope=float(data["global_slope"]),
+                trained_at=float(data["trained_at"]),
+            )
+
+    def score(self, requests: Sequence[schemas.RatePredictionRequest]) -> Dict[str, np.ndarray]:
+        """Vectorized scoring; returns parallel arrays for every request"""
+        n = len(requests)
+        lane_idx = np.fromiter(
+            (self.lane_index.get((normalize_code(r.origin), normalize_code(r.destination), normalize_code(r.containerType)), -1) for r in requests),
+            dtype=np.int64, count=n
+        )
+        carrier_idx = np.fromiter(
+            (self.carrier_index.get(normalize_code(r.carrier), -1) for r in requests),
+            dtype=np.int64, count=n
+        )
+        current = np.maximum(np.fromiter((r.currentRateUSD for r in requests), dtype=np.float64, count=n), 1e-6)
+
+        known = lane_idx >= 0
+        safe_idx = np.where(known, lane_idx, 0)
+        slope = np.where(known, self.slope[safe_idx], self.global_slope)
+        carrier_factor = np.where(carrier_idx >= 0, self.carrier_factor[np.maximum(carrier_idx, 0)], 0.0)
+        count = np.where(known, self.count[safe_idx], 0.0)
+
+        drift = slope * HORIZON_DAYS
+        history_log = self.level[safe_idx] + carrier_factor + drift
+        current_log = np.log(current) + drift
+        weight = count / (count + CONFIDENCE_PRIOR)
+        predicted = np.exp(weight * history_log + (1.0 - weight) * current_log)
+
+        change = predicted / current - 1.0
+        trend = np.where(change > TREND_THRESHOLD, "UP", np.where(change < -TREND_THRESHOLD, "DOWN", "STABLE"))
+        confidence = np.where(
+            known,
+            np.clip(weight * np.exp(-self.spread[safe_idx]), 0.05, 0.99),
+            UNKNOWN_LANE_CONFIDENCE
+        )
+        return {
+            "predicted": predicted,
+            "trend": trend,
+            "confidence": confidence,
+            "known": known,
+            "samples": count,
+        }
+
+
+class RatePredictor:
+    """Holds the active model; loaded from disk at startup, retrained on demand"""
+
+    def __init__(self, path: str = RATE_MODEL_PATH):
+        self.path = path
+        self.model: Optional[RatePredictionModel] = None
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        self.model = RatePredictionModel.load(self.path)
+        return True
+
+    async def train(self, db: AsyncSession) -> RatePredictionModel:
+        samples = await load_training_samples(db)
+        # Fitting and writing the model are CPU/disk bound; keep them off the event loop
+        model = await asyncio.to_thread(RatePredictionModel.fit, samples)
+        await asyncio.to_thread(model.save, self.path)
+        self.model = model
+        return model
+
+    def predict(self, requests: Sequence[schemas.RatePredictionRequest]) -> List[schemas.RatePredictionResult]:
+        scores = self.model.score(requests)
+        return [
+            schemas.RatePredictionResult(
+                origin=r.origin,
+                destination=r.destination,
+                carrier=r.carrier,
+                containerType=r.containerType,
+                predictedRateUSD=round(float(predicted), 2),
+                trend=str(trend),
+                confidenceScore=round(float(confidence), 3),
+                recommendation=RECOMMENDATIONS[str(trend)],
+                source="LANE" if known else "GLOBAL",
+                samples=int(samples)
+            )
+            for r, predicted, trend, confidence, known, samples in zip(
+                requests, scores["predicted"], scores["trend"], scores["confidence"],
+                scores["known"], scores["samples"]
+            )
+        ]
+
+
+def booking_rate(metadata: Optional[dict]) -> Optional[float]:
+    if not metadata:
+        return None
+    for key in ("rateUSD", "totalRateUSD", "rate"):
+        value = metadata.get(key)
+        if isinstance(value, (int, float)) and value > 0:
+            return float(value)
+    return None
+
+
+async def load_training_samples(db: AsyncSession) -> List[RateSample]:
+    """Collect rate observations from carrier bookings and accepted quotes"""
+    from .models import CarrierBooking
+    from quotes.models import Quote
+    from shipments.models import Shipment
+
+    samples: List[RateSample] = []
+
+    bookings = await db.execute(
+        select(
+            CarrierBooking.origin,
+            CarrierBooking.destination,
+            CarrierBooking.container_type,
+            CarrierBooking.carrier,
+            CarrierBooking.metadata_,
+            CarrierBooking.created_at
+        )
+    )
+    for origin, destination, container_type, carrier, metadata, created_at in bookings:
+        rate = booking_rate(metadata)
+        if rate and created_at:
+            samples.append((normalize_code(origin), normalize_code(destination), normalize_code(container_type), carrier, rate, created_at))
+
+    quotes = await db.execute(
+        select(
+            Shipment.origin_port,
+            Shipment.destination_port,
+            Quote.container_type,
+            Shipment.container_type,
+            Quote.total_amount_usd,
+            Quote.container_quantity,
+            Quote.created_at
+        ).join(Shipment, Quote.shipment_id == Shipment.id).filter(
+            Quote.status == "accepted"
+        )
+    )
+    for origin, destination, quote_container, shipment_container, total, quantity, created_at in quotes:
+        if total and total > 0 and created_at:
+            samples.append((
+                normalize_code(origin),
+                normalize_code(destination),
+                normalize_code(quote_container or shipment_container),
+                None,
+                total / max(quantity or 1, 1),
+                created_at
+            ))
+
+    return samples
+
+
+rate_predictor = RatePredictor()
+
+
+async def _train_from_cli() -> None:
+    from database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        trained = await rate_predictor.train(db)
+    print(f"Trained rate model on {int(trained.count.sum())} samples across {len(trained.lane_index)} lanes -> {rate_predictor.path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_train_from_cli())
@@ -1,7 +1,15 @@
-from fastapi import APIRouter, Depends
-from sqlalchemy.orm import Session
-from database import get_db
+import httpx
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import Optional
+from database import get_async_db
+from utils.http_client import get_upstream_client
 from . import schemas, service
+from .lane_index import lane_rate_index
+from .tariffs import MAX_TARIFF_UPLOAD_BYTES, tariff_store
+
+get_carrier_client = get_upstream_client(service.CARRIER_UPSTREAM)
 
 router = APIRouter(
     prefix="/api/carriers",
@@ -9,31 +17,133 @@ router = APIRouter(
 )
 
 @router.post("/booking/create", response_model=schemas.BookingResponse)
-async def create_booking(request: schemas.BookingRequest, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def create_booking(request: schemas.BookingRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.create_booking(request)
 
 @router.get("/booking/status/{booking_number}", response_model=schemas.BookingStatusResponse)
-async def get_booking_status(booking_number: str, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def get_booking_status(booking_number: str, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.get_booking_status(booking_number)
 
 @router.get("/schedule/search", response_model=schemas.ScheduleResponse) # The mock returns a single object in example, but realistically list. Assuming object for now as per spec example
-async def search_schedule(origin: str, destination: str, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def search_schedule(origin: str, destination: str, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.search_schedule(origin, destination)
 
 @router.post("/rates/quote", response_model=schemas.RateResponse)
-async def get_rate_quote(request: schemas.RateRequest, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def get_rate_quote(request: schemas.RateRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.get_rate_quote(request)
 
+@router.post("/tariffs/upload", response_model=schemas.TariffIngestResponse)
+async def upload_tariff_sheet(file: UploadFile = File(...)):
+    """
+    Load a carrier tariff sheet (CSV, or Excel when openpyxl is installed) into the in-memory rate table.
+    Columns: origin, destination, containerType, carrier, rateUSD, currency (optional), validFrom, validTo.
+    The sheet replaces previously loaded tariffs of the carriers it contains; bad rows are reported, not fatal.
+    """
+    content = await file.read(MAX_TARIFF_UPLOAD_BYTES + 1)
+    if len(content) > MAX_TARIFF_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Tariff sheets are limited to {MAX_TARIFF_UPLOAD_BYTES // (1024 * 1024)} MB"
+        )
+    return await tariff_store.ingest(file.filename, content)
+
+@router.get("/tariffs/stats", response_model=schemas.TariffTableInfo)
+async def get_tariff_stats():
+    """
+    Size of the tariff table and how many rate quotes it has answered
+    """
+    return tariff_store.info()
+
+@router.post("/rates/compare")
+async def compare_carrier_rates(request: schemas.MultiCarrierRateRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    """
+    Fan a rate request out to all carriers and stream each CarrierRateResult as NDJSON as soon as it arrives
+    """
+    carrier_service = service.CarrierService(db, client)
+
+    async def ndjson():
+        async for result in carrier_service.stream_carrier_rates(request):
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
+@router.get("/lanes/rates", response_model=schemas.LaneRateStats)
+async def get_lane_rates(origin: str, destination: str, containerType: str):
+    """
+    Rolling p10/p50/p90 of quoted and booked rates for a lane, served from the in-memory lane index
+    """
+    stats = lane_rate_index.lookup(origin, destination, containerType)
+    if stats is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No rate history for this lane"
+        )
+    return stats
+
 @router.get("/tracking/container/{container_number}", response_model=schemas.ContainerTrackingResponse)
-async def track_container(container_number: str, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def track_container(container_number: str, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.track_container(container_number)
 
+@router.post("/tracking/containers/batch")
+async def track_containers_batch(request: schemas.BatchTrackingRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    """
+    Track up to 5000 containers at once, streaming each ContainerTrackingResult as NDJSON as it completes
+    """
+    carrier_service = service.CarrierService(db, client)
+
+    async def ndjson():
+        async for result in carrier_service.stream_container_tracking(request.containerNumbers, request.concurrency):
+            yield result.model_dump_json() + "\n"
+
+    return StreamingResponse(ndjson(), media_type="application/x-ndjson")
+
 @router.post("/ai/rates/predict", response_model=schemas.RatePredictionResponse)
-async def predict_rates(request: schemas.RatePredictionRequest, db: Session = Depends(get_db)):
-    carrier_service = service.CarrierService(db)
+async def predict_rates(request: schemas.RatePredictionRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    carrier_service = service.CarrierService(db, client)
     return await carrier_service.predict_rates(request)
+
+@router.post("/ai/rates/predict/batch", response_model=schemas.BatchRatePredictionResponse)
+async def predict_rates_batch(request: schemas.BatchRatePredictionRequest, db: AsyncSession = Depends(get_async_db), client: httpx.AsyncClient = Depends(get_carrier_client)):
+    """
+    Score up to 10,000 lanes in one call with the local rate model
+    """
+    carrier_service = service.CarrierService(db, client)
+    return carrier_service.predict_rates_batch(request)
+
+@router.post("/ai/rates/train", response_model=schemas.RateModelInfo)
+async def train_rate_model(db: AsyncSession = Depends(get_async_db)):
+    """
+    Retrain the local rate model from carrier bookings and accepted quotes, and persist it to disk
+    """
+    carrier_service = service.CarrierService(db)
+    return await carrier_service.train_rate_model()
+
+@router.get("/cache/stats", response_model=schemas.CacheStatsResponse)
+async def get_cache_stats():
+    return schemas.CacheStatsResponse(
+        schedules=service.schedule_cache.stats(),
+        rates=service.rate_cache.stats()
+    )
+
+@router.get("/upstream/health")
+async def get_upstream_health():
+    """
+    Circuit breaker state, retry budget and latency per carrier endpoint
+    """
+    return {
+        "resilience": service.carrier_resilience.snapshot(),
+        "singleflight": service.carrier_flights.stats()
+    }
+
+@router.delete("/cache", response_model=schemas.CacheInvalidationResponse)
+async def invalidate_cache(origin: Optional[str] = None, destination: Optional[str] = None):
+    """
+    Invalidate cached schedules and rate quotes for a lane (or all lanes)
+    """
+    removed = service.invalidate_lane(origin, destination)
+    return schemas.CacheInvalidationResponse(removed=removed)
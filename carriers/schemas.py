@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict, Any
 from datetime import date, datetime
 from uuid import UUID
 
@@ -45,6 +45,34 @@ class RateResponse(BaseModel):
     currency: str = Field(..., example="USD")
     validity: date = Field(..., example="2025-02-15")
 
+class MultiCarrierRateRequest(RateRequest):
+    carriers: Optional[List[str]] = Field(None, example=["MAERSK", "MSC"], description="Defaults to all configured carriers")
+    budgetSeconds: float = Field(8.0, gt=0, le=30, description="Overall latency budget for the comparison")
+    carrierTimeoutSeconds: float = Field(5.0, gt=0, le=30, description="Timeout for each carrier call")
+
+class CarrierRateResult(BaseModel):
+    carrier: str = Field(..., example="MSC")
+    status: str = Field(..., example="OK", description="OK, ERROR or TIMEOUT")
+    rate: Optional[RateResponse] = None
+    error: Optional[str] = None
+    elapsedMs: int = Field(..., example=412)
+
+# --- Lane Rate Index Schemas ---
+class RateWindowStats(BaseModel):
+    count: int = Field(..., example=340, description="Observations seen since startup rebuild")
+    windowSize: int = Field(..., example=340, description="Observations in the rolling window")
+    p10: Optional[float] = Field(None, example=1620)
+    p50: Optional[float] = Field(None, example=1850)
+    p90: Optional[float] = Field(None, example=2240)
+    lastUpdated: Optional[datetime] = None
+
+class LaneRateStats(BaseModel):
+    origin: str = Field(..., example="INMAA")
+    destination: str = Field(..., example="SGSIN")
+    containerType: str = Field(..., example="40HC")
+    quoted: RateWindowStats
+    booked: RateWindowStats
+
 # --- Tracking Schemas ---
 class ContainerTrackingResponse(BaseModel):
     containerNumber: str = Field(..., example="MSKU1234567")
@@ -53,6 +81,19 @@ class ContainerTrackingResponse(BaseModel):
     status: str = Field(..., example="IN_TRANSIT")
     lastUpdated: datetime = Field(..., example="2025-01-18T10:30:00Z")
 
+MAX_BATCH_CONTAINERS = 5000
+
+class BatchTrackingRequest(BaseModel):
+    containerNumbers: List[str] = Field(..., min_length=1, max_length=MAX_BATCH_CONTAINERS, example=["MSKU1234567", "MSCU7654321"])
+    concurrency: int = Field(20, ge=1, le=100, description="Maximum upstream lookups in flight at once")
+
+class ContainerTrackingResult(BaseModel):
+    containerNumber: str = Field(..., example="MSKU1234567")
+    status: str = Field(..., example="OK", description="OK or ERROR")
+    tracking: Optional[ContainerTrackingResponse] = None
+    error: Optional[str] = None
+    statusCode: Optional[int] = Field(None, example=404)
+
 class BLStatusResponse(BaseModel):
     blNumber: str = Field(..., example="BL987654")
     carrier: str = Field(..., example="ONE")
@@ -72,3 +113,56 @@ class RatePredictionResponse(BaseModel):
     trend: str = Field(..., example="UP")
     confidenceScore: float = Field(..., example=0.82)
     recommendation: str = Field(..., example="Book early before rates increase")
+
+class RatePredictionResult(RatePredictionResponse):
+    origin: str = Field(..., example="INMUN")
+    destination: str = Field(..., example="NLRTM")
+    carrier: str = Field(..., example="MAERSK")
+    containerType: str = Field(..., example="40HC")
+    source: str = Field(..., example="LANE", description="LANE when the lane has history, GLOBAL otherwise")
+    samples: int = Field(..., example=42)
+
+MAX_BATCH_PREDICTIONS = 10000
+
+class BatchRatePredictionRequest(BaseModel):
+    lanes: List[RatePredictionRequest] = Field(..., min_length=1, max_length=MAX_BATCH_PREDICTIONS)
+
+class BatchRatePredictionResponse(BaseModel):
+    modelTrainedAt: datetime
+    predictions: List[RatePredictionResult]
+
+class RateModelInfo(BaseModel):
+    trainedAt: datetime
+    lanes: int = Field(..., example=1200)
+    carriers: int = Field(..., example=5)
+    samples: int = Field(..., example=48000)
+
+# --- Tariff Schemas ---
+class TariffRejection(BaseModel):
+    row: int = Field(..., example=12, description="Data row in the sheet, 1-based, header excluded")
+    detail: str = Field(..., example="rateUSD must be positive")
+
+class TariffTableInfo(BaseModel):
+    rows: int = Field(..., example=48000)
+    lanes: int = Field(..., example=21000)
+    carriers: List[str] = Field(..., example=["MAERSK", "MSC"])
+    bytes: int = Field(..., example=1900000, description="Memory held by the table's arrays")
+    loadedAt: Optional[datetime] = None
+    hits: int = Field(..., example=950, description="Rate quotes answered from tariffs since startup")
+    misses: int = Field(..., example=50)
+
+class TariffIngestResponse(BaseModel):
+    received: int = Field(..., example=25000)
+    loaded: int = Field(..., example=24990)
+    rejected: int = Field(..., example=10)
+    rejections: List[TariffRejection] = Field(..., description="The first 100 rejected rows")
+    carriers: List[str] = Field(..., example=["MAERSK"], description="Carriers whose previous tariffs this sheet replaced")
+    table: TariffTableInfo
+
+# --- Cache Schemas ---
+class CacheStatsResponse(BaseModel):
+    schedules: Dict[str, Any]
+    rates: Dict[str, Any]
+
+class CacheInvalidationResponse(BaseModel):
+    removed: int = Field(..., example=12)
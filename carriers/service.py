@@ -1,18 +1,67 @@
+import asyncio
+import os
+import time
 import httpx
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException
+from typing import AsyncIterator, List, Optional
+from utils.cache import TTLCache
+from utils.http_client import UpstreamConfig, upstream_clients
+from utils.resilience import ResilientUpstream, UpstreamUnavailableError
+from utils.singleflight import SingleFlight
 from . import schemas, models
+from .prediction import rate_predictor
+from .tariffs import tariff_store
 
 CARRIER_API_URL = "https://virtserver.swaggerhub.com/demo/global-carrier-api/1.0.0"
+CARRIER_UPSTREAM = "carrier"
+CARRIERS = ["MAERSK", "MSC", "CMA_CGM", "HAPAG_LLOYD", "ONE"]
+# Ask the remote AI endpoint when the local model is missing or has no history for a lane
+RATE_PREDICTION_REMOTE_FALLBACK = os.getenv("RATE_PREDICTION_REMOTE_FALLBACK", "true").lower() == "true"
+
+upstream_clients.register(
+    CARRIER_UPSTREAM,
+    UpstreamConfig(base_url=CARRIER_API_URL, max_connections=100, max_keepalive_connections=50)
+)
+
+# Schedules and lane rates change a few times a day; serve repeats from memory
+schedule_cache = TTLCache("carrier_schedule", maxsize=2048, ttl=15 * 60, stale_ttl=60 * 60)
+rate_cache = TTLCache("carrier_rates", maxsize=4096, ttl=10 * 60, stale_ttl=30 * 60)
+
+# Concurrent lookups of the same booking/container share one upstream call
+carrier_flights = SingleFlight(CARRIER_UPSTREAM)
+
+# Per-endpoint circuit breakers, budgeted retries and hedging for carrier calls
+carrier_resilience = ResilientUpstream(CARRIER_UPSTREAM)
+
+def lane_key(origin: str, destination: str, container_type: Optional[str] = None):
+    """Normalized cache key for a lane (and container type, when relevant)"""
+    key = (origin.strip().upper(), destination.strip().upper())
+    if container_type is not None:
+        key += (container_type.strip().upper(),)
+    return key
+
+def invalidate_lane(origin: Optional[str] = None, destination: Optional[str] = None) -> int:
+    """Drop cached schedules and rates for a lane, or everything when no lane is given"""
+    if origin is None and destination is None:
+        return schedule_cache.invalidate() + rate_cache.invalidate()
+
+    def match(key):
+        return ((origin is None or key[0] == origin.strip().upper()) and
+                (destination is None or key[1] == destination.strip().upper()))
+
+    return schedule_cache.invalidate(match=match) + rate_cache.invalidate(match=match)
 
 class CarrierService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession, client: Optional[httpx.AsyncClient] = None):
         self.db = db
+        self.client = client or upstream_clients.get(CARRIER_UPSTREAM)
 
     async def create_booking(self, data: schemas.BookingRequest):
-        url = f"{CARRIER_API_URL}/booking/create"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data.model_dump())
+        url = "/booking/create"
+        response = await carrier_resilience.request(
+            self.client, "POST", url, endpoint="booking_create", idempotent=False, json=data.model_dump()
+        )
         
         if response.status_code != 201:
             raise HTTPException(status_code=response.status_code, detail="Booking failed")
@@ -33,51 +82,229 @@ class CarrierService:
             metadata_=result
         )
         self.db.add(booking)
-        self.db.commit()
-        self.db.refresh(booking)
+        await self.db.commit()
+        await self.db.refresh(booking)
         return result
 
     async def get_booking_status(self, booking_number: str):
-        url = f"{CARRIER_API_URL}/booking/status/{booking_number}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
+        return await carrier_flights.do(
+            ("booking_status", booking_number),
+            lambda: self._fetch_booking_status(booking_number)
+        )
+
+    async def _fetch_booking_status(self, booking_number: str):
+        url = f"/booking/status/{booking_number}"
+        response = await carrier_resilience.request(self.client, "GET", url, endpoint="booking_status", hedge=True)
         
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail="Failed to fetch booking status")
         return response.json()
 
     async def search_schedule(self, origin: str, destination: str):
-        url = f"{CARRIER_API_URL}/schedule/search"
+        return await schedule_cache.get_or_fetch(
+            lane_key(origin, destination),
+            lambda: self._fetch_schedule(origin, destination)
+        )
+
+    async def _fetch_schedule(self, origin: str, destination: str):
+        url = "/schedule/search"
         params = {"origin": origin, "destination": destination}
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url, params=params)
+        response = await carrier_resilience.request(self.client, "GET", url, endpoint="schedule_search", hedge=True, params=params)
         
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail="Failed to fetch schedules")
         return response.json()
 
     async def get_rate_quote(self, data: schemas.RateRequest):
-        url = f"{CARRIER_API_URL}/rates/quote"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data.model_dump())
+        # Ingested tariff sheets answer most lanes without an upstream call
+        tariff = tariff_store.lookup(data.origin, data.destination, data.containerType)
+        if tariff is not None:
+            return tariff
+        return await rate_cache.get_or_fetch(
+            lane_key(data.origin, data.destination, data.containerType),
+            lambda: self._fetch_rate_quote(data)
+        )
+
+    async def _fetch_rate_quote(self, data: schemas.RateRequest):
+        url = "/rates/quote"
+        response = await carrier_resilience.request(self.client, "POST", url, endpoint="rates_quote", json=data.model_dump())
         
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail="Failed to fetch rate quote")
         return response.json()
 
+    async def stream_carrier_rates(self, data: schemas.MultiCarrierRateRequest) -> AsyncIterator[schemas.CarrierRateResult]:
+        """
+        Query every requested carrier concurrently and yield each result as it
+        completes. Carriers still running when the budget runs out are
+        cancelled and reported as TIMEOUT.
+        """
+        carriers = [c.strip().upper() for c in (data.carriers or CARRIERS)]
+        rate_request = schemas.RateRequest(
+            origin=data.origin,
+            destination=data.destination,
+            containerType=data.containerType
+        )
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + data.budgetSeconds
+
+        tasks = {
+            asyncio.create_task(self._carrier_rate(carrier, rate_request, data.carrierTimeoutSeconds)): carrier
+            for carrier in dict.fromkeys(carriers)
+        }
+        pending = set(tasks)
+        try:
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+            for task in pending:
+                task.cancel()
+                yield schemas.CarrierRateResult(
+                    carrier=tasks[task],
+                    status="TIMEOUT",
+                    error="Comparison budget exceeded",
+                    elapsedMs=int((loop.time() - started) * 1000)
+                )
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _carrier_rate(self, carrier: str, data: schemas.RateRequest, timeout: float) -> schemas.CarrierRateResult:
+        started = time.perf_counter()
+        try:
+            result = tariff_store.lookup(data.origin, data.destination, data.containerType, carrier)
+            if result is None:
+                result = await rate_cache.get_or_fetch(
+                    lane_key(data.origin, data.destination, data.containerType) + (carrier,),
+                    lambda: self._fetch_carrier_rate(carrier, data, timeout)
+                )
+            return schemas.CarrierRateResult(
+                carrier=carrier,
+                status="OK",
+                rate=schemas.RateResponse(**result),
+                elapsedMs=int((time.perf_counter() - started) * 1000)
+            )
+        except UpstreamUnavailableError as e:
+            if e.status_code == 504:
+                status, error = "TIMEOUT", f"No response within {timeout:g}s"
+            else:
+                status, error = "ERROR", e.detail
+        except HTTPException as e:
+            status, error = "ERROR", e.detail
+        except Exception as e:
+            status, error = "ERROR", str(e)
+        return schemas.CarrierRateResult(
+            carrier=carrier,
+            status=status,
+            error=error,
+            elapsedMs=int((time.perf_counter() - started) * 1000)
+        )
+
+    async def _fetch_carrier_rate(self, carrier: str, data: schemas.RateRequest, timeout: float):
+        url = "/rates/quote"
+        # The timeout goes to httpx so the breaker sees it as a failure; no
+        # retries, since the carrier's whole allowance is this one call
+        response = await carrier_resilience.request(
+            self.client, "POST", url, endpoint=f"rates_quote:{carrier}", idempotent=False,
+            json={**data.model_dump(), "carrier": carrier}, timeout=httpx.Timeout(timeout)
+        )
+        
+        if response.status_code != 200:
+             raise HTTPException(status_code=response.status_code, detail=f"Failed to fetch rate quote from {carrier}")
+        return response.json()
+
     async def track_container(self, container_number: str):
-        url = f"{CARRIER_API_URL}/tracking/container/{container_number}"
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)
+        return await carrier_flights.do(
+            ("track_container", container_number.strip().upper()),
+            lambda: self._fetch_container_tracking(container_number)
+        )
+
+    async def _fetch_container_tracking(self, container_number: str):
+        url = f"/tracking/container/{container_number}"
+        response = await carrier_resilience.request(self.client, "GET", url, endpoint="track_container", hedge=True)
         
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail="Failed to track container")
         return response.json()
 
+    async def stream_container_tracking(self, container_numbers: List[str], concurrency: int) -> AsyncIterator[schemas.ContainerTrackingResult]:
+        """
+        Track many containers with at most `concurrency` upstream lookups in
+        flight, yielding each result as it completes. Duplicates are collapsed
+        and failures are reported per container instead of failing the batch.
+        """
+        unique = list(dict.fromkeys(c.strip().upper() for c in container_numbers if c.strip()))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def lookup(container_number: str) -> schemas.ContainerTrackingResult:
+            async with semaphore:
+                try:
+                    result = await self.track_container(container_number)
+                    return schemas.ContainerTrackingResult(
+                        containerNumber=container_number,
+                        status="OK",
+                        tracking=schemas.ContainerTrackingResponse(**result)
+                    )
+                except HTTPException as e:
+                    return schemas.ContainerTrackingResult(
+                        containerNumber=container_number,
+                        status="ERROR",
+                        error=e.detail,
+                        statusCode=e.status_code
+                    )
+                except Exception as e:
+                    return schemas.ContainerTrackingResult(
+                        containerNumber=container_number,
+                        status="ERROR",
+                        error=str(e)
+                    )
+
+        tasks = [asyncio.create_task(lookup(c)) for c in unique]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
     async def predict_rates(self, data: schemas.RatePredictionRequest):
-        url = f"{CARRIER_API_URL}/ai/rates/predict"
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=data.model_dump())
+        if rate_predictor.model is not None:
+            prediction = rate_predictor.predict([data])[0]
+            if prediction.source == "LANE" or not RATE_PREDICTION_REMOTE_FALLBACK:
+                return prediction
+        elif not RATE_PREDICTION_REMOTE_FALLBACK:
+            raise HTTPException(status_code=503, detail="Rate prediction model is not loaded")
+        return await self._fetch_rate_prediction(data)
+
+    def predict_rates_batch(self, data: schemas.BatchRatePredictionRequest) -> schemas.BatchRatePredictionResponse:
+        if rate_predictor.model is None:
+            raise HTTPException(status_code=503, detail="Rate prediction model is not loaded")
+        return schemas.BatchRatePredictionResponse(
+            modelTrainedAt=rate_predictor.model.trained_at_datetime,
+            predictions=rate_predictor.predict(data.lanes)
+        )
+
+    async def train_rate_model(self) -> schemas.RateModelInfo:
+        try:
+            model = await rate_predictor.train(self.db)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return schemas.RateModelInfo(
+            trainedAt=model.trained_at_datetime,
+            lanes=len(model.lane_index),
+            carriers=len(model.carrier_index),
+            samples=int(model.count.sum())
+        )
+
+    async def _fetch_rate_prediction(self, data: schemas.RatePredictionRequest):
+        url = "/ai/rates/predict"
+        response = await carrier_resilience.request(self.client, "POST", url, endpoint="rates_predict", json=data.model_dump())
         
         if response.status_code != 200:
              raise HTTPException(status_code=response.status_code, detail="Failed to predict rates")
@@ -0,0 +1,485 @@
+import asyncio
+import contextlib
+import csv
+import importlib.util
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+
+from . import schemas
+from .prediction import normalize_code
+
+try:
+    import fcntl
+except ImportError:  # Windows: ingests are then only serialized within a worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Shared by all workers: each serves its own in-memory copy and reloads it
+# when the file's mtime changes, checked at most every TARIFF_RELOAD_CHECK_SECONDS,
+# so an ingest on one worker reaches the others within that delay
+TARIFF_TABLE_PATH = os.getenv("TARIFF_TABLE_PATH", os.path.join("models", "tariffs.npz"))
+TARIFF_RELOAD_CHECK_SECONDS = 5.0
+# Excel tariffs need the optional `openpyxl` package; CSV always works
+EXCEL_AVAILABLE = importlib.util.find_spec("openpyxl") is not None
+MAX_TARIFF_ROWS = 500_000
+# Largest sheet read into memory; MAX_TARIFF_ROWS rows of CSV fit comfortably
+MAX_TARIFF_UPLOAD_BYTES = 50 * 1024 * 1024
+# Rejected rows listed in an ingest response; the count covers all of them
+MAX_REPORTED_REJECTIONS = 100
+
+EPOCH = date(1970, 1, 1)
+
+# Sheet headers are matched case- and punctuation-insensitively, with common carrier spellings
+HEADER_ALIASES = {
+    "origin": "origin", "pol": "origin", "originport": "origin",
+    "destination": "destination", "pod": "destination", "destinationport": "destination",
+    "containertype": "containerType", "container": "containerType", "equipment": "containerType",
+    "carrier": "carrier", "scac": "carrier",
+    "rateusd": "rateUSD", "rate": "rateUSD", "amount": "rateUSD",
+    "currency": "currency",
+    "validfrom": "validFrom", "effectivefrom": "validFrom", "effective": "validFrom",
+    "validto": "validTo", "validuntil": "validTo", "expiry": "validTo", "expires": "validTo",
+}
+REQUIRED_COLUMNS = ("origin", "destination", "containerType", "carrier", "rateUSD", "validFrom", "validTo")
+
+# (origin, destination, container_type, carrier, rate, currency, valid_from, valid_to)
+TariffRow = Tuple[str, str, str, str, float, str, date, date]
+
+
+def _day(value: date) -> int:
+    return (value - EPOCH).days
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+
+class TariffTable:
+    """
+    Immutable, array-backed tariff table.
+
+    Each column is a NumPy array and port/container/carrier/currency codes are
+    stored as small integers into sorted vocabularies, so tens of thousands
+    of lanes take a few MB. Rows are sorted by a packed lane key, and a batch
+    of lookups is a couple of `searchsorted` calls plus masked gathers.
+    """
+
+    def __init__(self, ports: np.ndarray, container_types: np.ndarray, carriers: np.ndarray, currencies: np.ndarray,
+                 origin: np.ndarray, destination: np.ndarray, container: np.ndarray, carrier: np.ndarray,
+                 currency: np.ndarray, rate: np.ndarray, valid_from: np.ndarray, valid_to: np.ndarray,
+                 loaded_at: float):
+        self.ports = ports
+        self.container_types = container_types
+        self.carriers = carriers
+        self.currencies = currencies
+        self.origin = origin
+        self.destination = destination
+        self.container = container
+        self.carrier = carrier
+        self.currency = currency
+        self.rate = rate
+        self.valid_from = valid_from
+        self.valid_to = valid_to
+        self.loaded_at = float(loaded_at)
+        self.lane = self._lane_key(origin, destination, container)
+        self.port_index: Dict[str, int] = {p: i for i, p in enumerate(ports.tolist())}
+        self.container_index: Dict[str, int] = {c: i for i, c in enumerate(container_types.tolist())}
+        self.carrier_index: Dict[str, int] = {c: i for i, c in enumerate(carriers.tolist())}
+
+    def _lane_key(self, origin: np.ndarray, destination: np.ndarray, container: np.ndarray) -> np.ndarray:
+        return (origin.astype(np.int64) * len(self.ports) + destination) * len(self.container_types) + container
+
+    @classmethod
+    def from_columns(cls, origins: np.ndarray, destinations: np.ndarray, container_types: np.ndarray,
+                     carriers: np.ndarray, currencies: np.ndarray, rates: np.ndarray,
+                     valid_from: np.ndarray, valid_to: np.ndarray) -> "TariffTable":
+        n = len(origins)
+        ports, port_inv = np.unique(np.concatenate([origins, destinations]), return_inverse=True)
+        container_vocab, container = np.unique(container_types, return_inverse=True)
+        carrier_vocab, carrier = np.unique(carriers, return_inverse=True)
+        currency_vocab, currency = np.unique(currencies, return_inverse=True)
+        origin, destination = port_inv[:n], port_inv[n:]
+
+        lane = (origin.astype(np.int64) * len(ports) + destination) * len(container_vocab) + container
+        order = np.lexsort((valid_from, lane))
+        return cls(
+            ports=ports,
+            container_types=container_vocab,
+            carriers=carrier_vocab,
+            currencies=currency_vocab,
+            origin=origin[order].astype(np.int32),
+            destination=destination[order].astype(np.int32),
+            container=container[order].astype(np.int32),
+            carrier=carrier[order].astype(np.int32),
+            currency=currency[order].astype(np.int32),
+            rate=np.asarray(rates, dtype=np.float64)[order],
+            valid_from=np.asarray(valid_from, dtype=np.int32)[order],
+            valid_to=np.asarray(valid_to, dtype=np.int32)[order],
+            loaded_at=datetime.now(timezone.utc).timestamp(),
+        )
+
+    def columns(self) -> Tuple[np.ndarray, ...]:
+        """Decoded columns, in from_columns() order"""
+        return (
+            self.ports[self.origin], self.ports[self.destination], self.container_types[self.container],
+            self.carriers[self.carrier], self.currencies[self.currency], self.rate, self.valid_from, self.valid_to,
+        )
+
+    def merged(self, rows: Sequence[TariffRow], today: int) -> "TariffTable":
+        """
+        A new table with `rows` added. A sheet replaces everything previously
+        loaded for the carriers it contains, and expired rows are dropped.
+        """
+        replaced = {row[3] for row in rows}
+        keep = (self.valid_to >= today) & ~np.isin(self.carriers[self.carrier], list(replaced))
+        new = _row_columns(rows)
+        return TariffTable.from_columns(*(
+            np.concatenate([old[keep], fresh]) for old, fresh in zip(self.columns(), new)
+        ))
+
+    def lookup_many(self, origins: Sequence[str], destinations: Sequence[str], container_types: Sequence[str],
+                    carriers: Optional[Sequence[Optional[str]]], day: int) -> np.ndarray:
+        """
+        Row of the cheapest tariff valid on `day` for each request (-1 on a
+        miss). A carrier of None matches any carrier.
+        """
+        n = len(origins)
+        origin = np.fromiter((self.port_index.get(normalize_code(v), -1) for v in origins), dtype=np.int64, count=n)
+        destination = np.fromiter((self.port_index.get(normalize_code(v), -1) for v in destinations), dtype=np.int64, count=n)
+        container = np.fromiter((self.container_index.get(normalize_code(v), -1) for v in container_types), dtype=np.int64, count=n)
+        if carriers is None:
+            carrier = np.full(n, -1, dtype=np.int64)
+        else:
+            # -1 = any carrier, -2 = a carrier with no tariffs
+            carrier = np.fromiter(
+                (-1 if v is None else self.carrier_index.get(normalize_code(v), -2) for v in carriers),
+                dtype=np.int64, count=n
+            )
+
+        result = np.full(n, -1, dtype=np.int64)
+        known = (origin >= 0) & (destination >= 0) & (container >= 0) & (carrier != -2)
+        keys = np.where(known, self._lane_key(origin, destination, container), -1)
+        lo = np.searchsorted(self.lane, keys, side="left")
+        counts = np.where(known, np.searchsorted(self.lane, keys, side="right") - lo, 0)
+        if not counts.any():
+            return result
+
+        # Expand every request into its lane's candidate rows
+        request = np.repeat(np.arange(n), counts)
+        rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts - lo, counts)
+        ok = (self.valid_from[rows] <= day) & (self.valid_to[rows] >= day)
+        wanted = carrier[request]
+        ok &= (wanted < 0) | (self.carrier[rows] == wanted)
+        request, rows = request[ok], rows[ok]
+        if not len(rows):
+            return result
+
+        # Cheapest candidate per request
+        order = np.lexsort((self.rate[rows], request))
+        request, rows = request[order], rows[order]
+        first = np.flatnonzero(np.r_[True, request[1:] != request[:-1]])
+        result[request[first]] = rows[first]
+        return result
+
+    def rate_response(self, row: int) -> dict:
+        """A row shaped like the carrier API's rate quote"""
+        return {
+            "carrier": str(self.carriers[self.carrier[row]]),
+            "containerType": str(self.container_types[self.container[row]]),
+            "rateUSD": float(self.rate[row]),
+            "currency": str(self.currencies[self.currency[row]]),
+            "validity": (EPOCH + timedelta(days=int(self.valid_to[row]))).isoformat(),
+        }
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in (
+            self.ports, self.container_types, self.carriers, self.currencies, self.origin, self.destination,
+            self.container, self.carrier, self.currency, self.rate, self.valid_from, self.valid_to, self.lane,
+        ))
+
+    def save(self, path: str) -> None:
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Write under a unique temporary name, synced before the rename, so other
+        # workers never load a partial file and concurrent saves don't collide
+        f = tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp", delete=False)
+        try:
+            with f:
+                self._savez(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f.name, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(f.name)
+            raise
+
+    def _savez(self, f) -> None:
+        np.savez_compressed(
+            f,
+            ports=self.ports,
+            container_types=self.container_types,
+            carriers=self.carriers,
+            currencies=self.currencies,
+            origin=self.origin,
+            destination=self.destination,
+            container=self.container,
+            carrier=self.carrier,
+            currency=self.currency,
+            rate=self.rate,
+            valid_from=self.valid_from,
+            valid_to=self.valid_to,
+            loaded_at=np.array(self.loaded_at),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "TariffTable":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(**{name: data[name] for name in data.files if name != "loaded_at"},
+                       loaded_at=float(data["loaded_at"]))
+
+
+def _row_columns(rows: Sequence[TariffRow]) -> Tuple[np.ndarray, ...]:
+    origins, destinations, container_types, carriers, rates, currencies, valid_from, valid_to = zip(*rows)
+    return (
+        np.array(origins), np.array(destinations), np.array(container_types), np.array(carriers),
+        np.array(currencies), np.array(rates, dtype=np.float64),
+        np.array([_day(d) for d in valid_from], dtype=np.int32),
+        np.array([_day(d) for d in valid_to], dtype=np.int32),
+    )
+
+
+def _read_csv(content: bytes) -> Iterator[Sequence]:
+    try:
+        text = content.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV tariffs must be UTF-8 encoded")
+    return csv.reader(io.StringIO(text))
+
+
+def _read_excel(content: bytes) -> Iterator[Sequence]:
+    if not EXCEL_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Excel tariffs need the openpyxl package; upload the sheet as CSV instead"
+        )
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(io.BytesIO(content), read_only=True, data_only=True)
+    return workbook.worksheets[0].iter_rows(values_only=True)
+
+
+def parse_tariff_sheet(filename: str, content: bytes) -> Tuple[List[TariffRow], List[schemas.TariffRejection], int]:
+    """
+    Parse a CSV or Excel (first worksheet) tariff with a header row. Returns
+    the valid rows, the rejections and the number of data rows read.
+    """
+    is_excel = (filename or "").lower().endswith((".xlsx", ".xlsm"))
+    sheet = iter(_read_excel(content) if is_excel else _read_csv(content))
+
+    header = next(sheet, None) or []
+    columns = {
+        HEADER_ALIASES[key]: i
+        for i, key in ((i, re.sub(r"[^a-z]", "", str(name or "").lower())) for i, name in enumerate(header))
+        if key in HEADER_ALIASES
+    }
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Tariff sheet is missing columns: {', '.join(missing)}"
+        )
+
+    rows: List[TariffRow] = []
+    rejected: List[schemas.TariffRejection] = []
+    received = 0
+    for number, values in enumerate(sheet, start=1):
+        if not any(value not in (None, "") for value in values):
+            continue
+        received += 1
+        if received > MAX_TARIFF_ROWS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {MAX_TARIFF_ROWS} tariff rows per sheet"
+            )
+        cell = {name: values[i] if i < len(values) else None for name, i in columns.items()}
+        try:
+            origin, destination, container_type, carrier = (
+                normalize_code(str(cell[name] or "")) for name in ("origin", "destination", "containerType", "carrier")
+            )
+            if not (origin and destination and container_type and carrier):
+                raise ValueError("origin, destination, containerType and carrier are required")
+            raw_rate = cell["rateUSD"]
+            rate = float(raw_rate) if isinstance(raw_rate, (int, float)) else float(str(raw_rate).replace(",", ""))
+            if not rate > 0:
+                raise ValueError("rateUSD must be positive")
+            valid_from, valid_to = _as_date(cell["validFrom"]), _as_date(cell["validTo"])
+            if valid_to < valid_from:
+                raise ValueError("validTo is before validFrom")
+            currency = normalize_code(str(cell.get("currency") or "")) or "USD"
+            if currency != "USD":
+                # Rates are compared across carriers as USD; convert before uploading
+                raise ValueError(f"currency must be USD, got {currency}")
+        except (TypeError, ValueError) as e:
+            rejected.append(schemas.TariffRejection(row=number, detail=str(e)))
+            continue
+        rows.append((origin, destination, container_type, carrier, rate, currency, valid_from, valid_to))
+    return rows, rejected, received
+
+
+class TariffStore:
+    """Holds the active tariff table; loaded from disk at startup, replaced on each ingest"""
+
+    def __init__(self, path: str = TARIFF_TABLE_PATH):
+        self.path = path
+        self.table: Optional[TariffTable] = None
+        self._ingest_lock = asyncio.Lock()
+        self._mtime: Optional[int] = None
+        self._checked_at = 0.0
+        self._reload: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> bool:
+        loaded = self._read()
+        if loaded is None:
+            return False
+        self.table, self._mtime = loaded
+        return True
+
+    def _read(self) -> Optional[Tuple[TariffTable, int]]:
+        """The saved table and the mtime it was read at, or None without a file"""
+        if not os.path.exists(self.path):
+            return None
+        # Stat first: a save landing in between then just triggers another reload
+        mtime = os.stat(self.path).st_mtime_ns
+        return TariffTable.load(self.path), mtime
+
+    @contextlib.contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Exclusive across workers, via flock on a sidecar lock file"""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path + ".lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge_and_save(self, rows: Sequence[TariffRow]) -> Tuple[TariffTable, int]:
+        """
+        Merge `rows` into the latest saved table and save the result. Reload,
+        merge and save all happen under the file lock, so concurrent uploads on
+        any worker can't drop each other's carriers.
+        """
+        today = _day(datetime.now(timezone.utc).date())
+        with self._file_lock():
+            current = self.table
+            if os.path.exists(self.path) and os.stat(self.path).st_mtime_ns != self._mtime:
+                current = TariffTable.load(self.path)
+            if current is None:
+                table = TariffTable.from_columns(*_row_columns(rows))
+            else:
+                table = current.merged(rows, today)
+            table.save(self.path)
+            return table, os.stat(self.path).st_mtime_ns
+
+    def _current(self) -> Optional[TariffTable]:
+        """
+        The active table. When another worker has saved a newer file it is
+        reloaded off the event loop, and the current table is served meanwhile
+        """
+        now = time.monotonic()
+        if self._reload is None and now - self._checked_at >= TARIFF_RELOAD_CHECK_SECONDS:
+            self._checked_at = now
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                return self.table
+            if mtime != self._mtime:
+                try:
+                    loop = asyncio.get_running_loop()
+                except RuntimeError:
+                    # No event loop to block (CLI, scripts)
+                    self.load()
+                else:
+                    self._reload = loop.create_task(self._reload_in_background(self._mtime))
+        return self.table
+
+    async def _reload_in_background(self, seen_mtime: Optional[int]) -> None:
+        try:
+            loaded = await asyncio.to_thread(self._read)
+            # An ingest on this worker may have swapped in a newer table meanwhile
+            if loaded is not None and self._mtime == seen_mtime:
+                self.table, self._mtime = loaded
+        except Exception:
+            logger.exception("Failed to reload the tariff table from %s", self.path)
+        finally:
+            self._reload = None
+
+    async def ingest(self, filename: str, content: bytes) -> schemas.TariffIngestResponse:
+        rows, rejected, received = await asyncio.to_thread(parse_tariff_sheet, filename, content)
+        if rows:
+            # The asyncio lock queues this worker's ingests; the file lock covers the others
+            async with self._ingest_lock:
+                table, mtime = await asyncio.to_thread(self._merge_and_save, rows)
+                # Readers keep whichever table they already hold; the swap is a single assignment
+                self.table = table
+                self._mtime = mtime
+
+        return schemas.TariffIngestResponse(
+            received=received,
+            loaded=len(rows),
+            rejected=len(rejected),
+            rejections=rejected[:MAX_REPORTED_REJECTIONS],
+            carriers=sorted({row[3] for row in rows}),
+            table=self.info()
+        )
+
+    def lookup(self, origin: str, destination: str, container_type: str, carrier: Optional[str] = None) -> Optional[dict]:
+        """Cheapest tariff valid today for one lane, as a rate quote dict"""
+        table = self._current()
+        if table is None:
+            return None
+        today = _day(datetime.now(timezone.utc).date())
+        row = int(table.lookup_many([origin], [destination], [container_type], None if carrier is None else [carrier], today)[0])
+        if row < 0:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return table.rate_response(row)
+
+    def info(self) -> schemas.TariffTableInfo:
+        table = self._current()
+        if table is None:
+            return schemas.TariffTableInfo(rows=0, lanes=0, carriers=[], bytes=0, hits=self.hits, misses=self.misses)
+        return schemas.TariffTableInfo(
+            rows=len(table.rate),
+            lanes=len(np.unique(table.lane)),
+            carriers=table.carriers.tolist(),
+            bytes=table.nbytes,
+            loadedAt=datetime.fromtimestamp(table.loaded_at, tz=timezone.utc),
+            hits=self.hits,
+            misses=self.misses
+        )
+
+
+tariff_store = TariffStore()
@@ -1,11 +1,30 @@
-from sqlalchemy import Column, String, ForeignKey, Enum, DateTime, func
+from sqlalchemy import Column, String, Text, Integer, BigInteger, SmallInteger, Boolean, Float, ForeignKey, Enum, DateTime, Index, func, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.orm import relationship
 import uuid
 from database import Base
 
+# ICEGATE statuses that can still change and therefore need polling
+NON_TERMINAL_STATUSES = ("SUBMITTED", "PENDING")
+
 class CustomsEntry(Base):
     __tablename__ = "customs_entries"
+    __table_args__ = (
+        # Latest filing per (shipment, type): DISTINCT ON walks this index in order.
+        # It also serves plain shipment_id lookups, so that column needs no index of its own
+        Index(
+            "ix_customs_entries_shipment_type_created",
+            "shipment_id",
+            "entry_type",
+            text("created_at DESC")
+        ),
+        # Poller scan: due, non-terminal entries only
+        Index(
+            "ix_customs_entries_poll_due",
+            "next_poll_at",
+            postgresql_where=text("status IN ('SUBMITTED', 'PENDING')")
+        ),
+    )
 
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), nullable=False)
@@ -18,6 +37,16 @@ class CustomsEntry(Base):
     
     # Status (SUBMITTED, CLEARED, PENDING, REJECTED)
     status = Column(String(50), default="SUBMITTED")
+    status_reason = Column(Text, nullable=True)
+    # When the entry cleared: ICEGATE's own timestamp when it reports one,
+    # else the poll that first saw CLEARED. The delay model's training label
+    cleared_at = Column(DateTime(timezone=True), nullable=True)
+    
+    # Background poller bookkeeping: when ICEGATE was last asked, when to ask
+    # next, and the current (adaptive) gap between polls
+    status_checked_at = Column(DateTime(timezone=True), nullable=True)
+    next_poll_at = Column(DateTime(timezone=True), server_default=func.now())
+    poll_interval_seconds = Column(Integer, nullable=True)
     
     # ID of the submitted document (invoice/bill) linked to this entry
     document_id = Column(UUID(as_uuid=True), ForeignKey("documents.id"), nullable=True)
@@ -31,3 +60,24 @@ class CustomsEntry(Base):
     # Relationships
     shipment = relationship("Shipment", backref="customs_entries")
     # document = relationship("Document") # Uncomment if Document model is available/imported
+
+class CustomsDelayPrediction(Base):
+    """Append-only log of delay predictions; also the feature source for retraining"""
+    __tablename__ = "customs_delay_predictions"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), nullable=True, index=True)
+
+    # Features as scored (port normalized, duty bucketed)
+    port = Column(String(50), nullable=False)
+    rms_examination = Column(Boolean, nullable=False)
+    duty_amount = Column(Float, nullable=False)
+    documents_complete = Column(Boolean, nullable=False)
+
+    predicted_delay_days = Column(SmallInteger, nullable=False)
+    delay_risk = Column(String(10), nullable=False)
+    confidence = Column(Float, nullable=False)
+    # PORT / GLOBAL for the local model, REMOTE for the ICEGATE AI endpoint
+    source = Column(String(10), nullable=False)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
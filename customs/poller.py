@@ -0,0 +1,148 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from utils.background import BackgroundWorker
+from .models import CustomsEntry, NON_TERMINAL_STATUSES
+from .service import CustomsService
+
+# Entries claimed per cycle, and ICEGATE calls in flight while refreshing them
+POLL_BATCH_SIZE = 200
+POLL_CONCURRENCY = 10
+# How long a claim keeps other workers off an entry while its ICEGATE call runs
+POLL_CLAIM_SECONDS = 5 * 60
+# Adaptive polling: reset to the minimum on change, double while unchanged
+MIN_POLL_INTERVAL = 5 * 60
+MAX_POLL_INTERVAL = 6 * 60 * 60
+# Sleep when there is no backlog of due entries
+IDLE_SLEEP = 30.0
+
+
+def next_poll_interval(current: Optional[int], changed: bool) -> int:
+    if changed or not current:
+        return MIN_POLL_INTERVAL
+    return min(current * 2, MAX_POLL_INTERVAL)
+
+
+def _reported_clearance_time(status: dict, entry_type: str) -> Optional[datetime]:
+    """ICEGATE's clearance time (exportClearedAt / importClearedAt), when the payload carries one"""
+    value = status.get("exportClearedAt" if entry_type == "EXPORT" else "importClearedAt")
+    if not value:
+        return None
+    try:
+        cleared_at = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return cleared_at if cleared_at.tzinfo else cleared_at.replace(tzinfo=timezone.utc)
+
+
+def apply_clearance_status(entry: CustomsEntry, status: Optional[dict], now: datetime) -> bool:
+    """Update an entry from an ICEGATE status payload; returns True if its status changed"""
+    changed = False
+    if status is not None:
+        key = "exportStatus" if entry.entry_type == "EXPORT" else "importStatus"
+        new_status = (status.get(key) or "").upper()
+        if new_status and new_status != entry.status:
+            entry.status = new_status
+            changed = True
+            if new_status == "CLEARED":
+                entry.cleared_at = _reported_clearance_time(status, entry.entry_type) or now
+        entry.status_reason = status.get("reason")
+        entry.status_checked_at = now
+    # ICEGATE failures (status None) back off like an unchanged poll
+    entry.poll_interval_seconds = next_poll_interval(entry.poll_interval_seconds, changed)
+    entry.next_poll_at = now + timedelta(seconds=entry.poll_interval_seconds)
+    return changed
+
+
+class ClearanceStatusPoller(BackgroundWorker):
+    """
+    Refreshes SUBMITTED/PENDING customs entries from ICEGATE in batches so the
+    clearance-status endpoint can answer from the DB. Terminal entries are
+    never polled again; quiet ones are polled less and less often.
+    """
+
+    name = "customs-clearance-poller"
+
+    def __init__(self):
+        super().__init__()
+        self.last_run_at: Optional[datetime] = None
+        self.entries_polled = 0
+        self.entries_changed = 0
+        self.upstream_errors = 0
+
+    async def run_once(self) -> float:
+        async with AsyncSessionLocal() as db:
+            polled = await self.poll_batch(db)
+        # A full batch means there is a backlog; keep going straight away
+        return 0 if polled >= POLL_BATCH_SIZE else IDLE_SLEEP
+
+    async def poll_batch(self, db: AsyncSession) -> int:
+        """
+        Claim due entries by pushing next_poll_at out by POLL_CLAIM_SECONDS and
+        committing, call ICEGATE with no transaction open, then apply the
+        results in a second short transaction. Entries claimed by a worker
+        that dies come due again once the claim lapses.
+        """
+        now = datetime.now(timezone.utc)
+        due = select(CustomsEntry.id).filter(
+            CustomsEntry.status.in_(NON_TERMINAL_STATUSES),
+            CustomsEntry.next_poll_at <= now
+        ).order_by(CustomsEntry.next_poll_at).limit(POLL_BATCH_SIZE).with_for_update(skip_locked=True)
+        result = await db.execute(
+            update(CustomsEntry).where(CustomsEntry.id.in_(due)).values(
+                next_poll_at=now + timedelta(seconds=POLL_CLAIM_SECONDS)
+            ).returning(CustomsEntry.id, CustomsEntry.shipment_id).execution_options(synchronize_session=False)
+        )
+        claimed = result.all()
+        await db.commit()
+        if not claimed:
+            return 0
+
+        # ICEGATE reports per shipment, so one call covers its EXPORT and IMPORT entries
+        shipment_ids = {str(shipment_id) for _, shipment_id in claimed}
+        customs_service = CustomsService(db)
+        semaphore = asyncio.Semaphore(POLL_CONCURRENCY)
+
+        async def fetch(shipment_id: str):
+            async with semaphore:
+                try:
+                    return shipment_id, await customs_service.fetch_clearance_status(shipment_id)
+                except HTTPException:
+                    self.upstream_errors += 1
+                    return shipment_id, None
+
+        statuses = dict(await asyncio.gather(*(fetch(shipment_id) for shipment_id in shipment_ids)))
+
+        checked_at = datetime.now(timezone.utc)
+        result = await db.execute(
+            select(CustomsEntry).filter(
+                CustomsEntry.id.in_([entry_id for entry_id, _ in claimed]),
+                CustomsEntry.status.in_(NON_TERMINAL_STATUSES)
+            ).with_for_update()
+        )
+        for entry in result.scalars():
+            if apply_clearance_status(entry, statuses[str(entry.shipment_id)], checked_at):
+                self.entries_changed += 1
+        await db.commit()
+
+        self.entries_polled += len(claimed)
+        self.last_run_at = now
+        return len(claimed)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "last_run_at": self.last_run_at,
+            "entries_polled": self.entries_polled,
+            "entries_changed": self.entries_changed,
+            "upstream_errors": self.upstream_errors,
+        }
+
+
+clearance_poller = ClearanceStatusPoller()
@@ -0,0 +1,359 @@
+import asyncio
+import os
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import schemas
+
+DELAY_MODEL_PATH = os.getenv("DELAY_MODEL_PATH", os.path.join("models", "delay_model.npz"))
+
+# Duty amounts are bucketed to this many INR before scoring, so the memo key is exact
+DUTY_ROUNDING = 1000.0
+# Duty is scaled before the log so coefficients stay in "days" units
+DUTY_SCALE = 10000.0
+# Observations at which a port's own offset is trusted 50/50 against the global fit
+PORT_PRIOR = 10.0
+# Training is refused below this many cleared filings; the defaults stay in use
+MIN_TRAINING_SAMPLES = 50
+# Predicted days at or below which the risk is LOW / MEDIUM; above is HIGH
+LOW_RISK_DAYS = 1
+MEDIUM_RISK_DAYS = 3
+# Duty at or above which "High duty amount" is reported as a reason
+HIGH_DUTY_AMOUNT = 500000.0
+# Port offset (days) above which the port is reported as congested
+CONGESTION_DAYS = 0.5
+# Feature tuples remembered between model changes
+MEMO_SIZE = 20000
+
+# intercept, RMS examination, log duty, documents missing (days)
+DEFAULT_COEFFICIENTS = np.array([1.0, 2.0, 0.15, 1.5])
+DEFAULT_SPREAD = 1.5
+
+# (port, rms_examination, duty_amount, documents_complete)
+DelayFeatures = Tuple[str, bool, float, bool]
+# features + observed clearance days
+DelaySample = Tuple[str, bool, float, bool, float]
+
+
+def normalize_port(value: Optional[str]) -> str:
+    return (value or "").strip().upper()
+
+
+def delay_features(request: schemas.DelayPredictionRequest) -> DelayFeatures:
+    """Canonical feature tuple for a request; used as the memo key"""
+    return (
+        normalize_port(request.port),
+        bool(request.rmsExamination),
+        round(max(request.dutyAmount, 0.0) / DUTY_ROUNDING) * DUTY_ROUNDING,
+        bool(request.documentsComplete),
+    )
+
+
+def _design_matrix(rms: np.ndarray, duty: np.ndarray, docs_complete: np.ndarray) -> np.ndarray:
+    return np.column_stack([
+        np.ones(len(rms)),
+        rms.astype(np.float64),
+        np.log1p(duty / DUTY_SCALE),
+        (~docs_complete).astype(np.float64),
+    ])
+
+
+class DelayPredictionModel:
+    """
+    Linear clearance-delay model in days with a shrunk offset per port.
+
+    Until there is enough outcome history the hand-set default coefficients
+    are used and every port scores as GLOBAL. Scoring is a few NumPy ops over
+    the whole batch.
+    """
+
+    def __init__(self, coefficients: np.ndarray, ports: np.ndarray, port_offset: np.ndarray,
+                 port_count: np.ndarray, spread: float, samples: int, trained_at: Optional[float]):
+        self.coefficients = coefficients
+        self.ports = ports
+        self.port_offset = port_offset
+        self.port_count = port_count
+        self.spread = float(spread)
+        self.samples = int(samples)
+        self.trained_at = trained_at
+        self.port_index: Dict[str, int] = {p: i for i, p in enumerate(ports.tolist())}
+
+    @property
+    def trained_at_datetime(self) -> Optional[datetime]:
+        if self.trained_at is None:
+            return None
+        return datetime.fromtimestamp(self.trained_at, tz=timezone.utc)
+
+    @classmethod
+    def default(cls) -> "DelayPredictionModel":
+        return cls(
+            coefficients=DEFAULT_COEFFICIENTS.copy(),
+            ports=np.array([], dtype=str),
+            port_offset=np.zeros(0),
+            port_count=np.zeros(0),
+            spread=DEFAULT_SPREAD,
+            samples=0,
+            trained_at=None,
+        )
+
+    @classmethod
+    def fit(cls, samples: Sequence[DelaySample]) -> "DelayPredictionModel":
+        if len(samples) < MIN_TRAINING_SAMPLES:
+            raise ValueError(f"Need at least {MIN_TRAINING_SAMPLES} cleared filings with logged features, have {len(samples)}")
+
+        ports, rms, duty, docs_complete, days = zip(*samples)
+        x = _design_matrix(np.asarray(rms, dtype=bool), np.asarray(duty, dtype=np.float64), np.asarray(docs_complete, dtype=bool))
+        y = np.asarray(days, dtype=np.float64)
+        coefficients, *_ = np.linalg.lstsq(x, y, rcond=None)
+
+        residual = y - x @ coefficients
+        port_keys, inv = np.unique(np.asarray(ports), return_inverse=True)
+        port_count = np.bincount(inv).astype(np.float64)
+        port_offset = np.bincount(inv, weights=residual) / port_count
+        port_offset *= port_count / (port_count + PORT_PRIOR)
+
+        spread = np.sqrt(np.mean((residual - port_offset[inv]) ** 2))
+        return cls(
+            coefficients=coefficients,
+            ports=port_keys,
+            port_offset=port_offset,
+            port_count=port_count,
+            spread=spread,
+            samples=len(y),
+            trained_at=datetime.now(timezone.utc).timestamp(),
+        )
+
+    def save(self, path: str) -> None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        np.savez_compressed(
+            path,
+            coefficients=self.coefficients,
+            ports=self.ports,
+            port_offset=self.port_offset,
+            port_count=self.port_count,
+            spread=np.array(self.spread),
+            samples=np.array(self.samples),
+            trained_at=np.array(self.trained_at),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "DelayPredictionModel":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(
+                coefficients=data["coefficients"],
+                ports=data["ports"],
+                port_offset=data["port_offset"],
+                port_count=data["port_count"],
+                spread=float(data["spread"]),
+                samples=int(data["samples"]),
+                trained_at=float(data["trained_at"]),
+            )
+
+    def score(self, features: Sequence[DelayFeatures]) -> Dict[str, np.ndarray]:
+        """Vectorized scoring; returns parallel arrays for every feature tuple"""
+        n = len(features)
+        ports, rms, duty, docs_complete = zip(*features)
+        rms = np.fromiter(rms, dtype=bool, count=n)
+        duty = np.fromiter(duty, dtype=np.float64, count=n)
+        docs_complete = np.fromiter(docs_complete, dtype=bool, count=n)
+        port_idx = np.fromiter((self.port_index.get(p, -1) for p in ports), dtype=np.int64, count=n)
+
+        known = port_idx >= 0
+        safe_idx = np.maximum(port_idx, 0)
+        if len(self.ports):
+            offset = np.where(known, self.port_offset[safe_idx], 0.0)
+            count = np.where(known, self.port_count[safe_idx], 0.0)
+        else:
+            offset = count = np.zeros(n)
+
+        days = np.maximum(_design_matrix(rms, duty, docs_complete) @ self.coefficients + offset, 0.0)
+        rounded = np.rint(days).astype(np.int64)
+        risk = np.where(rounded <= LOW_RISK_DAYS, "LOW", np.where(rounded <= MEDIUM_RISK_DAYS, "MEDIUM", "HIGH"))
+
+        # Tighter residual spread and more port history both raise confidence
+        weight = count / (count + PORT_PRIOR)
+        base = 0.5 if self.trained_at is None else 0.6
+        confidence = np.clip((base + 0.35 * weight) * (days + 1.0) / (days + 1.0 + self.spread), 0.05, 0.99)
+        return {
+            "days": rounded,
+            "risk": risk,
+            "confidence": confidence,
+            "known": known,
+            "rms": rms,
+            "duty": duty,
+            "docs_complete": docs_complete,
+            "congested": offset > CONGESTION_DAYS,
+        }
+
+
+def _reasons(rms: bool, duty: float, docs_complete: bool, congested: bool) -> Tuple[List[str], str]:
+    reasons = []
+    if rms:
+        reasons.append("RMS examination required")
+    if not docs_complete:
+        reasons.append("Documents incomplete")
+    if duty >= HIGH_DUTY_AMOUNT:
+        reasons.append("High duty amount")
+    if congested:
+        reasons.append("Port congestion")
+
+    if not docs_complete:
+        recommendation = "Upload missing documents early"
+    elif rms:
+        recommendation = "Keep cargo and paperwork ready for examination"
+    elif duty >= HIGH_DUTY_AMOUNT:
+        recommendation = "Arrange duty payment in advance"
+    else:
+        recommendation = "No action needed; clearance expected on schedule"
+    return reasons, recommendation
+
+
+class DelayPredictor:
+    """
+    Holds the active delay model and memoizes predictions per feature tuple.
+    The memo is dropped whenever the model changes.
+    """
+
+    def __init__(self, path: str = DELAY_MODEL_PATH, memo_size: int = MEMO_SIZE):
+        self.path = path
+        self.model = DelayPredictionModel.default()
+        self.memo_size = memo_size
+        self._memo: "OrderedDict[DelayFeatures, dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memo_hits = 0
+        self.memo_misses = 0
+
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        self._set_model(DelayPredictionModel.load(self.path))
+        return True
+
+    async def train(self, db: AsyncSession) -> DelayPredictionModel:
+        samples = await load_training_samples(db)
+        model = await asyncio.to_thread(DelayPredictionModel.fit, samples)
+        await asyncio.to_thread(model.save, self.path)
+        self._set_model(model)
+        return model
+
+    def _set_model(self, model: DelayPredictionModel) -> None:
+        with self._lock:
+            self.model = model
+            self._memo.clear()
+
+    def predict(self, requests: Sequence[schemas.DelayPredictionRequest]) -> List[schemas.DelayPredictionResult]:
+        features = [delay_features(r) for r in requests]
+        found: Dict[DelayFeatures, dict] = {}
+        with self._lock:
+            model = self.model
+            for key in features:
+                cached = self._memo.get(key)
+                if cached is not None:
+                    self._memo.move_to_end(key)
+                    found[key] = cached
+            missing = list(dict.fromkeys(key for key in features if key not in found))
+            self.memo_hits += len(features) - len(missing)
+            self.memo_misses += len(missing)
+
+        if missing:
+            scores = model.score(missing)
+            scored = {}
+            for i, key in enumerate(missing):
+                reasons, recommendation = _reasons(
+                    bool(scores["rms"][i]), float(scores["duty"][i]),
+                    bool(scores["docs_complete"][i]), bool(scores["congested"][i])
+                )
+                scored[key] = {
+                    "delayRisk": str(scores["risk"][i]),
+                    "predictedDelayDays": int(scores["days"][i]),
+                    "confidenceScore": round(float(scores["confidence"][i]), 3),
+                    "reasons": reasons,
+                    "recommendation": recommendation,
+                    "port": key[0],
+                    "source": "PORT" if scores["known"][i] else "GLOBAL",
+                }
+            found.update(scored)
+            with self._lock:
+                # Skip memoizing if the model was swapped while scoring
+                if model is self.model:
+                    for key, prediction in scored.items():
+                        self._memo[key] = prediction
+                    while len(self._memo) > self.memo_size:
+                        self._memo.popitem(last=False)
+
+        # Fields come straight from the model, so skip re-validating them per shipment
+        return [
+            schemas.DelayPredictionResult.model_construct(shipmentId=r.shipmentId, **found[key])
+            for r, key in zip(requests, features)
+        ]
+
+    def stats(self) -> dict:
+        return {
+            "trained_at": self.model.trained_at_datetime,
+            "samples": self.model.samples,
+            "ports": len(self.model.port_index),
+            "memo_size": len(self._memo),
+            "memo_hits": self.memo_hits,
+            "memo_misses": self.memo_misses,
+        }
+
+
+async def load_training_samples(db: AsyncSession) -> List[DelaySample]:
+    """
+    Pair each shipment's latest logged prediction features with the time
+    from filing to clearance (cleared_at) on its customs entries.
+    """
+    from .models import CustomsEntry, CustomsDelayPrediction
+
+    cleared = await db.execute(
+        select(
+            CustomsEntry.shipment_id,
+            CustomsEntry.created_at,
+            CustomsEntry.cleared_at
+        ).filter(
+            CustomsEntry.status == "CLEARED",
+            CustomsEntry.cleared_at.is_not(None)
+        )
+    )
+    clearance_days: Dict = {}
+    for shipment_id, created_at, cleared_at in cleared:
+        days = (cleared_at - created_at).total_seconds() / 86400.0
+        clearance_days[shipment_id] = max(days, clearance_days.get(shipment_id, 0.0))
+    if not clearance_days:
+        return []
+
+    logged = await db.execute(
+        select(
+            CustomsDelayPrediction.shipment_id,
+            CustomsDelayPrediction.port,
+            CustomsDelayPrediction.rms_examination,
+            CustomsDelayPrediction.duty_amount,
+            CustomsDelayPrediction.documents_complete
+        ).filter(
+            CustomsDelayPrediction.shipment_id.in_(clearance_days.keys())
+        ).order_by(CustomsDelayPrediction.id)
+    )
+    # Later rows overwrite earlier ones: the latest features per shipment win
+    features = {shipment_id: (port, rms, duty, docs) for shipment_id, port, rms, duty, docs in logged}
+    return [(*features[shipment_id], clearance_days[shipment_id]) for shipment_id in features]
+
+
+delay_predictor = DelayPredictor()
+
+
+async def _train_from_cli() -> None:
+    from database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        trained = await delay_predictor.train(db)
+    print(f"Trained delay model on {trained.samples} cleared filings across {len(trained.port_index)} ports -> {delay_predictor.path}")
+
+
+if __name__ == "__main__":
+    asyncio.run(_train_from_cli())
@@ -0,0 +1,81 @@
+import logging
+import os
+from collections import deque
+from typing import Deque, List
+
+from sqlalchemy import insert
+
+from database import AsyncSessionLocal
+from utils.background import BackgroundWorker
+from .models import CustomsDelayPrediction
+
+logger = logging.getLogger(__name__)
+
+# Rows written per INSERT, and the pause between flushes once the queue is empty
+PREDICTION_LOG_BATCH_SIZE = 1000
+PREDICTION_LOG_INTERVAL = float(os.getenv("PREDICTION_LOG_INTERVAL_SECONDS", "5"))
+# Rows held while the DB is unreachable; the oldest are dropped beyond this
+PREDICTION_LOG_MAX_PENDING = 50000
+
+
+class PredictionLogWriter(BackgroundWorker):
+    """
+    Writes the features of served delay predictions (the training set) in
+    batches, off the request path. Logging is best effort: rows still queued
+    when the process dies, or pushed out of a full queue, are lost.
+    """
+
+    name = "customs-prediction-log"
+
+    def __init__(self):
+        super().__init__()
+        self._pending: Deque[dict] = deque(maxlen=PREDICTION_LOG_MAX_PENDING)
+        self.written = 0
+        self.dropped = 0
+
+    def enqueue(self, rows: List[dict]) -> None:
+        self.dropped += max(0, len(self._pending) + len(rows) - PREDICTION_LOG_MAX_PENDING)
+        self._pending.extend(rows)
+
+    async def run_once(self) -> float:
+        if self._pending:
+            await self.flush(PREDICTION_LOG_BATCH_SIZE)
+        # A full batch means there is a backlog; keep going straight away
+        return 0 if self._pending else PREDICTION_LOG_INTERVAL
+
+    async def flush(self, limit: int) -> int:
+        batch = [self._pending.popleft() for _ in range(min(limit, len(self._pending)))]
+        if not batch:
+            return 0
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(insert(CustomsDelayPrediction), batch)
+                await db.commit()
+        except Exception:
+            # Back to the front of the queue for the next run
+            self._pending.extendleft(reversed(batch))
+            raise
+        self.written += len(batch)
+        return len(batch)
+
+    async def stop(self) -> None:
+        await super().stop()
+        # Whatever is still queued at shutdown, in one last write. Shutdown
+        # must go on if it fails, so the rows are counted as lost instead
+        try:
+            await self.flush(len(self._pending))
+        except Exception:
+            logger.exception("Dropping %d delay prediction log rows at shutdown", len(self._pending))
+            self.dropped += len(self._pending)
+            self._pending.clear()
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "pending": len(self._pending),
+            "written": self.written,
+            "dropped": self.dropped,
+        }
+
+
+prediction_log_writer = PredictionLogWriter()
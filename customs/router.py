@@ -1,8 +1,16 @@
+import httpx
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from typing import Dict
-from database import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List
+from uuid import UUID
+from database import get_async_db
+from utils.http_client import get_upstream_client
 from . import schemas, service
+from .poller import clearance_poller
+from .prediction_log import prediction_log_writer
+from .prediction import delay_predictor
+
+get_icegate_client = get_upstream_client(service.ICEGATE_UPSTREAM)
 
 router = APIRouter(
     prefix="/api/customs",
@@ -12,49 +20,125 @@ router = APIRouter(
 @router.post("/export/shipping-bill", response_model=schemas.SubmissionResponse, status_code=status.HTTP_201_CREATED)
 async def submit_export_shipping_bill(
     request: schemas.ExportShippingBillRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
 ):
     """
     Submit an Export Shipping Bill to ICEGATE.
     """
-    customs_service = service.CustomsService(db)
+    customs_service = service.CustomsService(db, client)
     return await customs_service.submit_export_bill(request)
 
 @router.post("/import/bill-of-entry", response_model=schemas.SubmissionResponse, status_code=status.HTTP_201_CREATED)
 async def submit_import_bill_of_entry(
     request: schemas.ImportBillOfEntryRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
 ):
     """
     Submit an Import Bill of Entry to ICEGATE.
     """
-    customs_service = service.CustomsService(db)
+    customs_service = service.CustomsService(db, client)
     return await customs_service.submit_import_bill(request)
 
+@router.post("/export/shipping-bill/bulk", response_model=schemas.BulkSubmissionResponse)
+async def submit_export_shipping_bills_bulk(
+    request: schemas.BulkExportShippingBillRequest,
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
+):
+    """
+    Submit a batch of Export Shipping Bills to ICEGATE with a per-item result report.
+    """
+    customs_service = service.CustomsService(db, client)
+    return await customs_service.submit_bulk("EXPORT", request.bills)
+
+@router.post("/import/bill-of-entry/bulk", response_model=schemas.BulkSubmissionResponse)
+async def submit_import_bills_of_entry_bulk(
+    request: schemas.BulkImportBillOfEntryRequest,
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
+):
+    """
+    Submit a batch of Import Bills of Entry to ICEGATE with a per-item result report.
+    """
+    customs_service = service.CustomsService(db, client)
+    return await customs_service.submit_bulk("IMPORT", request.bills)
+
 @router.get("/clearance/status/{shipment_id}", response_model=schemas.ClearanceStatusResponse)
 async def get_clearance_status(
     shipment_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
 ):
     """
-    Get the clearance status for a shipment from ICEGATE.
+    Get the clearance status for a shipment from the locally polled filings.
     """
-    customs_service = service.CustomsService(db)
+    customs_service = service.CustomsService(db, client)
     return await customs_service.get_clearance_status(shipment_id)
 
-@router.post("/ai/prediction", response_model=Dict) 
-# Note: Using Dict response model or specific DelayPredictionResponse schema
-# if the mock returns exactly that. The mock returns a JSON object.
-# Let's use the schema if it matches, otherwise Dict is safer for a simulated backend.
-# The schema DelayPredictionResponse is defined in schemas.py, let's use it.
-# Actually, the mock response example has `delayRisk`, `predictedDelayDays`, etc.
-# which matches our DelayPredictionResponse.
+@router.get("/clearance/summary/{shipment_id}", response_model=schemas.ClearanceSummaryResponse)
+async def get_clearance_summary(
+    shipment_id: UUID,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Latest EXPORT and IMPORT filing for a shipment, served from the DB.
+    """
+    customs_service = service.CustomsService(db)
+    return await customs_service.get_clearance_summary(shipment_id)
+
+@router.post("/clearance/summary/batch", response_model=List[schemas.ClearanceSummaryResponse])
+async def get_clearance_summaries(
+    request: schemas.BatchClearanceSummaryRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Customs state for up to 500 shipments in one query.
+    """
+    customs_service = service.CustomsService(db)
+    return await customs_service.get_clearance_summaries(request.shipmentIds)
+
+@router.post("/ai/prediction", response_model=schemas.DelayPredictionResult)
 async def predict_clearance_delay(
     request: schemas.DelayPredictionRequest,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    client: httpx.AsyncClient = Depends(get_icegate_client)
 ):
     """
-    Predict customs clearance delay using AI based on shipment details.
+    Predict customs clearance delay based on shipment details.
     """
-    customs_service = service.CustomsService(db)
+    customs_service = service.CustomsService(db, client)
     return await customs_service.predict_delay(request)
+
+@router.post("/ai/prediction/batch", response_model=schemas.BatchDelayPredictionResponse)
+async def predict_clearance_delay_batch(
+    request: schemas.BatchDelayPredictionRequest,
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Score up to 10,000 shipments in one call with the local delay model
+    """
+    customs_service = service.CustomsService(db)
+    return await customs_service.predict_delay_batch(request)
+
+@router.post("/ai/prediction/train", response_model=schemas.DelayModelInfo)
+async def train_delay_model(db: AsyncSession = Depends(get_async_db)):
+    """
+    Retrain the local delay model from logged predictions and observed clearance times
+    """
+    customs_service = service.CustomsService(db)
+    return await customs_service.train_delay_model()
+
+@router.get("/upstream/health")
+async def get_upstream_health():
+    """
+    Circuit breaker state, retry budget and latency per ICEGATE endpoint
+    """
+    return {
+        "resilience": service.icegate_resilience.snapshot(),
+        "singleflight": service.icegate_flights.stats(),
+        "clearance_poller": clearance_poller.stats(),
+        "delay_predictor": delay_predictor.stats(),
+        "prediction_log": prediction_log_writer.stats()
+    }
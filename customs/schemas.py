@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field, condecimal
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from uuid import UUID
 from datetime import datetime
 
@@ -25,6 +25,31 @@ class ImportBillOfEntryRequest(BaseModel):
     dutyAmount: float = Field(..., example=78000)
     shipmentId: UUID = Field(..., description="Internal Shipment ID to link the filing")
 
+# --- Bulk Submission Schemas ---
+
+MAX_BULK_FILINGS = 500
+
+class BulkExportShippingBillRequest(BaseModel):
+    bills: List[ExportShippingBillRequest] = Field(..., min_length=1, max_length=MAX_BULK_FILINGS)
+
+class BulkImportBillOfEntryRequest(BaseModel):
+    bills: List[ImportBillOfEntryRequest] = Field(..., min_length=1, max_length=MAX_BULK_FILINGS)
+
+class BulkSubmissionItemResult(BaseModel):
+    index: int = Field(..., example=0)
+    invoiceNumber: str = Field(..., example="INV-EXP-1001")
+    shipmentId: UUID
+    status: str = Field(..., example="SUBMITTED", description="SUBMITTED or FAILED")
+    referenceId: Optional[str] = Field(None, example="ICEGATE-REF-12345")
+    error: Optional[str] = None
+    statusCode: Optional[int] = None
+    response: Optional[Dict[str, Any]] = Field(None, exclude=True)
+
+class BulkSubmissionResponse(BaseModel):
+    submitted: int = Field(..., example=198)
+    failed: int = Field(..., example=2)
+    results: List[BulkSubmissionItemResult]
+
 # --- Clearance Schemas ---
 
 class ClearanceStatusResponse(BaseModel):
@@ -32,6 +57,24 @@ class ClearanceStatusResponse(BaseModel):
     exportStatus: str = Field(..., example="CLEARED")
     importStatus: str = Field(..., example="PENDING")
     reason: Optional[str] = Field(None, example="Awaiting duty payment")
+    checkedAt: Optional[datetime] = Field(None, description="When ICEGATE last confirmed this status")
+
+class CustomsEntrySummary(BaseModel):
+    entryType: str = Field(..., example="EXPORT")
+    status: str = Field(..., example="CLEARED")
+    referenceId: Optional[str] = Field(None, example="ICEGATE-REF-12345")
+    reason: Optional[str] = None
+    filedAt: Optional[datetime] = None
+    checkedAt: Optional[datetime] = None
+
+class ClearanceSummaryResponse(ClearanceStatusResponse):
+    exportEntry: Optional[CustomsEntrySummary] = None
+    importEntry: Optional[CustomsEntrySummary] = None
+
+MAX_SUMMARY_SHIPMENTS = 500
+
+class BatchClearanceSummaryRequest(BaseModel):
+    shipmentIds: List[UUID] = Field(..., min_length=1, max_length=MAX_SUMMARY_SHIPMENTS)
 
 # --- AI Prediction Schemas ---
 
@@ -48,3 +91,22 @@ class DelayPredictionResponse(BaseModel):
     confidenceScore: float = Field(..., example=0.78)
     reasons: List[str] = Field(..., example=["RMS examination required", "Port congestion"])
     recommendation: str = Field(..., example="Upload missing documents early")
+
+class DelayPredictionResult(DelayPredictionResponse):
+    shipmentId: Optional[UUID] = None
+    port: str = Field(..., example="CHENNAI")
+    source: str = Field(..., example="PORT", description="PORT when the port has clearance history, GLOBAL otherwise, REMOTE for the ICEGATE model")
+
+MAX_BATCH_DELAY_PREDICTIONS = 10000
+
+class BatchDelayPredictionRequest(BaseModel):
+    shipments: List[DelayPredictionRequest] = Field(..., min_length=1, max_length=MAX_BATCH_DELAY_PREDICTIONS)
+
+class BatchDelayPredictionResponse(BaseModel):
+    modelTrainedAt: Optional[datetime] = Field(None, description="Null while the default coefficients are in use")
+    predictions: List[DelayPredictionResult]
+
+class DelayModelInfo(BaseModel):
+    trainedAt: Optional[datetime]
+    ports: int = Field(..., example=12)
+    samples: int = Field(..., example=4800)
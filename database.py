@@ -0,0 +1,44 @@
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import settings
+
+
+def _async_database_url(url: str) -> str:
+    """Point a sync PostgreSQL URL at the asyncpg driver"""
+    for prefix in ("postgresql+psycopg2://", "postgresql://", "postgres://"):
+        if url.startswith(prefix):
+            return "postgresql+asyncpg://" + url[len(prefix):]
+    return url
+
+
+ASYNC_DATABASE_URL = _async_database_url(settings.DATABASE_URL)
+
+# Supabase's transaction-mode pooler (port 6543) can't keep prepared statements
+# across transactions, so asyncpg's statement caches must be off behind it
+_behind_pgbouncer = ":6543/" in ASYNC_DATABASE_URL
+if _behind_pgbouncer:
+    ASYNC_DATABASE_URL += ("&" if "?" in ASYNC_DATABASE_URL else "?") + "prepared_statement_cache_size=0"
+
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=20,
+    max_overflow=10,
+    pool_pre_ping=True,
+    pool_recycle=1800,
+    connect_args={"statement_cache_size": 0} if _behind_pgbouncer else {},
+)
+
+# expire_on_commit=False: attributes stay readable after commit without an
+# implicit (and, under asyncio, illegal) lazy reload
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autoflush=False,
+)
+
+
+async def get_async_db():
+    """FastAPI dependency yielding a non-blocking AsyncSession"""
+    async with AsyncSessionLocal() as session:
+        yield session
@@ -1,14 +1,14 @@
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File, BackgroundTasks
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 import os
 import tempfile
 import uuid
 
-from database import get_db
+from database import get_async_db, AsyncSessionLocal
 from auth.dependencies import get_current_user
 from auth.models import User
-from shipments.models import Shipment
 from documents.models import Document, ExtractionJob
 from documents.schemas import (
     DocumentResponse, 
@@ -19,6 +19,7 @@ from documents.schemas import (
 )
 from documents.extractor import document_extractor
 from utils.storage import upload_to_supabase
+from utils.loaders import Loaders, get_loaders
 
 router = APIRouter()
 
@@ -29,13 +30,14 @@ async def upload_document(
     document_type: DocumentType = DocumentType.INVOICE,
     background_tasks: BackgroundTasks = None,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Upload a document for a shipment
     """
     # Verify shipment exists and user has access
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -84,16 +86,15 @@ async def upload_document(
         )
         
         db.add(document)
-        db.commit()
-        db.refresh(document)
+        await db.commit()
+        await db.refresh(document)
         
         # Trigger AI extraction in background
         if background_tasks:
             background_tasks.add_task(
                 extract_document_data,
                 str(document.id),
-                temp_path,
-                db
+                temp_path
             )
         
         return document
@@ -112,12 +113,13 @@ async def upload_document(
 async def get_shipment_documents(
     shipment_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Get all documents for a shipment
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -137,9 +139,12 @@ async def get_shipment_documents(
             detail="Not authorized"
         )
     
-    documents = db.query(Document).filter(
-        Document.shipment_id == shipment_id
-    ).all()
+    result = await db.execute(
+        select(Document).filter(
+            Document.shipment_id == shipment_id
+        )
+    )
+    documents = result.scalars().all()
     
     return documents
 
@@ -147,12 +152,13 @@ async def get_shipment_documents(
 async def get_document(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Get a specific document
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -160,7 +166,7 @@ async def get_document(
         )
     
     # Check permissions via shipment
-    shipment = db.query(Shipment).filter(Shipment.id == document.shipment_id).first()
+    shipment = await loaders.shipments.load(document.shipment_id)
     if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -173,12 +179,13 @@ async def get_document(
 async def trigger_extraction(
     document_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Manually trigger AI extraction for a document
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -186,7 +193,7 @@ async def trigger_extraction(
         )
     
     # Check permissions
-    shipment = db.query(Shipment).filter(Shipment.id == document.shipment_id).first()
+    shipment = await loaders.shipments.load(document.shipment_id)
     if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -213,12 +220,13 @@ async def autofill_shipment(
     document_id: str,
     autofill_request: AutoFillRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Auto-fill shipment fields from extracted document data
     """
-    document = db.query(Document).filter(Document.id == document_id).first()
+    document = await db.get(Document, document_id)
     if not document:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -232,7 +240,7 @@ async def autofill_shipment(
         )
     
     # Get shipment
-    shipment = db.query(Shipment).filter(Shipment.id == document.shipment_id).first()
+    shipment = await loaders.shipments.load(document.shipment_id)
     
     # Check permissions
     if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
@@ -253,7 +261,7 @@ async def autofill_shipment(
                 updated_fields.append(field)
                 extracted_values[field] = value
     
-    db.commit()
+    await db.commit()
     
     return AutoFillResponse(
         document_id=str(document.id),
@@ -263,48 +271,53 @@ async def autofill_shipment(
         extracted_values=extracted_values
     )
 
-async def extract_document_data(document_id: str, file_path: str, db: Session):
+async def extract_document_data(document_id: str, file_path: str):
     """
     Background task to extract data from document using AI
     """
-    try:
-        # Get document
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            return
-        
-        # Create extraction job
-        job = ExtractionJob(
-            document_id=document_id,
-            status="processing"
-        )
-        db.add(job)
-        db.commit()
-        
-        # Run AI extraction
-        import asyncio
-        extracted_data = await document_extractor.extract_document(file_path)
-        
-        # Update document with extracted data
-        document.extracted_data = extracted_data
-        document.confidence_score = extracted_data.get("confidence", 0.0)
-        document.extraction_method = extracted_data.get("extraction_method", "unknown")
-        document.needs_review = extracted_data.get("needs_review", True)
-        
-        # Update job
-        job.status = "completed"
-        job.model_used = extracted_data.get("extraction_method", "gemini_1.5_pro")
-        job.processing_time_ms = extracted_data.get("processing_time_ms", 0)
-        
-        db.commit()
-        
-    except Exception as e:
-        # Update job with error
-        job = db.query(ExtractionJob).filter(ExtractionJob.document_id == document_id).first()
-        if job:
-            job.status = "failed"
-            job.error_message = str(e)
-            job.attempts += 1
-            db.commit()
-        
-        print(f"Extraction failed for document {document_id}: {e}")
+    # The request's session is closed by the time background tasks run
+    async with AsyncSessionLocal() as db:
+        try:
+            # Get document
+            document = await db.get(Document, document_id)
+            if not document:
+                return
+            
+            # Create extraction job
+            job = ExtractionJob(
+                document_id=document_id,
+                status="processing"
+            )
+            db.add(job)
+            await db.commit()
+            
+            # Run AI extraction
+            extracted_data = await document_extractor.extract_document(file_path)
+            
+            # Update document with extracted data
+            document.extracted_data = extracted_data
+            document.confidence_score = extracted_data.get("confidence", 0.0)
+            document.extraction_method = extracted_data.get("extraction_method", "unknown")
+            document.needs_review = extracted_data.get("needs_review", True)
+            
+            # Update job
+            job.status = "completed"
+            job.model_used = extracted_data.get("extraction_method", "gemini_1.5_pro")
+            job.processing_time_ms = extracted_data.get("processing_time_ms", 0)
+            
+            await db.commit()
+            
+        except Exception as e:
+            await db.rollback()
+            # Update job with error
+            result = await db.execute(
+                select(ExtractionJob).filter(ExtractionJob.document_id == document_id)
+            )
+            job = result.scalars().first()
+            if job:
+                job.status = "failed"
+                job.error_message = str(e)
+                job.attempts += 1
+                await db.commit()
+            
+            print(f"Extraction failed for document {document_id}: {e}")
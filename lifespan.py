@@ -0,0 +1,56 @@
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+
+from database import AsyncSessionLocal, async_engine
+from utils.http_client import upstream_clients
+from carriers.lane_index import lane_rate_index
+from carriers.prediction import rate_predictor
+from carriers.tariffs import tariff_store
+from customs.poller import clearance_poller
+from customs.prediction import delay_predictor
+from customs.prediction_log import prediction_log_writer
+from tracking.broker import tracking_broker
+from tracking.eta import eta_engine
+from tracking.archive import TRACKING_ARCHIVE_ENABLED, tracking_archiver
+from notifications.dispatcher import notification_dispatcher
+from quotes.expiry import quote_expiry_sweeper
+
+# Importing the services registers their upstreams with the shared client pool
+import carriers.service  # noqa: F401
+import customs.service  # noqa: F401
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application lifespan: create app-scoped resources on startup and
+    release them on shutdown. Wire up with `FastAPI(lifespan=lifespan)`.
+    """
+    await upstream_clients.startup()
+    rate_predictor.load()
+    tariff_store.load()
+    delay_predictor.load()
+    eta_engine.load()
+    async with AsyncSessionLocal() as db:
+        await lane_rate_index.rebuild(db)
+    await tracking_broker.start()
+    clearance_poller.start()
+    prediction_log_writer.start()
+    eta_engine.start()
+    if TRACKING_ARCHIVE_ENABLED:
+        tracking_archiver.start()
+    notification_dispatcher.start()
+    quote_expiry_sweeper.start()
+    app.state.upstream_clients = upstream_clients
+    try:
+        yield
+    finally:
+        await clearance_poller.stop()
+        await prediction_log_writer.stop()
+        await eta_engine.stop()
+        await tracking_archiver.stop()
+        await quote_expiry_sweeper.stop()
+        await notification_dispatcher.stop()
+        await tracking_broker.stop()
+        await upstream_clients.shutdown()
+        await async_engine.dispose()
@@ -0,0 +1,13 @@
+-- Stored ICEGATE status kept fresh by the customs poller (customs.poller).
+-- Existing entries get next_poll_at = now(), so the poller picks up every
+-- non-terminal filing on its first pass.
+ALTER TABLE customs_entries
+    ADD COLUMN IF NOT EXISTS status_reason text,
+    ADD COLUMN IF NOT EXISTS status_checked_at timestamptz,
+    ADD COLUMN IF NOT EXISTS next_poll_at timestamptz DEFAULT now(),
+    ADD COLUMN IF NOT EXISTS poll_interval_seconds integer;
+
+-- Poller scan: due, non-terminal entries only
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customs_entries_poll_due
+    ON customs_entries (next_poll_at)
+    WHERE status IN ('SUBMITTED', 'PENDING');
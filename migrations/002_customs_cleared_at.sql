@@ -0,0 +1,4 @@
+-- Clearance time recorded by the poller; the delay model's training label.
+-- Entries cleared before this column existed stay NULL and are left out of training.
+ALTER TABLE customs_entries
+    ADD COLUMN IF NOT EXISTS cleared_at timestamptz;
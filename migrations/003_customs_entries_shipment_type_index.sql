@@ -0,0 +1,6 @@
+-- Latest filing per (shipment, type); also serves plain shipment_id lookups,
+-- so the single-column index some databases got from create_all is dropped.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_customs_entries_shipment_type_created
+    ON customs_entries (shipment_id, entry_type, created_at DESC);
+
+DROP INDEX CONCURRENTLY IF EXISTS ix_customs_entries_shipment_id;
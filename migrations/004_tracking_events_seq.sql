@@ -0,0 +1,33 @@
+-- tracking_events.seq: the feed position behind ?since= history paging.
+-- Existing events are numbered in their old (timestamp, id) order, then the
+-- column becomes an identity so new events continue after them. The UPDATE
+-- rewrites the table under an exclusive lock; run it in a quiet window.
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'tracking_events'
+          AND column_name = 'seq'
+    ) THEN
+        ALTER TABLE tracking_events ADD COLUMN seq bigint;
+        UPDATE tracking_events AS t
+        SET seq = ordered.n
+        FROM (
+            SELECT id, row_number() OVER (ORDER BY timestamp, id) AS n
+            FROM tracking_events
+        ) AS ordered
+        WHERE t.id = ordered.id;
+        ALTER TABLE tracking_events ALTER COLUMN seq SET NOT NULL;
+        ALTER TABLE tracking_events ALTER COLUMN seq ADD GENERATED BY DEFAULT AS IDENTITY;
+        PERFORM setval(pg_get_serial_sequence('tracking_events', 'seq'), coalesce(max(seq), 0) + 1, false)
+        FROM tracking_events;
+    END IF;
+END $$;
+
+-- Keyset pagination / incremental sync: WHERE shipment_id = ? AND seq > ?
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tracking_events_shipment_seq
+    ON tracking_events (shipment_id, seq);
+
+-- Superseded by the seq index
+DROP INDEX CONCURRENTLY IF EXISTS ix_tracking_events_shipment_timestamp_id;
@@ -0,0 +1,3 @@
+-- Bulk ingestion dedupe key (tracking.ingest)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_tracking_events_dedupe
+    ON tracking_events (shipment_id, actual_datetime, status, container_number);
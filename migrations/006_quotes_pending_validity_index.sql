@@ -0,0 +1,4 @@
+-- Expiry sweep: pending quotes by validity; the index stays as small as the pending set
+CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_quotes_pending_validity
+    ON quotes (validity_date)
+    WHERE status = 'pending';
@@ -0,0 +1,11 @@
+-- Optimistic version for quote updates and acceptance
+ALTER TABLE quotes
+    ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1;
+
+-- At most one accepted quote per shipment. The build fails if existing data
+-- already breaks that; find the offenders with
+--   SELECT shipment_id FROM quotes WHERE status = 'accepted' GROUP BY 1 HAVING count(*) > 1;
+-- resolve them, drop the INVALID index and re-run this file.
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS ix_quotes_one_accepted_per_shipment
+    ON quotes (shipment_id)
+    WHERE status = 'accepted';
@@ -0,0 +1,6 @@
+-- Summary rows now carry event time (not receipt time) in latest_event_at,
+-- plus the event time the ETA came from. Rebuild every row afterwards so
+-- existing summaries follow the same rules:
+--   python -m tracking.summary
+ALTER TABLE shipment_tracking_summaries
+    ADD COLUMN IF NOT EXISTS estimated_arrival_event_at timestamptz;
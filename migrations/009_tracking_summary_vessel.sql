@@ -0,0 +1,5 @@
+-- Vessel of the latest event, so ETA predictions read only the summary row.
+-- Rebuild the summaries afterwards to fill it in:
+--   python -m tracking.summary
+ALTER TABLE shipment_tracking_summaries
+    ADD COLUMN IF NOT EXISTS latest_vessel_name varchar(100);
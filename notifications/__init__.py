@@ -0,0 +1 @@
+# Notifications module for TradeFlow AI
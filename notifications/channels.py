@@ -0,0 +1,114 @@
+import asyncio
+import json
+import logging
+import os
+import smtplib
+from email.message import EmailMessage
+from typing import Dict, List
+
+from .messages import Digest
+
+logger = logging.getLogger(__name__)
+
+# "file" (JSON lines outbox, the local stand-in), "smtp" or "log"
+NOTIFICATION_CHANNEL = os.getenv("NOTIFICATION_CHANNEL", "file").lower()
+NOTIFICATION_OUTBOX_PATH = os.getenv("NOTIFICATION_OUTBOX_PATH", os.path.join("outbox", "notifications.jsonl"))
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "25"))
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_SENDER = os.getenv("SMTP_SENDER", "notifications@tradeflow.ai")
+
+
+class NotificationChannel:
+    """Delivers a batch of digests; implementations must not block the event loop"""
+
+    name = "channel"
+
+    async def send(self, digests: List[Digest]) -> None:
+        raise NotImplementedError
+
+
+class LogChannel(NotificationChannel):
+    name = "log"
+
+    async def send(self, digests: List[Digest]) -> None:
+        for digest in digests:
+            logger.info("Notification for %s: %s\n%s", digest.recipient_id, digest.subject, digest.body)
+
+
+class FileChannel(NotificationChannel):
+    """Appends each digest as a JSON line to a local outbox file"""
+
+    name = "file"
+
+    def __init__(self, path: str = NOTIFICATION_OUTBOX_PATH):
+        self.path = path
+
+    async def send(self, digests: List[Digest]) -> None:
+        lines = "".join(json.dumps(digest.as_dict(), default=str) + "\n" for digest in digests)
+        await asyncio.to_thread(self._append, lines)
+
+    def _append(self, lines: str) -> None:
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+class SMTPChannel(NotificationChannel):
+    """Emails each digest, resolving recipient addresses for the whole batch in one query"""
+
+    name = "smtp"
+
+    def __init__(self, host: str = SMTP_HOST, port: int = SMTP_PORT, sender: str = SMTP_SENDER):
+        self.host = host
+        self.port = port
+        self.sender = sender
+
+    async def send(self, digests: List[Digest]) -> None:
+        addresses = await self._resolve_addresses({digest.recipient_id for digest in digests})
+        messages = []
+        for digest in digests:
+            address = addresses.get(digest.recipient_id)
+            if not address:
+                logger.warning("No email address for notification recipient %s", digest.recipient_id)
+                continue
+            message = EmailMessage()
+            message["From"] = self.sender
+            message["To"] = address
+            message["Subject"] = digest.subject
+            message.set_content(digest.body)
+            messages.append(message)
+        if messages:
+            await asyncio.to_thread(self._deliver, messages)
+
+    def _deliver(self, messages: List[EmailMessage]) -> None:
+        # One SMTP session per batch
+        with smtplib.SMTP(self.host, self.port, timeout=30) as smtp:
+            if SMTP_USERNAME:
+                smtp.starttls()
+                smtp.login(SMTP_USERNAME, SMTP_PASSWORD)
+            for message in messages:
+                smtp.send_message(message)
+
+    async def _resolve_addresses(self, recipient_ids) -> Dict[str, str]:
+        from sqlalchemy import select
+        from auth.models import User
+        from database import AsyncSessionLocal
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(select(User.id, User.email).filter(User.id.in_(recipient_ids)))
+            return {str(user_id): email for user_id, email in result}
+
+
+CHANNELS = {
+    "log": LogChannel,
+    "file": FileChannel,
+    "smtp": SMTPChannel,
+}
+
+
+def get_channel(name: str = NOTIFICATION_CHANNEL) -> NotificationChannel:
+    if name not in CHANNELS:
+        raise ValueError(f"Unknown notification channel {name!r}")
+    return CHANNELS[name]()
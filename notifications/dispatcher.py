@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from utils.background import BackgroundWorker
+from .channels import NotificationChannel, get_channel
+from .messages import Digest, Notification
+
+logger = logging.getLogger(__name__)
+
+# Updates waiting to be grouped; beyond this, new ones are dropped rather than blocking a request
+QUEUE_SIZE = 10000
+# How long a recipient's first update waits for more before the digest goes out
+DIGEST_WINDOW_SECONDS = float(os.getenv("NOTIFICATION_DIGEST_WINDOW_SECONDS", "30"))
+# Concurrent channel sends, and digests handed to a channel per send
+WORKER_COUNT = 4
+SEND_BATCH_SIZE = 50
+
+
+class NotificationDispatcher(BackgroundWorker):
+    """
+    Collects notifications from request handlers without blocking them,
+    coalesces each recipient's updates into one digest per window, and hands
+    due digests to a small pool of send workers.
+    """
+
+    name = "notification-dispatcher"
+    error_backoff = 1.0
+
+    def __init__(self, channel: Optional[NotificationChannel] = None):
+        super().__init__()
+        self._channel = channel
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        self._outbox: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+        # recipient -> open digest, and when each digest is due
+        self._digests: Dict[str, Digest] = {}
+        self._due: Dict[str, float] = {}
+        self.enqueued = 0
+        self.dropped = 0
+        self.digests_sent = 0
+        self.send_failures = 0
+
+    @property
+    def channel(self) -> NotificationChannel:
+        if self._channel is None:
+            self._channel = get_channel()
+        return self._channel
+
+    def notify(self, notification: Notification) -> bool:
+        """Queue a notification; never waits. Returns False if it was dropped"""
+        try:
+            self._queue.put_nowait(notification)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._outbox = asyncio.Queue(maxsize=WORKER_COUNT * 2)
+        self._workers = [
+            asyncio.create_task(self._send_loop(), name=f"{self.name}-sender-{i}") for i in range(WORKER_COUNT)
+        ]
+        super().start()
+
+    async def stop(self) -> None:
+        await super().stop()
+        # Flush everything still queued or open so a restart doesn't lose updates
+        self._collect_nowait()
+        await self._flush(force=True)
+        for _ in self._workers:
+            await self._outbox.put(None)
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def run_once(self) -> float:
+        timeout = max(min(self._due.values()) - time.monotonic(), 0.0) if self._due else None
+        try:
+            first = await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            self._add(first)
+            self._collect_nowait()
+        await self._flush()
+        return 0
+
+    def _collect_nowait(self) -> None:
+        while not self._queue.empty():
+            self._add(self._queue.get_nowait())
+
+    def _add(self, notification: Notification) -> None:
+        digest = self._digests.get(notification.recipient_id)
+        if digest is None:
+            digest = self._digests[notification.recipient_id] = Digest(
+                recipient_id=notification.recipient_id,
+                opened_at=datetime.now(timezone.utc)
+            )
+            self._due[notification.recipient_id] = time.monotonic() + DIGEST_WINDOW_SECONDS
+        digest.add(notification)
+
+    async def _flush(self, force: bool = False) -> None:
+        now = time.monotonic()
+        due = [recipient for recipient, at in self._due.items() if force or at <= now]
+        if not due:
+            return
+        ready = []
+        for recipient in due:
+            del self._due[recipient]
+            ready.append(self._digests.pop(recipient))
+        # Waits when every sender is busy, which in turn lets the intake queue absorb the burst
+        for i in range(0, len(ready), SEND_BATCH_SIZE):
+            await self._outbox.put(ready[i:i + SEND_BATCH_SIZE])
+
+    async def _send_loop(self) -> None:
+        while True:
+            batch = await self._outbox.get()
+            if batch is None:
+                return
+            try:
+                await self.channel.send(batch)
+                self.digests_sent += len(batch)
+            except Exception:
+                self.send_failures += len(batch)
+                logger.exception("Failed to send %d notification digests via %s", len(batch), self.channel.name)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "channel": self.channel.name,
+            "queued": self._queue.qsize(),
+            "open_digests": len(self._digests),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "digests_sent": self.digests_sent,
+            "send_failures": self.send_failures,
+        }
+
+
+notification_dispatcher = NotificationDispatcher()
+
+
+def notify_tracking_update(shipment_id: str, recipient_ids, status: str, location: str, description: str) -> None:
+    for recipient_id in recipient_ids:
+        notification_dispatcher.notify(Notification(
+            recipient_id=str(recipient_id),
+            kind="tracking_update",
+            key=str(shipment_id),
+            title=f"Shipment {shipment_id}: {status}",
+            body=f"{status} at {location} - {description}"
+        ))
+
+
+def notify_quote_accepted(forwarder_id: str, quote_id: str, shipment_id: str) -> None:
+    notification_dispatcher.notify(Notification(
+        recipient_id=str(forwarder_id),
+        kind="quote_accepted",
+        key=str(quote_id),
+        title=f"Quote {quote_id} accepted",
+        body=f"Your quote for shipment {shipment_id} was accepted"
+    ))
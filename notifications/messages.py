@@ -0,0 +1,59 @@
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple
+
+
+@dataclass
+class Notification:
+    """
+    One update for one recipient. Updates sharing `kind` and `key` (e.g. the
+    same shipment's tracking) replace each other inside a digest window.
+    """
+    recipient_id: str
+    kind: str
+    key: str
+    title: str
+    body: str
+    created_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+
+@dataclass
+class Digest:
+    """All updates for one recipient collected during a window"""
+    recipient_id: str
+    opened_at: datetime
+    items: Dict[Tuple[str, str], Notification] = field(default_factory=dict)
+    counts: Dict[Tuple[str, str], int] = field(default_factory=dict)
+    updates: int = 0
+
+    def add(self, notification: Notification) -> None:
+        slot = (notification.kind, notification.key)
+        # Dicts keep first-insertion order, so the digest lists topics in arrival order
+        self.items[slot] = notification
+        self.counts[slot] = self.counts.get(slot, 0) + 1
+        self.updates += 1
+
+    @property
+    def subject(self) -> str:
+        if len(self.items) == 1:
+            return next(iter(self.items.values())).title
+        return f"{len(self.items)} updates on your shipments"
+
+    @property
+    def body(self) -> str:
+        lines: List[str] = []
+        for slot, notification in self.items.items():
+            extra = self.counts[slot] - 1
+            suffix = f" (+{extra} earlier update{'s' if extra > 1 else ''})" if extra else ""
+            lines.append(f"- {notification.title}: {notification.body}{suffix}")
+        return "\n".join(lines)
+
+    def as_dict(self) -> dict:
+        return {
+            "recipient_id": self.recipient_id,
+            "subject": self.subject,
+            "body": self.body,
+            "updates": self.updates,
+            "opened_at": self.opened_at,
+            "sent_at": datetime.now(timezone.utc),
+        }
@@ -0,0 +1,116 @@
+from typing import Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from carriers.lane_index import record_accepted_quote
+from shipments.models import Shipment
+from quotes.models import Quote
+from quotes.ranking import bump_quote_version, invalidate_quote_ranking
+
+
+def _conflict(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=detail)
+
+
+async def accept_pending_quote(
+    db: AsyncSession,
+    shipment: Shipment,
+    quote_id: str,
+    expected_version: Optional[int] = None
+) -> Quote:
+    """
+    Accept one of a shipment's quotes, reject its other pending quotes and mark
+    the shipment quoted, in one short transaction.
+
+    Concurrent accepts for a shipment never queue on each other: the shipment
+    row is claimed with SKIP LOCKED and the loser gets a 409 straight away. The
+    claim is FOR NO KEY UPDATE, so it doesn't conflict with the FOR KEY SHARE
+    locks that inserts referencing the shipment (new quotes, events) take. The
+    quote itself only changes through a conditional UPDATE ... RETURNING on
+    (status, validity, version), and ix_quotes_one_accepted_per_shipment
+    rejects a second acceptance from any other path.
+    """
+    # Rollback expires loaded objects, so keep the id for the failure paths
+    shipment_id = shipment.id
+    claimed = await db.execute(
+        select(Shipment.id).filter(Shipment.id == shipment_id).with_for_update(skip_locked=True, key_share=True)
+    )
+    if claimed.scalar_one_or_none() is None:
+        await db.rollback()
+        raise _conflict("Another quote is being accepted for this shipment")
+
+    conditions = [
+        Quote.id == quote_id,
+        Quote.shipment_id == shipment_id,
+        Quote.status == "pending",
+        or_(Quote.validity_date.is_(None), Quote.validity_date >= func.now())
+    ]
+    if expected_version is not None:
+        conditions.append(Quote.version == expected_version)
+    try:
+        result = await db.execute(
+            update(Quote).where(*conditions).values(
+                status="accepted", version=Quote.version + 1
+            ).returning(Quote).execution_options(populate_existing=True)
+        )
+        quote = result.scalar_one_or_none()
+    except IntegrityError:
+        await db.rollback()
+        raise _conflict("A quote has already been accepted for this shipment")
+
+    if quote is None:
+        await db.rollback()
+        raise await _acceptance_failure(db, shipment_id, quote_id, expected_version)
+
+    await db.execute(
+        update(Quote).where(
+            Quote.shipment_id == shipment_id,
+            Quote.id != quote.id,
+            Quote.status == "pending"
+        ).values(status="rejected", version=Quote.version + 1).execution_options(synchronize_session=False)
+    )
+    shipment.status = "quoted"
+    await bump_quote_version(db, [shipment_id])
+    await db.commit()
+    invalidate_quote_ranking(shipment_id)
+    record_accepted_quote(shipment, quote)
+    return quote
+
+
+async def _acceptance_failure(
+    db: AsyncSession,
+    shipment_id,
+    quote_id: str,
+    expected_version: Optional[int]
+) -> HTTPException:
+    """Work out why the conditional UPDATE matched nothing"""
+    result = await db.execute(
+        select(Quote.status, Quote.version, Quote.validity_date < func.now()).filter(
+            Quote.id == quote_id,
+            Quote.shipment_id == shipment_id
+        )
+    )
+    row = result.one_or_none()
+    if row is None:
+        return HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Quote not found")
+
+    quote_status, version, expired = row
+    if quote_status != "pending":
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Quote is already {quote_status}")
+    if expired:
+        # Expire it now rather than waiting for the sweeper
+        await db.execute(
+            update(Quote).where(Quote.id == quote_id, Quote.status == "pending").values(
+                status="expired", version=Quote.version + 1
+            ).execution_options(synchronize_session=False)
+        )
+        await bump_quote_version(db, [shipment_id])
+        await db.commit()
+        invalidate_quote_ranking(shipment_id)
+        return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quote has expired")
+    if expected_version is not None and version != expected_version:
+        return _conflict(f"Quote has changed (now at version {version}); reload it and retry")
+    return _conflict("Quote changed while it was being accepted; retry")
@@ -0,0 +1,83 @@
+import os
+from collections import deque
+from datetime import datetime, timezone
+from typing import Deque, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from utils.background import BackgroundWorker
+from quotes.models import Quote
+from quotes.ranking import bump_quote_version, invalidate_quote_ranking
+
+# Quotes expired per statement, and the pause between sweeps once caught up
+EXPIRY_BATCH_SIZE = int(os.getenv("QUOTE_EXPIRY_BATCH_SIZE", "1000"))
+EXPIRY_INTERVAL = float(os.getenv("QUOTE_EXPIRY_INTERVAL_SECONDS", "300"))
+# Per-run history kept for the stats endpoint
+RUN_HISTORY = 100
+
+
+async def expire_batch(db: AsyncSession, limit: int = EXPIRY_BATCH_SIZE) -> int:
+    """
+    Expire up to `limit` overdue pending quotes in one UPDATE and commit.
+    PostgreSQL has no UPDATE ... LIMIT, so the batch is picked by a subquery
+    that walks ix_quotes_pending_validity; SKIP LOCKED keeps it from waiting
+    on a quote someone is accepting right now. Returns the rows expired.
+    """
+    due = select(Quote.id).filter(
+        Quote.status == "pending",
+        Quote.validity_date < func.now()
+    ).order_by(Quote.validity_date).limit(limit).with_for_update(skip_locked=True)
+    result = await db.execute(
+        update(Quote).where(Quote.id.in_(due)).values(status="expired", version=Quote.version + 1).returning(
+            Quote.shipment_id
+        ).execution_options(synchronize_session=False)
+    )
+    shipment_ids = result.scalars().all()
+    await bump_quote_version(db, shipment_ids)
+    await db.commit()
+    for shipment_id in set(shipment_ids):
+        invalidate_quote_ranking(shipment_id)
+    return len(shipment_ids)
+
+
+class QuoteExpirySweeper(BackgroundWorker):
+    """
+    Marks pending quotes past their validity_date as expired, so lists and
+    counts don't carry them until someone tries to accept one. Works through
+    a backlog batch by batch, then sleeps EXPIRY_INTERVAL.
+    """
+
+    name = "quote-expiry-sweeper"
+
+    def __init__(self):
+        super().__init__()
+        self.last_run_at: Optional[datetime] = None
+        self.runs = 0
+        self.quotes_expired = 0
+        # (run time, quotes expired) of recent runs
+        self.history: Deque[Tuple[datetime, int]] = deque(maxlen=RUN_HISTORY)
+
+    async def run_once(self) -> float:
+        async with AsyncSessionLocal() as db:
+            expired = await expire_batch(db)
+        self.last_run_at = datetime.now(timezone.utc)
+        self.runs += 1
+        self.quotes_expired += expired
+        self.history.append((self.last_run_at, expired))
+        # A full batch means there is a backlog; keep going straight away
+        return 0 if expired >= EXPIRY_BATCH_SIZE else EXPIRY_INTERVAL
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "last_run_at": self.last_run_at,
+            "last_run_expired": self.history[-1][1] if self.history else 0,
+            "runs": self.runs,
+            "quotes_expired": self.quotes_expired,
+            "recent_runs": [{"ran_at": ran_at, "expired": expired} for ran_at, expired in self.history],
+        }
+
+
+quote_expiry_sweeper = QuoteExpirySweeper()
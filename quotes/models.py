@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, Float, Integer, DateTime, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, String, Text, Float, Integer, BigInteger, DateTime, Boolean, ForeignKey, Enum, Index, text
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -7,6 +7,21 @@ from database import Base
 
 class Quote(Base):
     __tablename__ = "quotes"
+    __table_args__ = (
+        # Expiry sweep: pending quotes by validity; the index stays as small as the pending set
+        Index(
+            "ix_quotes_pending_validity",
+            "validity_date",
+            postgresql_where=text("status = 'pending'")
+        ),
+        # At most one accepted quote per shipment, whatever path writes it
+        Index(
+            "ix_quotes_one_accepted_per_shipment",
+            "shipment_id",
+            unique=True,
+            postgresql_where=text("status = 'accepted'")
+        ),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
     shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), nullable=False)
@@ -44,6 +59,9 @@ class Quote(Base):
     remarks = Column(Text)
     terms_and_conditions = Column(Text)
     
+    # Bumped on every change; ORM flushes fail with StaleDataError if it moved underneath them
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
@@ -52,6 +70,8 @@ class Quote(Base):
     shipment = relationship("Shipment", back_populates="quotes")
     forwarder = relationship("User", foreign_keys=[forwarder_id])
     
+    __mapper_args__ = {"version_id_col": version}
+    
     def calculate_total(self):
         """Calculate total amount"""
         self.total_amount_usd = (
@@ -72,3 +92,13 @@ class Quote(Base):
         """Get forwarder company from relationship"""
         return self.forwarder.company_name if self.forwarder else ""
 
+class ShipmentQuoteVersion(Base):
+    """
+    Per-shipment counter bumped in the same transaction as every write to the
+    shipment's quotes (quotes.ranking.bump_quote_version); the ranking cache
+    is keyed on it, so a lookup is one primary-key read.
+    """
+    __tablename__ = "shipment_quote_versions"
+    
+    shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), primary_key=True)
+    version = Column(BigInteger, nullable=False, default=1)
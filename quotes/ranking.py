@@ -0,0 +1,182 @@
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, List, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from quotes.models import Quote, ShipmentQuoteVersion
+from quotes.schemas import QuoteRankingResponse, RankedQuote, RankingWeights, ScoreBreakdown
+from utils.cache import TTLCache
+from utils.loaders import Loaders
+
+# Order of the criterion columns in the score matrix; matches RankingWeights
+CRITERIA = ("price", "transit_time", "free_days", "validity")
+
+# A shipment's pending quotes, as columns, keyed by shipment and its quote
+# version (ShipmentQuoteVersion), read on every request: a write from another
+# worker, or a load that finishes after an invalidation, can't serve stale
+# columns under the current version. Validity is scored at request time. No
+# stale window: a refresh would need the request's session
+quote_ranking_cache = TTLCache("quote_ranking", maxsize=2048, ttl=5 * 60, stale_ttl=0)
+
+
+@dataclass
+class QuoteColumns:
+    quote_ids: List[str]
+    forwarder_ids: List[str]
+    total_amount: np.ndarray
+    transit_days: np.ndarray  # NaN where unknown
+    free_days: np.ndarray
+    valid_until: np.ndarray  # epoch seconds, NaN where unknown
+
+
+def invalidate_quote_ranking(shipment_id) -> None:
+    """Frees this worker's entries for the shipment early; the quote version is what keeps reads correct"""
+    shipment_key = str(shipment_id)
+    quote_ranking_cache.invalidate(match=lambda key: key[0] == shipment_key)
+
+
+async def bump_quote_version(db: AsyncSession, shipment_ids: Iterable) -> None:
+    """
+    Move the shipments' quote versions on; doesn't commit. Call in the same
+    transaction as every write to their quotes, last before commit, since the
+    version rows stay locked until then. Ids are upserted sorted so batches
+    can't deadlock.
+    """
+    ids = sorted(set(shipment_ids), key=str)
+    if not ids:
+        return
+    table = ShipmentQuoteVersion.__table__
+    stmt = insert(table).values([{"shipment_id": shipment_id, "version": 1} for shipment_id in ids])
+    await db.execute(stmt.on_conflict_do_update(
+        index_elements=[table.c.shipment_id],
+        set_={"version": table.c.version + 1}
+    ))
+
+
+async def _quote_version(db: AsyncSession, shipment_id: str) -> int:
+    version = await db.scalar(
+        select(ShipmentQuoteVersion.version).filter(ShipmentQuoteVersion.shipment_id == shipment_id)
+    )
+    return version or 0
+
+
+async def _load_columns(db: AsyncSession, shipment_id: str) -> QuoteColumns:
+    result = await db.execute(
+        select(
+            Quote.id,
+            Quote.forwarder_id,
+            Quote.total_amount_usd,
+            Quote.transit_time_days,
+            Quote.free_days_at_destination,
+            Quote.validity_date
+        ).filter(Quote.shipment_id == shipment_id, Quote.status == "pending")
+    )
+    rows = result.all()
+    return QuoteColumns(
+        quote_ids=[str(row[0]) for row in rows],
+        forwarder_ids=[str(row[1]) for row in rows],
+        total_amount=np.array([row[2] for row in rows], dtype=np.float64),
+        transit_days=np.array([np.nan if row[3] is None else row[3] for row in rows], dtype=np.float64),
+        free_days=np.array([np.nan if row[4] is None else row[4] for row in rows], dtype=np.float64),
+        valid_until=np.array([np.nan if row[5] is None else row[5].timestamp() for row in rows], dtype=np.float64)
+    )
+
+
+def _scale(values: np.ndarray, higher_is_better: bool) -> np.ndarray:
+    """Min-max scale to [0, 1] with 1 best; unknown values score 0, and a tie scores 1"""
+    known = np.isfinite(values)
+    scaled = np.zeros_like(values)
+    if not known.any():
+        return scaled
+    lo, hi = values[known].min(), values[known].max()
+    if hi == lo:
+        scaled[known] = 1.0
+        return scaled
+    scaled[known] = (values[known] - lo) / (hi - lo)
+    if not higher_is_better:
+        scaled[known] = 1.0 - scaled[known]
+    return scaled
+
+
+def score_quotes(columns: QuoteColumns, weights: np.ndarray, now: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Score the quotes that are still valid at `now`. Returns their indices, the
+    scores and the (n, len(CRITERIA)) matrix of weighted contributions.
+    """
+    remaining = columns.valid_until - now
+    live = np.flatnonzero(~(remaining <= 0))  # unknown validity stays eligible
+    criteria = np.column_stack([
+        _scale(columns.total_amount[live], higher_is_better=False),
+        _scale(columns.transit_days[live], higher_is_better=False),
+        _scale(columns.free_days[live], higher_is_better=True),
+        _scale(remaining[live], higher_is_better=True),
+    ]) if len(live) else np.zeros((0, len(CRITERIA)))
+    contributions = criteria * weights
+    return live, contributions.sum(axis=1), contributions
+
+
+def top_k(scores: np.ndarray, tiebreak: np.ndarray, k: int) -> np.ndarray:
+    """Positions of the k best scores, best first; ties go to the lower `tiebreak`"""
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((tiebreak[candidates], -scores[candidates]))
+    return candidates[order]
+
+
+async def rank_quotes(
+    db: AsyncSession,
+    loaders: Loaders,
+    shipment_id: str,
+    weights: RankingWeights,
+    k: int
+) -> QuoteRankingResponse:
+    vector = np.array([getattr(weights, name) for name in CRITERIA], dtype=np.float64)
+    if vector.sum() <= 0:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="At least one ranking weight must be positive"
+        )
+    vector /= vector.sum()
+
+    # Read before the columns: a write landing in between only caches newer columns under the older version
+    version = await _quote_version(db, shipment_id)
+    columns = await quote_ranking_cache.get_or_fetch(
+        (str(shipment_id), version), lambda: _load_columns(db, shipment_id)
+    )
+    live, scores, contributions = score_quotes(columns, vector, time.time())
+    best = top_k(scores, columns.total_amount[live], k)
+
+    forwarders = await loaders.users.load_many(columns.forwarder_ids[live[i]] for i in best)
+    ranked = []
+    for rank, (i, forwarder) in enumerate(zip(best.tolist(), forwarders), start=1):
+        q = int(live[i])
+        ranked.append(RankedQuote(
+            rank=rank,
+            quote_id=columns.quote_ids[q],
+            forwarder_id=columns.forwarder_ids[q],
+            forwarder_name=forwarder.name if forwarder else "Unknown",
+            forwarder_company=forwarder.company_name if forwarder else "Unknown",
+            total_amount_usd=float(columns.total_amount[q]),
+            transit_time_days=None if np.isnan(columns.transit_days[q]) else int(columns.transit_days[q]),
+            free_days_at_destination=None if np.isnan(columns.free_days[q]) else int(columns.free_days[q]),
+            validity_date=None if np.isnan(columns.valid_until[q]) else datetime.fromtimestamp(columns.valid_until[q], timezone.utc),
+            score=round(float(scores[i]), 4),
+            breakdown=ScoreBreakdown(**{
+                name: round(float(value), 4) for name, value in zip(CRITERIA, contributions[i])
+            })
+        ))
+
+    return QuoteRankingResponse(
+        shipment_id=str(shipment_id),
+        weights=RankingWeights(**{name: float(value) for name, value in zip(CRITERIA, vector)}),
+        ranked_quotes=len(live),
+        quotes=ranked
+    )
@@ -1,27 +1,42 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
-from datetime import datetime
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.orm.exc import StaleDataError
+from typing import List, Optional
 
-from database import get_db
+from database import get_async_db
 from auth.dependencies import require_supplier, require_forwarder, get_current_user
 from auth.models import User
-from shipments.models import Shipment
 from quotes.models import Quote
-from quotes.schemas import QuoteCreate, QuoteResponse, QuoteUpdate
+from quotes.schemas import QuoteCreate, QuoteResponse, QuoteUpdate, QuoteRankingResponse, RankingWeights
+from quotes.ranking import bump_quote_version, invalidate_quote_ranking, rank_quotes
+from quotes.expiry import quote_expiry_sweeper
+from quotes.acceptance import accept_pending_quote
+from notifications.dispatcher import notify_quote_accepted
+from utils.loaders import Loaders, get_loaders
 
 router = APIRouter()
 
+def _quote_response(quote: Quote, forwarder: Optional[User]) -> QuoteResponse:
+    # Attach the batch-loaded forwarder so the response never triggers a lazy load
+    set_committed_value(quote, "forwarder", forwarder)
+    quote_data = QuoteResponse.from_orm(quote)
+    quote_data.forwarder_name = forwarder.name if forwarder else "Unknown"
+    quote_data.forwarder_company = forwarder.company_name if forwarder else "Unknown"
+    return quote_data
+
 @router.get("/shipments/{shipment_id}/quotes", response_model=List[QuoteResponse])
 async def get_shipment_quotes(
     shipment_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Get all quotes for a shipment
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -37,39 +52,79 @@ async def get_shipment_quotes(
     
     if current_user.role == "forwarder":
         # Forwarders can only see their own quotes
-        quotes = db.query(Quote).filter(
-            Quote.shipment_id == shipment_id,
-            Quote.forwarder_id == current_user.id
-        ).all()
+        result = await db.execute(
+            select(Quote).filter(
+                Quote.shipment_id == shipment_id,
+                Quote.forwarder_id == current_user.id
+            )
+        )
     else:
         # Supplier sees all quotes
-        quotes = db.query(Quote).filter(
-            Quote.shipment_id == shipment_id
-        ).all()
+        result = await db.execute(
+            select(Quote).filter(
+                Quote.shipment_id == shipment_id
+            )
+        )
+    quotes = result.scalars().all()
+    
+    # All forwarders in one query, however many quotes there are
+    forwarders = await loaders.users.load_many(quote.forwarder_id for quote in quotes)
+    return [_quote_response(quote, forwarder) for quote, forwarder in zip(quotes, forwarders)]
+
+@router.get("/shipments/{shipment_id}/quotes/ranking", response_model=QuoteRankingResponse)
+async def get_quote_ranking(
+    shipment_id: str,
+    k: int = Query(10, ge=1, le=500, description="Number of top quotes to return"),
+    price_weight: float = Query(0.5, ge=0),
+    transit_weight: float = Query(0.25, ge=0),
+    free_days_weight: float = Query(0.15, ge=0),
+    validity_weight: float = Query(0.10, ge=0),
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    Rank a shipment's pending, unexpired quotes: cheaper, faster, more free days
+    and longer validity score higher. Weights are relative and normalized;
+    each quote carries its per-criterion contribution to the score.
+    """
+    shipment = await loaders.shipments.load(shipment_id)
+    if not shipment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shipment not found"
+        )
     
-    # Add forwarder details to response
-    result = []
-    for quote in quotes:
-        forwarder = db.query(User).filter(User.id == quote.forwarder_id).first()
-        quote_data = QuoteResponse.from_orm(quote)
-        quote_data.forwarder_name = forwarder.name if forwarder else "Unknown"
-        quote_data.forwarder_company = forwarder.company_name if forwarder else "Unknown"
-        result.append(quote_data)
+    # Forwarders must not see how competitors' quotes compare
+    if current_user.role == "forwarder" or (
+        current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id)
+    ):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized to rank quotes for this shipment"
+        )
     
-    return result
+    weights = RankingWeights(
+        price=price_weight,
+        transit_time=transit_weight,
+        free_days=free_days_weight,
+        validity=validity_weight
+    )
+    return await rank_quotes(db, loaders, shipment.id, weights, k)
 
 @router.post("/shipments/{shipment_id}/accept-quote", response_model=QuoteResponse)
 async def accept_quote(
     shipment_id: str,
     quote_id: str,
-    background_tasks: BackgroundTasks,
+    version: Optional[int] = Query(None, description="Only accept if the quote is still at this version"),
     current_user: User = Depends(require_supplier),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Accept a quote (Supplier only)
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -82,75 +137,33 @@ async def accept_quote(
             detail="Not authorized to accept quotes for this shipment"
         )
     
-    quote = db.query(Quote).filter(
-        Quote.id == quote_id,
-        Quote.shipment_id == shipment_id
-    ).first()
+    quote = await accept_pending_quote(db, shipment, quote_id, version)
     
-    if not quote:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Quote not found"
-        )
-    
-    if quote.status != "pending":
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=f"Quote is already {quote.status}"
-        )
-    
-    # Check if quote is expired
-    if quote.validity_date and quote.validity_date < datetime.now():
-        quote.status = "expired"
-        db.commit()
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Quote has expired"
-        )
-    
-    # Update quote status
-    quote.status = "accepted"
-    
-    # Update shipment status
-    shipment.status = "quoted"
-    
-    # Reject all other pending quotes for this shipment
-    db.query(Quote).filter(
-        Quote.shipment_id == shipment_id,
-        Quote.id != quote_id,
-        Quote.status == "pending"
-    ).update({"status": "rejected"})
-    
-    db.commit()
-    db.refresh(quote)
-    
-    # Notify forwarder
-    background_tasks.add_task(
-        notify_quote_accepted,
+    # Notify forwarder (queued; sent as a digest)
+    notify_quote_accepted(
         str(quote.forwarder_id),
         str(quote.id),
         str(shipment_id)
     )
     
-    # Get forwarder details for response
-    forwarder = db.query(User).filter(User.id == quote.forwarder_id).first()
-    quote_data = QuoteResponse.from_orm(quote)
-    quote_data.forwarder_name = forwarder.name if forwarder else "Unknown"
-    quote_data.forwarder_company = forwarder.company_name if forwarder else "Unknown"
-    
-    return quote_data
+    forwarder = await loaders.users.load(quote.forwarder_id)
+    return _quote_response(quote, forwarder)
 
 @router.put("/quotes/{quote_id}", response_model=QuoteResponse)
 async def update_quote(
     quote_id: str,
     update_data: QuoteUpdate,
     current_user: User = Depends(require_forwarder),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Update quote (Forwarder only - for withdrawal, etc.)
     """
-    quote = db.query(Quote).filter(Quote.id == quote_id).first()
+    result = await db.execute(
+        select(Quote).filter(Quote.id == quote_id)
+    )
+    quote = result.scalar_one_or_none()
     if not quote:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -170,22 +183,35 @@ async def update_quote(
             detail="Cannot set quote to this status"
         )
     
+    if update_data.version is not None and update_data.version != quote.version:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Quote has changed (now at version {quote.version}); reload it and retry"
+        )
+    
     quote.status = update_data.status
     if update_data.remarks:
         quote.remarks = update_data.remarks
     
-    db.commit()
-    db.refresh(quote)
-    
-    # Get forwarder details for response
-    forwarder = db.query(User).filter(User.id == quote.forwarder_id).first()
-    quote_data = QuoteResponse.from_orm(quote)
-    quote_data.forwarder_name = forwarder.name if forwarder else "Unknown"
-    quote_data.forwarder_company = forwarder.company_name if forwarder else "Unknown"
+    try:
+        # Flushes the quote first, so a concurrent change surfaces here too
+        await bump_quote_version(db, [quote.shipment_id])
+        await db.commit()
+    except StaleDataError:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Quote was changed by another request; reload it and retry"
+        )
+    invalidate_quote_ranking(quote.shipment_id)
+    await db.refresh(quote, ["status", "remarks", "updated_at", "version"])
     
-    return quote_data
+    forwarder = await loaders.users.load(quote.forwarder_id)
+    return _quote_response(quote, forwarder)
 
-async def notify_quote_accepted(forwarder_id: str, quote_id: str, shipment_id: str):
-    """Background task to notify forwarder"""
-    # Implement notification logic (email, push, etc.)
-    print(f"Quote {quote_id} accepted for shipment {shipment_id}. Forwarder: {forwarder_id}")
+@router.get("/quotes/expiry/stats")
+async def get_quote_expiry_stats():
+    """
+    Quotes expired per sweeper run, and totals since startup
+    """
+    return quote_expiry_sweeper.stats()
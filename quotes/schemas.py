@@ -43,6 +43,7 @@ class QuoteCreate(BaseModel):
 class QuoteUpdate(BaseModel):
     status: QuoteStatus
     remarks: Optional[str] = None
+    version: Optional[int] = Field(None, description="Only apply if the quote is still at this version")
 
 class QuoteResponse(BaseModel):
     id: str
@@ -71,9 +72,42 @@ class QuoteResponse(BaseModel):
     status: QuoteStatus
     remarks: Optional[str]
     terms_and_conditions: Optional[str]
+    version: int
     
     created_at: datetime
     updated_at: Optional[datetime]
     
     class Config:
         from_attributes = True
+
+class RankingWeights(BaseModel):
+    price: float = Field(0.5, ge=0)
+    transit_time: float = Field(0.25, ge=0)
+    free_days: float = Field(0.15, ge=0)
+    validity: float = Field(0.10, ge=0)
+
+class ScoreBreakdown(BaseModel):
+    # Weighted contribution of each criterion; they add up to the score
+    price: float
+    transit_time: float
+    free_days: float
+    validity: float
+
+class RankedQuote(BaseModel):
+    rank: int
+    quote_id: str
+    forwarder_id: str
+    forwarder_name: str
+    forwarder_company: str
+    total_amount_usd: float
+    transit_time_days: Optional[int]
+    free_days_at_destination: Optional[int]
+    validity_date: Optional[datetime]
+    score: float
+    breakdown: ScoreBreakdown
+
+class QuoteRankingResponse(BaseModel):
+    shipment_id: str
+    weights: RankingWeights  # normalized to sum to 1
+    ranked_quotes: int  # pending, unexpired quotes considered
+    quotes: List[RankedQuote]
@@ -1,5 +1,5 @@
-from sqlalchemy.orm import Session
-from sqlalchemy import func
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import func, select
 from typing import Optional, List
 import uuid
 from datetime import datetime
@@ -10,10 +10,10 @@ from auth.models import User
 from utils.helpers import generate_shipment_number
 
 class ShipmentService:
-    def __init__(self, db: Session):
+    def __init__(self, db: AsyncSession):
         self.db = db
     
-    def create_shipment(
+    async def create_shipment(
         self, 
         supplier_id: str, 
         buyer_id: str, 
@@ -53,48 +53,50 @@ class ShipmentService:
         )
         
         self.db.add(shipment)
-        self.db.commit()
-        self.db.refresh(shipment)
+        await self.db.commit()
+        await self.db.refresh(shipment)
         
         return shipment
     
-    def get_shipment_by_id(self, shipment_id: str) -> Optional[Shipment]:
+    async def get_shipment_by_id(self, shipment_id: str) -> Optional[Shipment]:
         """Get shipment by ID"""
-        return self.db.query(Shipment).filter(Shipment.id == shipment_id).first()
+        return await self.db.get(Shipment, shipment_id)
     
-    def get_supplier_shipments(
+    async def get_supplier_shipments(
         self, 
         supplier_id: str, 
         status_filter: Optional[str] = None
     ) -> List[Shipment]:
         """Get all shipments for a supplier"""
-        query = self.db.query(Shipment).filter(Shipment.supplier_id == supplier_id)
+        query = select(Shipment).filter(Shipment.supplier_id == supplier_id)
         
         if status_filter:
             query = query.filter(Shipment.status == status_filter)
         
-        return query.order_by(Shipment.created_at.desc()).all()
+        result = await self.db.execute(query.order_by(Shipment.created_at.desc()))
+        return result.scalars().all()
     
-    def get_buyer_shipments(
+    async def get_buyer_shipments(
         self, 
         buyer_id: str, 
         status_filter: Optional[str] = None
     ) -> List[Shipment]:
         """Get all shipments for a buyer"""
-        query = self.db.query(Shipment).filter(Shipment.buyer_id == buyer_id)
+        query = select(Shipment).filter(Shipment.buyer_id == buyer_id)
         
         if status_filter:
             query = query.filter(Shipment.status == status_filter)
         
-        return query.order_by(Shipment.created_at.desc()).all()
+        result = await self.db.execute(query.order_by(Shipment.created_at.desc()))
+        return result.scalars().all()
     
-    def update_shipment(
+    async def update_shipment(
         self, 
         shipment_id: str, 
         update_data: ShipmentUpdate
     ) -> Shipment:
         """Update shipment details"""
-        shipment = self.get_shipment_by_id(shipment_id)
+        shipment = await self.get_shipment_by_id(shipment_id)
         
         if not shipment:
             return None
@@ -105,12 +107,12 @@ class ShipmentService:
                 setattr(shipment, field, value)
         
         shipment.updated_at = datetime.now()
-        self.db.commit()
-        self.db.refresh(shipment)
+        await self.db.commit()
+        await self.db.refresh(shipment)
         
         return shipment
     
-    def get_shipments_for_forwarder(
+    async def get_shipments_for_forwarder(
         self, 
         forwarder_id: str,
         status_filter: Optional[str] = None
@@ -119,7 +121,7 @@ class ShipmentService:
         from quotes.models import Quote
         
         query = (
-            self.db.query(Shipment)
+            select(Shipment)
             .join(Quote, Quote.shipment_id == Shipment.id)
             .filter(Quote.forwarder_id == forwarder_id)
         )
@@ -127,15 +129,16 @@ class ShipmentService:
         if status_filter:
             query = query.filter(Shipment.status == status_filter)
         
-        return query.order_by(Shipment.created_at.desc()).all()
+        result = await self.db.execute(query.order_by(Shipment.created_at.desc()))
+        return result.scalars().all()
     
-    def update_shipment_from_document(
+    async def update_shipment_from_document(
         self,
         shipment_id: str,
         extracted_data: dict
     ) -> List[str]:
         """Update shipment fields from extracted document data"""
-        shipment = self.get_shipment_by_id(shipment_id)
+        shipment = await self.get_shipment_by_id(shipment_id)
         
         if not shipment:
             return []
@@ -174,6 +177,6 @@ class ShipmentService:
         
         if updated_fields:
             shipment.updated_at = datetime.now()
-            self.db.commit()
+            await self.db.commit()
         
         return updated_fields
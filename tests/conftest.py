@@ -0,0 +1,50 @@
+"""
+Tests that need PostgreSQL run against DATABASE_URL and are skipped when it
+isn't set. They seed their own shipments and quotes and delete them again;
+the users they hang off are borrowed from the database.
+"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def run():
+    """
+    Run a coroutine to completion. The engine's pooled connections belong to
+    the loop that opened them, so the pool is disposed before the loop closes.
+    """
+    from database import async_engine
+
+    def _run(coro):
+        async def _main():
+            try:
+                return await coro
+            finally:
+                await async_engine.dispose()
+
+        return asyncio.run(_main())
+
+    return _run
+
+
+@pytest.fixture
+def user_id(run):
+    """An existing user to own the seeded rows"""
+    from sqlalchemy import select
+
+    from auth.models import User
+    from database import AsyncSessionLocal
+
+    async def _first_user():
+        async with AsyncSessionLocal() as db:
+            return (await db.execute(select(User.id).limit(1))).scalar_one_or_none()
+
+    found = run(_first_user())
+    if found is None:
+        pytest.skip("The test database has no users")
+    return found
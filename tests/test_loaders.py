@@ -0,0 +1,122 @@
+import asyncio
+import os
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import delete, event, insert, select
+
+from auth.models import User
+from database import AsyncSessionLocal, async_engine
+from quotes.models import Quote
+from quotes.router import get_shipment_quotes
+from shipments.models import Shipment
+from utils.helpers import generate_shipment_number
+from utils.loaders import Loaders
+
+# Shipment, its quotes, and their forwarders in one batch
+EXPECTED_QUERIES = 3
+
+
+@contextmanager
+def count_statements():
+    counter = {"statements": 0}
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        counter["statements"] += 1
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(async_engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+
+
+async def _seed_shipment(owner_id, forwarder_ids, quotes: int):
+    async with AsyncSessionLocal() as db:
+        shipment = Shipment(
+            shipment_number=generate_shipment_number(),
+            supplier_id=owner_id,
+            buyer_id=owner_id,
+            origin_port="INNSA",
+            destination_port="USLAX",
+            incoterm="FOB",
+            cargo_type="FCL",
+            container_type="40HC",
+            container_qty=1,
+            goods_description="Batch loader test",
+            status="draft"
+        )
+        db.add(shipment)
+        await db.flush()
+        await db.execute(insert(Quote), [
+            {
+                "id": uuid.uuid4(),
+                "shipment_id": shipment.id,
+                "forwarder_id": forwarder_ids[i % len(forwarder_ids)],
+                "freight_amount_usd": 1000.0 + i,
+                "total_amount_usd": 1000.0 + i,
+                "validity_date": datetime.now(timezone.utc) + timedelta(days=7),
+                "transit_time_days": 20,
+                "status": "pending"
+            }
+            for i in range(quotes)
+        ])
+        await db.commit()
+        return shipment.id
+
+
+async def _cleanup(shipment_id) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Quote).filter(Quote.shipment_id == shipment_id))
+        await db.execute(delete(Shipment).filter(Shipment.id == shipment_id))
+        await db.commit()
+
+
+async def _quotes_endpoint_statements(user_id, quotes: int) -> tuple:
+    async with AsyncSessionLocal() as db:
+        forwarder_ids = (await db.execute(select(User.id).limit(10))).scalars().all()
+    shipment_id = await _seed_shipment(user_id, forwarder_ids, quotes)
+    try:
+        supplier = SimpleNamespace(id=user_id, role="supplier")
+        async with AsyncSessionLocal() as db:
+            with count_statements() as counter:
+                response = await get_shipment_quotes(str(shipment_id), supplier, db, Loaders(db))
+        return len(response), counter["statements"]
+    finally:
+        await _cleanup(shipment_id)
+
+
+@pytest.mark.parametrize("quotes", [1, 5, 25])
+def test_shipment_quotes_query_count_is_constant(run, user_id, quotes):
+    returned, statements = run(_quotes_endpoint_statements(user_id, quotes))
+
+    assert returned == quotes
+    assert statements == EXPECTED_QUERIES
+
+
+def test_gathered_loads_share_one_query(run, user_id):
+    async def scenario():
+        async with AsyncSessionLocal() as db:
+            loaders = Loaders(db)
+            missing = uuid.uuid4()
+            with count_statements() as counter:
+                found, again, absent = await asyncio.gather(
+                    loaders.users.load(user_id), loaders.users.load(user_id), loaders.users.load(missing)
+                )
+                # Answered from the request's cache, misses included
+                await loaders.users.load_many([user_id, missing])
+            return found, again, absent, counter["statements"]
+
+    found, again, absent, statements = run(scenario())
+
+    assert found is again
+    assert str(found.id) == str(user_id)
+    assert absent is None
+    assert statements == 1
@@ -0,0 +1,124 @@
+import asyncio
+import os
+import uuid
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+
+from database import AsyncSessionLocal
+from quotes.acceptance import accept_pending_quote
+from quotes.models import Quote, ShipmentQuoteVersion
+from shipments.models import Shipment
+from utils.helpers import generate_shipment_number
+
+QUOTES = 5
+CONCURRENCY = 20
+
+
+async def _seed_shipment(user_id) -> tuple:
+    async with AsyncSessionLocal() as db:
+        shipment = Shipment(
+            shipment_number=generate_shipment_number(),
+            supplier_id=user_id,
+            buyer_id=user_id,
+            origin_port="INNSA",
+            destination_port="USLAX",
+            incoterm="FOB",
+            cargo_type="FCL",
+            container_type="40HC",
+            container_qty=1,
+            goods_description="Quote acceptance test",
+            status="draft"
+        )
+        db.add(shipment)
+        await db.flush()
+        quote_ids = [uuid.uuid4() for _ in range(QUOTES)]
+        await db.execute(insert(Quote), [
+            {
+                "id": quote_id,
+                "shipment_id": shipment.id,
+                "forwarder_id": user_id,
+                "freight_amount_usd": 1000.0 + i,
+                "total_amount_usd": 1000.0 + i,
+                "validity_date": datetime.now(timezone.utc) + timedelta(days=7),
+                "transit_time_days": 20,
+                "status": "pending"
+            }
+            for i, quote_id in enumerate(quote_ids)
+        ])
+        await db.commit()
+        return shipment.id, quote_ids
+
+
+async def _cleanup(shipment_id) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Quote).filter(Quote.shipment_id == shipment_id))
+        await db.execute(delete(ShipmentQuoteVersion).filter(ShipmentQuoteVersion.shipment_id == shipment_id))
+        await db.execute(delete(Shipment).filter(Shipment.id == shipment_id))
+        await db.commit()
+
+
+async def _attempt(shipment_id, quote_id) -> str:
+    async with AsyncSessionLocal() as db:
+        shipment = await db.get(Shipment, shipment_id)
+        try:
+            await accept_pending_quote(db, shipment, quote_id)
+            return "accepted"
+        except HTTPException as e:
+            return str(e.status_code)
+
+
+def test_parallel_accepts_accept_exactly_one_quote(run, user_id):
+    async def scenario():
+        shipment_id, quote_ids = await _seed_shipment(user_id)
+        try:
+            outcomes = Counter(await asyncio.gather(*(
+                _attempt(shipment_id, quote_ids[i % QUOTES]) for i in range(CONCURRENCY)
+            )))
+            async with AsyncSessionLocal() as db:
+                result = await db.execute(
+                    select(Quote.status, func.count()).filter(Quote.shipment_id == shipment_id).group_by(Quote.status)
+                )
+                statuses = dict(result.all())
+                shipment_status = (await db.execute(
+                    select(Shipment.status).filter(Shipment.id == shipment_id)
+                )).scalar_one()
+            return outcomes, statuses, shipment_status
+        finally:
+            await _cleanup(shipment_id)
+
+    outcomes, statuses, shipment_status = run(scenario())
+
+    assert outcomes["accepted"] == 1
+    # Losers either lost the claim (409) or found their quote already rejected (400)
+    assert set(outcomes) <= {"accepted", "409", "400"}
+    assert statuses == {"accepted": 1, "rejected": QUOTES - 1}
+    assert shipment_status == "quoted"
+
+
+def test_accept_with_stale_version_conflicts(run, user_id):
+    async def scenario():
+        shipment_id, quote_ids = await _seed_shipment(user_id)
+        try:
+            async with AsyncSessionLocal() as db:
+                shipment = await db.get(Shipment, shipment_id)
+                quote = await db.get(Quote, quote_ids[0])
+                with pytest.raises(HTTPException) as exc_info:
+                    await accept_pending_quote(db, shipment, quote_ids[0], expected_version=quote.version + 1)
+            async with AsyncSessionLocal() as db:
+                status = (await db.execute(select(Quote.status).filter(Quote.id == quote_ids[0]))).scalar_one()
+            return exc_info.value.status_code, status
+        finally:
+            await _cleanup(shipment_id)
+
+    status_code, status = run(scenario())
+
+    assert status_code == 409
+    assert status == "pending"
@@ -0,0 +1,100 @@
+import asyncio
+import os
+
+import pytest
+
+if not os.getenv("DATABASE_URL"):
+    pytest.skip("DATABASE_URL is not set", allow_module_level=True)
+
+from sqlalchemy import delete, insert, select
+
+from database import AsyncSessionLocal
+from shipments.models import Shipment
+from tracking.models import ShipmentTrackingSummary, TrackingEvent
+from tracking.summary import lock_shipment_events
+from utils.helpers import generate_shipment_number
+
+# How long the second writer is given to (wrongly) get past the first one's lock
+BLOCKED_FOR_SECONDS = 0.5
+
+
+async def _seed_shipment(user_id):
+    async with AsyncSessionLocal() as db:
+        shipment = Shipment(
+            shipment_number=generate_shipment_number(),
+            supplier_id=user_id,
+            buyer_id=user_id,
+            origin_port="INNSA",
+            destination_port="USLAX",
+            incoterm="FOB",
+            cargo_type="FCL",
+            container_type="40HC",
+            container_qty=1,
+            goods_description="Tracking feed test",
+            status="booked"
+        )
+        db.add(shipment)
+        await db.commit()
+        return shipment.id
+
+
+async def _cleanup(shipment_id) -> None:
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(TrackingEvent).filter(TrackingEvent.shipment_id == shipment_id))
+        await db.execute(delete(ShipmentTrackingSummary).filter(ShipmentTrackingSummary.shipment_id == shipment_id))
+        await db.execute(delete(Shipment).filter(Shipment.id == shipment_id))
+        await db.commit()
+
+
+async def _insert_event(db, shipment_id, event_status: str) -> int:
+    await lock_shipment_events(db, [shipment_id])
+    result = await db.execute(
+        insert(TrackingEvent).values(shipment_id=shipment_id, status=event_status).returning(TrackingEvent.seq)
+    )
+    return result.scalar_one()
+
+
+async def _poll(shipment_id, position: int) -> list:
+    """What a client holding cursor `position` is sent next"""
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(TrackingEvent.seq, TrackingEvent.status).filter(
+                TrackingEvent.shipment_id == shipment_id,
+                TrackingEvent.seq > position
+            ).order_by(TrackingEvent.seq)
+        )
+        return result.all()
+
+
+def test_concurrent_writers_commit_in_seq_order(run, user_id):
+    async def scenario():
+        shipment_id = await _seed_shipment(user_id)
+        try:
+            async with AsyncSessionLocal() as first:
+                first_seq = await _insert_event(first, shipment_id, "in_transit")
+
+                async def second_writer():
+                    async with AsyncSessionLocal() as second:
+                        seq = await _insert_event(second, shipment_id, "arrived")
+                        await second.commit()
+                        return seq
+
+                second = asyncio.create_task(second_writer())
+                done, _ = await asyncio.wait({second}, timeout=BLOCKED_FOR_SECONDS)
+                # Without the lock the second event would commit here, and a
+                # client polling now would move its cursor past the first one
+                polled_while_open = await _poll(shipment_id, 0)
+                await first.commit()
+            second_seq = await second
+            position = polled_while_open[-1][0] if polled_while_open else 0
+            polled_after = await _poll(shipment_id, position)
+            return done, polled_while_open, polled_after, first_seq, second_seq
+        finally:
+            await _cleanup(shipment_id)
+
+    done, polled_while_open, polled_after, first_seq, second_seq = run(scenario())
+
+    assert not done
+    assert polled_while_open == []
+    assert first_seq < second_seq
+    assert polled_after == [(first_seq, "in_transit"), (second_seq, "arrived")]
@@ -0,0 +1,238 @@
+import argparse
+import asyncio
+import contextlib
+import importlib.util
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import any_, bindparam, delete, insert, select, update
+from sqlalchemy.dialects.postgresql import ARRAY, UUID
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import AsyncSessionLocal
+from utils.background import BackgroundWorker
+from tracking.models import ShipmentTrackingSummary, TrackingEvent, TrackingEventArchive
+
+# Parquet support needs the optional `pyarrow` package
+PARQUET_AVAILABLE = importlib.util.find_spec("pyarrow") is not None
+
+TRACKING_ARCHIVE_PATH = os.getenv("TRACKING_ARCHIVE_PATH", os.path.join("archive", "tracking_events"))
+# Shipments delivered longer ago than this are moved out of tracking_events
+ARCHIVE_AFTER_DAYS = int(os.getenv("TRACKING_ARCHIVE_AFTER_DAYS", "180"))
+# Run the archiver inside the app (otherwise use `python -m tracking.archive`, e.g. from cron)
+TRACKING_ARCHIVE_ENABLED = os.getenv("TRACKING_ARCHIVE_ENABLED", "false").lower() == "true"
+# Shipments moved per transaction, and the pause between runs once caught up
+ARCHIVE_BATCH_SHIPMENTS = 500
+ARCHIVE_INTERVAL = 24 * 60 * 60.0
+
+ARCHIVED_COLUMNS = (
+    "id", "seq", "shipment_id", "created_by", "status", "location", "vessel_name", "voyage_number",
+    "container_number", "description", "remarks", "estimated_datetime", "actual_datetime",
+    "documents", "is_milestone", "verified", "timestamp", "updated_at",
+)
+
+
+def _parquet_schema():
+    import pyarrow as pa
+
+    ts = pa.timestamp("us", tz="UTC")
+    return pa.schema([
+        ("id", pa.string()),
+        ("seq", pa.int64()),
+        ("shipment_id", pa.string()),
+        ("created_by", pa.string()),
+        ("status", pa.string()),
+        ("location", pa.string()),
+        ("vessel_name", pa.string()),
+        ("voyage_number", pa.string()),
+        ("container_number", pa.string()),
+        ("description", pa.string()),
+        ("remarks", pa.string()),
+        ("estimated_datetime", ts),
+        ("actual_datetime", ts),
+        ("documents", pa.list_(pa.string())),
+        ("is_milestone", pa.bool_()),
+        ("verified", pa.bool_()),
+        ("timestamp", ts),
+        ("updated_at", ts),
+    ])
+
+
+def _write_partition(partition: str, records: List[dict]) -> str:
+    """Write one month's events to a new file; returns its path relative to the archive root"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    # Sorted by shipment so per-shipment reads only touch the matching row groups
+    records.sort(key=lambda r: (r["shipment_id"], r["seq"]))
+    relative = os.path.join(f"month={partition}", f"part-{uuid.uuid4().hex}.parquet")
+    path = os.path.join(TRACKING_ARCHIVE_PATH, relative)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    table = pa.Table.from_pylist(records, schema=_parquet_schema())
+    # Write under a temporary name so a crash never leaves a truncated file in place
+    pq.write_table(table, path + ".tmp", compression="zstd", row_group_size=10000)
+    os.replace(path + ".tmp", path)
+    return relative
+
+
+def _read_shipment(relative: str, shipment_id: str) -> List[dict]:
+    import pyarrow.parquet as pq
+
+    table = pq.read_table(
+        os.path.join(TRACKING_ARCHIVE_PATH, relative),
+        filters=[("shipment_id", "==", shipment_id)]
+    )
+    return table.to_pylist()
+
+
+async def read_archived_events(db: AsyncSession, shipment_id) -> List[dict]:
+    """A shipment's archived events as dicts (oldest first); empty if it was never archived"""
+    entry = await db.get(TrackingEventArchive, shipment_id)
+    if entry is None:
+        return []
+    if not PARQUET_AVAILABLE:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Archived tracking history is unavailable (pyarrow is not installed)"
+        )
+    return await asyncio.to_thread(_read_shipment, entry.file_path, str(entry.shipment_id))
+
+
+async def archive_batch(db: AsyncSession, older_than_days: int = ARCHIVE_AFTER_DAYS) -> int:
+    """
+    Move the events of up to ARCHIVE_BATCH_SHIPMENTS long-delivered shipments
+    into monthly Parquet partitions. The shipments' summary rows are claimed
+    FOR UPDATE SKIP LOCKED until commit, so concurrent archivers (one per
+    worker) take disjoint batches. Files are written first and removed again
+    if recording them fails, leaving the events in place; only a failed
+    commit can leave an unreferenced file. Returns the number of shipments
+    archived.
+    """
+    if not PARQUET_AVAILABLE:
+        raise RuntimeError("Tracking archival needs the pyarrow package")
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    result = await db.execute(
+        select(
+            ShipmentTrackingSummary.shipment_id,
+            ShipmentTrackingSummary.actual_arrival,
+            ShipmentTrackingSummary.estimated_arrival
+        ).filter(
+            ShipmentTrackingSummary.actual_arrival < cutoff,
+            ~select(TrackingEventArchive.shipment_id).filter(
+                TrackingEventArchive.shipment_id == ShipmentTrackingSummary.shipment_id
+            ).exists()
+        ).order_by(ShipmentTrackingSummary.actual_arrival).limit(ARCHIVE_BATCH_SHIPMENTS).with_for_update(
+            skip_locked=True, of=ShipmentTrackingSummary
+        )
+    )
+    rows = result.all()
+    delivered = {shipment_id: arrival for shipment_id, arrival, _ in rows}
+    estimated = {shipment_id: estimate for shipment_id, _, estimate in rows}
+    if not delivered:
+        return 0
+
+    columns = [getattr(TrackingEvent, name) for name in ARCHIVED_COLUMNS]
+    result = await db.execute(select(*columns).filter(TrackingEvent.shipment_id.in_(delivered.keys())))
+
+    # Partition by delivery month so a shipment's whole history sits in one file
+    partitions: Dict[str, List[dict]] = defaultdict(list)
+    counts: Dict = defaultdict(int)
+    archived_ids: List = []
+    for row in result:
+        record = dict(zip(ARCHIVED_COLUMNS, row))
+        shipment_id = record["shipment_id"]
+        archived_ids.append(record["id"])
+        for key in ("id", "shipment_id", "created_by"):
+            record[key] = str(record[key]) if record[key] is not None else None
+        partitions[delivered[shipment_id].strftime("%Y-%m")].append(record)
+        counts[shipment_id] += 1
+
+    files: Dict[str, str] = {}
+    for partition, records in partitions.items():
+        files[partition] = await asyncio.to_thread(_write_partition, partition, records)
+
+    try:
+        await _record_archived(db, delivered, estimated, counts, files, archived_ids)
+    except BaseException:
+        for relative in files.values():
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(TRACKING_ARCHIVE_PATH, relative))
+        raise
+    # A failed commit may still have landed, so the files stay from here on
+    await db.commit()
+    return len(delivered)
+
+
+async def _record_archived(db: AsyncSession, delivered: Dict, estimated: Dict, counts: Dict,
+                           files: Dict[str, str], archived_ids: List) -> None:
+    """Point the shipments at their files and delete the archived events; doesn't commit"""
+    archived_at = datetime.now(timezone.utc)
+    await db.execute(insert(TrackingEventArchive), [
+        {
+            "shipment_id": shipment_id,
+            "partition": arrival.strftime("%Y-%m"),
+            "file_path": files.get(arrival.strftime("%Y-%m")),
+            "event_count": counts[shipment_id],
+            "estimated_arrival": estimated[shipment_id],
+            "actual_arrival": arrival,
+            "archived_at": archived_at
+        }
+        for shipment_id, arrival in delivered.items()
+        if shipment_id in counts
+    ])
+    # The ETA now comes from the archive, which always stands (see tracking.summary)
+    await db.execute(
+        update(ShipmentTrackingSummary).filter(
+            ShipmentTrackingSummary.shipment_id.in_(counts.keys()),
+            ShipmentTrackingSummary.estimated_arrival.is_not(None)
+        ).values(estimated_arrival_event_at=None)
+    )
+    # Only the rows written above: an event committed after the read stays hot
+    await db.execute(
+        delete(TrackingEvent).filter(
+            TrackingEvent.id == any_(bindparam("archived_ids", archived_ids, type_=ARRAY(UUID(as_uuid=True))))
+        )
+    )
+
+
+class TrackingArchiver(BackgroundWorker):
+    """Archives in batches until caught up, then sleeps for a day"""
+
+    name = "tracking-archiver"
+
+    def __init__(self):
+        super().__init__()
+        self.shipments_archived = 0
+        self.last_run_at: Optional[datetime] = None
+
+    async def run_once(self) -> float:
+        async with AsyncSessionLocal() as db:
+            archived = await archive_batch(db)
+        self.shipments_archived += archived
+        self.last_run_at = datetime.now(timezone.utc)
+        return 0 if archived >= ARCHIVE_BATCH_SHIPMENTS else ARCHIVE_INTERVAL
+
+
+tracking_archiver = TrackingArchiver()
+
+
+async def _archive_from_cli(older_than_days: int) -> None:
+    total = 0
+    async with AsyncSessionLocal() as db:
+        while True:
+            archived = await archive_batch(db, older_than_days)
+            total += archived
+            if archived < ARCHIVE_BATCH_SHIPMENTS:
+                break
+    print(f"Archived tracking events of {total} shipments to {TRACKING_ARCHIVE_PATH}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move long-delivered shipments' tracking events to Parquet")
+    parser.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="Archive shipments delivered more than this many days ago")
+    args = parser.parse_args()
+    asyncio.run(_archive_from_cli(args.days))
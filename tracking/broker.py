@@ -0,0 +1,317 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from typing import Dict, Iterable, Optional, Set
+
+# "local" (single worker), "postgres" (LISTEN/NOTIFY) or "redis" (pub/sub)
+TRACKING_BROKER_BACKEND = os.getenv("TRACKING_BROKER_BACKEND", "local").lower()
+# LISTEN needs a session-level connection, so point this at the direct port, not the transaction pooler
+# (defaults to DATABASE_URL)
+TRACKING_NOTIFY_DATABASE_URL = os.getenv("TRACKING_NOTIFY_DATABASE_URL")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+CHANNEL = "tracking_events"
+
+logger = logging.getLogger(__name__)
+
+# Events buffered per subscriber before it counts as a slow consumer and is evicted
+SUBSCRIBER_QUEUE_SIZE = 100
+# Idle gap after which streams send a keep-alive
+HEARTBEAT_SECONDS = 15.0
+# Backoff between attempts to re-open a dropped LISTEN connection
+RECONNECT_MIN_DELAY = 1.0
+RECONNECT_MAX_DELAY = 30.0
+# pg_notify rejects payloads of this many bytes or more; larger events are
+# announced by id and each worker reads the row back
+NOTIFY_PAYLOAD_LIMIT = 8000
+
+# Topic every event is published to; only admins subscribe to it
+ALL_TOPIC = "all"
+
+
+def shipment_topic(shipment_id) -> str:
+    return f"shipment:{shipment_id}"
+
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+
+class Subscription:
+    """One client's bounded view of the broker"""
+
+    EVICTED = object()
+
+    def __init__(self, topics: Set[str], maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.topics = topics
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.evicted = False
+
+    async def get(self, timeout: float = HEARTBEAT_SECONDS) -> Optional[dict]:
+        """Next event, None on an idle timeout; raises ConnectionAbortedError once evicted"""
+        try:
+            item = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if item is self.EVICTED:
+            raise ConnectionAbortedError("Subscriber fell too far behind and was disconnected")
+        return item
+
+    def offer(self, event: dict) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    def evict(self) -> None:
+        # Drop the backlog; the client resyncs from the REST endpoints on reconnect
+        self.evicted = True
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(self.EVICTED)
+
+
+class LocalBackend:
+    """Single-process deployments: publishing delivers straight to this worker's subscribers"""
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+
+    async def start(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    async def publish(self, message: dict) -> None:
+        self.deliver(message)
+
+
+class PostgresNotifyBackend:
+    """
+    Fans events out across workers with pg_notify; every worker LISTENs,
+    including the sender. If the LISTEN connection drops it is re-opened with
+    backoff; notifications sent in the gap are lost, and clients catch up from
+    the REST endpoints as after an eviction.
+
+    An event too large for a notification goes out as its id only, and is
+    delivered once read back from tracking_events, so it can reach
+    subscribers after events published later.
+    """
+
+    def __init__(self, deliver, dsn: Optional[str] = TRACKING_NOTIFY_DATABASE_URL):
+        self.deliver = deliver
+        self.dsn = dsn
+        self._conn = None
+        # One asyncpg connection can't run two commands at once
+        self._lock = asyncio.Lock()
+        self._reconnect_task: Optional[asyncio.Task] = None
+        self._fetches: Set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._stopping = False
+        await self._connect()
+
+    async def stop(self) -> None:
+        self._stopping = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+            try:
+                await self._reconnect_task
+            except asyncio.CancelledError:
+                pass
+            self._reconnect_task = None
+        for task in list(self._fetches):
+            task.cancel()
+        if self._conn is not None:
+            await self._conn.close()
+            self._conn = None
+
+    async def publish(self, message: dict) -> None:
+        if self._conn is None:
+            raise ConnectionError("Tracking broker is reconnecting to PostgreSQL")
+        payload = json.dumps(message, default=str)
+        if len(payload.encode()) >= NOTIFY_PAYLOAD_LIMIT:
+            payload = json.dumps({"topics": message["topics"], "event_id": message["event"]["id"]})
+        async with self._lock:
+            await self._conn.execute("SELECT pg_notify($1, $2)", CHANNEL, payload)
+
+    async def _connect(self) -> None:
+        import asyncpg
+        from config import settings
+
+        dsn = self.dsn or settings.DATABASE_URL
+        dsn = dsn.replace("postgresql+asyncpg://", "postgresql://").replace("postgresql+psycopg2://", "postgresql://")
+        conn = await asyncpg.connect(dsn)
+        await conn.add_listener(CHANNEL, self._on_notify)
+        conn.add_termination_listener(self._on_terminated)
+        self._conn = conn
+
+    def _on_terminated(self, connection) -> None:
+        if self._stopping or connection is not self._conn:
+            return
+        self._conn = None
+        if self._reconnect_task is None or self._reconnect_task.done():
+            self._reconnect_task = asyncio.create_task(self._reconnect(), name="tracking-broker-postgres-reconnect")
+
+    async def _reconnect(self) -> None:
+        delay = RECONNECT_MIN_DELAY
+        while not self._stopping:
+            logger.warning("Tracking broker lost its LISTEN connection; reconnecting in %.0fs", delay)
+            await asyncio.sleep(delay)
+            try:
+                await self._connect()
+            except Exception:
+                logger.exception("Tracking broker reconnect failed")
+                delay = min(delay * 2, RECONNECT_MAX_DELAY)
+                continue
+            logger.info("Tracking broker re-established LISTEN on %s", CHANNEL)
+            return
+
+    def _on_notify(self, connection, pid, channel, payload) -> None:
+        message = json.loads(payload)
+        if "event" in message:
+            self.deliver(message)
+            return
+        task = asyncio.create_task(self._deliver_by_id(message))
+        self._fetches.add(task)
+        task.add_done_callback(self._fetches.discard)
+
+    async def _deliver_by_id(self, message: dict) -> None:
+        from database import AsyncSessionLocal
+        from tracking.models import TrackingEvent
+        from tracking.schemas import TrackingEventResponse
+
+        try:
+            async with AsyncSessionLocal() as db:
+                event = await db.get(TrackingEvent, uuid.UUID(message["event_id"]))
+            if event is None:
+                logger.warning("Tracking event %s was gone before it could be delivered", message["event_id"])
+                return
+            response = TrackingEventResponse.from_orm(event)
+        except Exception:
+            logger.exception("Failed to read back tracking event %s", message["event_id"])
+            return
+        self.deliver({"topics": message["topics"], "event": response.model_dump(mode="json")})
+
+
+class RedisBackend:
+    """Fans events out across workers with Redis pub/sub (needs the `redis` package)"""
+
+    def __init__(self, deliver, url: str = REDIS_URL):
+        self.deliver = deliver
+        self.url = url
+        self._redis = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self) -> None:
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self.url)
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(CHANNEL)
+        self._task = asyncio.create_task(self._listen(pubsub), name="tracking-broker-redis")
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+    async def publish(self, message: dict) -> None:
+        await self._redis.publish(CHANNEL, json.dumps(message, default=str))
+
+    async def _listen(self, pubsub) -> None:
+        async for item in pubsub.listen():
+            if item.get("type") == "message":
+                self.deliver(json.loads(item["data"]))
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "postgres": PostgresNotifyBackend,
+    "redis": RedisBackend,
+}
+
+
+class TrackingBroker:
+    """
+    In-process pub/sub for tracking events.
+
+    Subscribers register for topics (a shipment, a user's shipments, or
+    everything) and read from a bounded queue. Delivery never blocks the
+    publisher: a subscriber whose queue is full is evicted instead. With a
+    postgres/redis backend each worker delivers the events published by any
+    worker to its own subscribers.
+    """
+
+    def __init__(self, backend: str = TRACKING_BROKER_BACKEND):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown tracking broker backend {backend!r}")
+        self.backend = BACKENDS[backend](self._deliver)
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.evictions = 0
+
+    async def start(self) -> None:
+        await self.backend.start()
+
+    async def stop(self) -> None:
+        await self.backend.stop()
+        for subscribers in list(self._topics.values()):
+            for subscription in list(subscribers):
+                self.unsubscribe(subscription)
+
+    def subscribe(self, topics: Iterable[str]) -> Subscription:
+        subscription = Subscription(set(topics))
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    async def publish(self, topics: Iterable[str], event: dict) -> None:
+        self.published += 1
+        await self.backend.publish({"topics": [ALL_TOPIC, *topics], "event": event})
+
+    def _deliver(self, message: dict) -> None:
+        # A subscriber on several matching topics still gets the event once
+        targets: Set[Subscription] = set()
+        for topic in message["topics"]:
+            targets.update(self._topics.get(topic, ()))
+        for subscription in targets:
+            if subscription.offer(message["event"]):
+                self.delivered += 1
+            else:
+                self.evictions += 1
+                self.unsubscribe(subscription)
+                subscription.evict()
+
+    def stats(self) -> dict:
+        return {
+            "backend": type(self.backend).__name__,
+            "topics": len(self._topics),
+            "subscribers": len({s for subscribers in self._topics.values() for s in subscribers}),
+            "published": self.published,
+            "delivered": self.delivered,
+            "evictions": self.evictions,
+        }
+
+
+tracking_broker = TrackingBroker()
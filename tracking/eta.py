@@ -0,0 +1,274 @@
+import asyncio
+import contextlib
+import math
+import os
+import tempfile
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+
+from database import AsyncSessionLocal
+from utils.background import BackgroundWorker
+from tracking.schemas import EtaPrediction
+
+# How often newly delivered shipments are folded into the lane tables
+REFRESH_INTERVAL = 10 * 60.0
+# Folded moments, saved after each refresh and loaded at startup: archival
+# deletes the events they came from, so they can't be re-learned from the DB
+ETA_STATE_PATH = os.getenv("ETA_STATE_PATH", os.path.join("models", "eta_moments.npz"))
+# Re-scan this far behind the watermark to catch late commits; already-folded shipments are skipped
+WATERMARK_OVERLAP = timedelta(hours=1)
+# Fewest historical observations a table entry needs before it is used
+MIN_SAMPLES = 5
+# Two-sided interval reported around the median ETA
+CONFIDENCE_LEVEL = 0.9
+_Z = 1.6448536269514722  # standard normal quantile for a 90% two-sided interval
+
+# Most specific first: (origin, destination, vessel, status), (origin, destination, status), (status)
+LEVELS = ("lane_vessel", "lane", "global")
+
+# count, sum and sum of squares of log-hours remaining until delivery
+Moments = List[float]
+
+
+def _level_keys(origin: str, destination: str, vessel: str, status: str) -> Tuple[str, str, str]:
+    return (f"{origin}|{destination}|{vessel}|{status}", f"{origin}|{destination}|{status}", status)
+
+
+def _normalize(value: Optional[str]) -> str:
+    return (value or "").strip().upper()
+
+
+def _table_entry(m: Moments) -> Tuple[float, float, int]:
+    mean = m[1] / m[0]
+    std = math.sqrt(max(m[2] / m[0] - mean * mean, 0.0))
+    return mean, std, int(m[0])
+
+
+class EtaEngine(BackgroundWorker):
+    """
+    Learns how long shipments take from each milestone to delivery, per lane
+    and vessel, from delivered shipments' tracking history.
+
+    Per table entry it keeps the sufficient statistics of log-hours remaining,
+    so newly delivered shipments are folded in without a rebuild. Predictions
+    read a precomputed (mean, std) and are a few dict lookups.
+    """
+
+    name = "eta-engine"
+
+    def __init__(self, path: str = ETA_STATE_PATH):
+        super().__init__()
+        self.path = path
+        self._moments: Dict[str, Dict[str, Moments]] = {level: {} for level in LEVELS}
+        self._table: Dict[str, Dict[str, Tuple[float, float, int]]] = {level: {} for level in LEVELS}
+        self._lock = threading.Lock()
+        # Folded shipments still inside the re-scan window, with the latest
+        # server timestamp of their delivered events; older ones can't come back
+        self._folded: Dict[str, datetime] = {}
+        self.shipments_folded = 0
+        self.watermark: Optional[datetime] = None
+        self.last_refresh_at: Optional[datetime] = None
+
+    async def run_once(self) -> float:
+        await self.refresh()
+        return REFRESH_INTERVAL
+
+    async def refresh(self) -> int:
+        """Fold in shipments delivered since the last refresh (everything, the first time)"""
+        from shipments.models import Shipment
+        from tracking.models import TrackingEvent
+
+        event_time = func.coalesce(TrackingEvent.actual_datetime, TrackingEvent.timestamp)
+        delivered = select(TrackingEvent.shipment_id).filter(TrackingEvent.status == "delivered")
+        if self.watermark is not None:
+            delivered = delivered.filter(TrackingEvent.timestamp > self.watermark - WATERMARK_OVERLAP)
+
+        async with AsyncSessionLocal() as db:
+            watermark = (await db.execute(select(func.max(TrackingEvent.timestamp)))).scalar()
+            result = await db.execute(
+                select(
+                    TrackingEvent.shipment_id,
+                    Shipment.origin_port,
+                    Shipment.destination_port,
+                    TrackingEvent.vessel_name,
+                    TrackingEvent.status,
+                    event_time,
+                    TrackingEvent.timestamp
+                ).join(Shipment, TrackingEvent.shipment_id == Shipment.id).filter(
+                    TrackingEvent.shipment_id.in_(delivered)
+                ).order_by(TrackingEvent.shipment_id, event_time)
+            )
+            rows = [row for row in result if str(row[0]) not in self._folded]
+
+        folded = self.fold(rows)
+        previous_watermark = self.watermark
+        self.watermark = watermark or self.watermark
+        if self.watermark is not None:
+            horizon = self.watermark - WATERMARK_OVERLAP
+            self._folded = {key: seen for key, seen in self._folded.items() if seen > horizon}
+        if folded or self.watermark != previous_watermark:
+            await asyncio.to_thread(self.save, self._state())
+        self.last_refresh_at = datetime.now(timezone.utc)
+        return folded
+
+    def _state(self) -> Dict[str, np.ndarray]:
+        """A consistent snapshot of what save() writes"""
+        with self._lock:
+            state = {}
+            for level in LEVELS:
+                moments = self._moments[level]
+                state[f"{level}_keys"] = np.array(list(moments), dtype=str)
+                state[f"{level}_moments"] = np.array(list(moments.values()), dtype=np.float64).reshape(-1, 3)
+            state["folded_keys"] = np.array(list(self._folded), dtype=str)
+            state["folded_seen"] = np.array([seen.timestamp() for seen in self._folded.values()], dtype=np.float64)
+            state["watermark"] = np.array(self.watermark.timestamp() if self.watermark else np.nan)
+            state["shipments_folded"] = np.array(self.shipments_folded, dtype=np.int64)
+        return state
+
+    def save(self, state: Dict[str, np.ndarray]) -> None:
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        # Unique temporary name, synced before the rename: every worker saves
+        # here, and none may load a partial file
+        f = tempfile.NamedTemporaryFile(dir=directory, prefix=os.path.basename(self.path) + ".", suffix=".tmp", delete=False)
+        try:
+            with f:
+                np.savez_compressed(f, **state)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(f.name, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(f.name)
+            raise
+
+    def load(self) -> bool:
+        """Restore a previous run's moments; the first refresh then resumes from its watermark"""
+        if not os.path.exists(self.path):
+            return False
+        with np.load(self.path, allow_pickle=False) as data:
+            moments = {
+                level: {
+                    str(key): [float(v) for v in values]
+                    for key, values in zip(data[f"{level}_keys"].tolist(), data[f"{level}_moments"].tolist())
+                }
+                for level in LEVELS
+            }
+            folded = {
+                str(key): datetime.fromtimestamp(seen, timezone.utc)
+                for key, seen in zip(data["folded_keys"].tolist(), data["folded_seen"].tolist())
+            }
+            watermark = float(data["watermark"])
+            shipments_folded = int(data["shipments_folded"])
+        with self._lock:
+            self._moments = moments
+            self._table = {
+                level: {key: _table_entry(m) for key, m in entries.items()} for level, entries in moments.items()
+            }
+            self._folded = folded
+            self.watermark = None if math.isnan(watermark) else datetime.fromtimestamp(watermark, timezone.utc)
+            self.shipments_folded = shipments_folded
+        return True
+
+    def fold(self, rows) -> int:
+        """
+        Add (shipment_id, origin, destination, vessel, status, event_time,
+        timestamp) rows, ordered by shipment and time, for delivered shipments.
+        Returns the number of shipments folded in.
+        """
+        if not rows:
+            return 0
+        shipment_ids, origins, destinations, vessels, statuses, times, server_times = zip(*rows)
+        shipment_keys, inv = np.unique(np.array([str(s) for s in shipment_ids]), return_inverse=True)
+        t = np.array([ts.timestamp() for ts in times], dtype=np.float64)
+        status = np.array([_normalize(s).lower() for s in statuses])
+
+        # Each shipment's first delivery, and its last known vessel
+        is_delivered = status == "delivered"
+        delivered_at = np.full(len(shipment_keys), np.inf)
+        np.minimum.at(delivered_at, inv[is_delivered], t[is_delivered])
+        # What the watermark is compared against, for pruning _folded
+        delivered_seen: Dict[str, datetime] = {}
+        for i in np.flatnonzero(is_delivered).tolist():
+            key = str(shipment_keys[inv[i]])
+            if key not in delivered_seen or server_times[i] > delivered_seen[key]:
+                delivered_seen[key] = server_times[i]
+        shipment_vessel: Dict[int, str] = {}
+        for i, vessel in zip(inv.tolist(), vessels):
+            if vessel:
+                shipment_vessel[i] = _normalize(vessel)
+
+        hours = (delivered_at[inv] - t) / 3600.0
+        valid = ~is_delivered & (status != "") & np.isfinite(hours) & (hours > 0)
+        if not valid.any():
+            self._folded.update(delivered_seen)
+            self.shipments_folded += len(shipment_keys)
+            return len(shipment_keys)
+
+        y = np.log(hours[valid])
+        idx = np.flatnonzero(valid)
+        keys = [
+            _level_keys(_normalize(origins[i]), _normalize(destinations[i]), shipment_vessel.get(int(inv[i]), ""), str(status[i]))
+            for i in idx.tolist()
+        ]
+
+        updates: Dict[str, Dict[str, Moments]] = {}
+        for level_index, level in enumerate(LEVELS):
+            level_keys, level_inv = np.unique(np.array([k[level_index] for k in keys]), return_inverse=True)
+            count = np.bincount(level_inv)
+            total = np.bincount(level_inv, weights=y)
+            total_sq = np.bincount(level_inv, weights=y * y)
+            updates[level] = {
+                key: [float(c), float(s), float(sq)]
+                for key, c, s, sq in zip(level_keys.tolist(), count, total, total_sq)
+            }
+
+        with self._lock:
+            for level, entries in updates.items():
+                moments = self._moments[level]
+                table = self._table[level]
+                for key, (c, s, sq) in entries.items():
+                    m = moments.setdefault(key, [0.0, 0.0, 0.0])
+                    m[0] += c
+                    m[1] += s
+                    m[2] += sq
+                    table[key] = _table_entry(m)
+            self._folded.update(delivered_seen)
+            self.shipments_folded += len(shipment_keys)
+        return len(shipment_keys)
+
+    def predict(self, origin: str, destination: str, vessel: Optional[str], status: Optional[str],
+                as_of: Optional[datetime]) -> Optional[EtaPrediction]:
+        """ETA from the shipment's latest milestone, using the most specific table with enough history"""
+        if not status or status == "delivered" or as_of is None:
+            return None
+        keys = _level_keys(_normalize(origin), _normalize(destination), _normalize(vessel), _normalize(status).lower())
+        for level, key in zip(LEVELS, keys):
+            entry = self._table[level].get(key)
+            if entry is not None and entry[2] >= MIN_SAMPLES:
+                mean, std, samples = entry
+                return EtaPrediction(
+                    predicted_arrival=as_of + timedelta(hours=math.exp(mean)),
+                    lower_bound=as_of + timedelta(hours=math.exp(mean - _Z * std)),
+                    upper_bound=as_of + timedelta(hours=math.exp(mean + _Z * std)),
+                    confidence_level=CONFIDENCE_LEVEL,
+                    basis=level,
+                    from_status=status,
+                    samples=samples
+                )
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "last_refresh_at": self.last_refresh_at,
+            "shipments": self.shipments_folded,
+            **{f"{level}_entries": len(self._table[level]) for level in LEVELS},
+        }
+
+
+eta_engine = EtaEngine()
@@ -0,0 +1,193 @@
+import csv
+import io
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from shipments.models import Shipment
+from tracking.models import TrackingEvent
+from tracking.schemas import (
+    BulkTrackingEventCreate, BulkTrackingIngestResponse, BulkTrackingRejection, MAX_BULK_TRACKING_EVENTS
+)
+from tracking.summary import lock_shipment_events, refresh_summaries
+
+# Multi-valued CSV cells (documents) are separated by this
+CSV_LIST_SEPARATOR = ";"
+# Largest CSV upload read into memory; MAX_BULK_TRACKING_EVENTS rows fit comfortably
+MAX_CSV_UPLOAD_BYTES = 10 * 1024 * 1024
+
+# (index in the upload, parsed event)
+IndexedEvent = Tuple[int, BulkTrackingEventCreate]
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def dedupe_key(shipment_id, container_number, status, actual_datetime) -> tuple:
+    return (str(shipment_id), container_number or "", status, _utc(actual_datetime))
+
+
+def parse_csv_events(content: bytes) -> Tuple[List[IndexedEvent], List[BulkTrackingRejection]]:
+    """
+    Parse a CSV upload with one event per row. Columns are the fields of
+    BulkTrackingEventCreate; empty cells are treated as missing. Rows that
+    fail validation are returned as rejections instead of failing the upload.
+    """
+    try:
+        reader = csv.DictReader(io.StringIO(content.decode("utf-8-sig")))
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV must be UTF-8 encoded")
+
+    events: List[IndexedEvent] = []
+    rejected: List[BulkTrackingRejection] = []
+    for index, row in enumerate(reader):
+        if index >= MAX_BULK_TRACKING_EVENTS:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {MAX_BULK_TRACKING_EVENTS} events per upload"
+            )
+        data = {key.strip(): value.strip() for key, value in row.items() if key and value and value.strip()}
+        if "documents" in data:
+            data["documents"] = [d.strip() for d in data["documents"].split(CSV_LIST_SEPARATOR) if d.strip()]
+        try:
+            events.append((index, BulkTrackingEventCreate(**data)))
+        except ValidationError as e:
+            error = e.errors()[0]
+            rejected.append(BulkTrackingRejection(
+                index=index,
+                shipment_id=data.get("shipment_id"),
+                detail=f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+            ))
+    return events, rejected
+
+
+async def ingest_tracking_events(
+    db: AsyncSession,
+    forwarder_id,
+    events: List[IndexedEvent],
+    rejected: List[BulkTrackingRejection]
+) -> Tuple[BulkTrackingIngestResponse, List[TrackingEvent], Dict[str, Shipment]]:
+    """
+    Validate assignments for the whole batch, drop duplicates (within the batch
+    and against stored events), insert the rest in one batched statement and
+    apply milestone statuses and summaries, all in a single transaction.
+
+    Events without actual_datetime are stored without one (readers fall back
+    to the server timestamp), so a re-sent feed dedupes against them instead
+    of stamping a fresh ingestion time each time.
+    """
+    from quotes.models import Quote
+
+    received = len(events) + len(rejected)
+    rejected = list(rejected)
+    shipment_ids = {event.shipment_id for _, event in events}
+
+    # One query each for the shipments and the forwarder's assignments
+    result = await db.execute(select(Shipment).filter(Shipment.id.in_(shipment_ids)))
+    shipments = {str(shipment.id): shipment for shipment in result.scalars()}
+    result = await db.execute(
+        select(Quote.shipment_id).filter(
+            Quote.shipment_id.in_(shipment_ids),
+            Quote.forwarder_id == forwarder_id,
+            Quote.status == "accepted"
+        ).distinct()
+    )
+    assigned = {str(shipment_id) for shipment_id in result.scalars()}
+
+    ingested_at = datetime.now(timezone.utc)
+    candidates: Dict[tuple, dict] = {}
+    duplicates = 0
+    for index, event in events:
+        shipment_id = str(event.shipment_id)
+        if shipment_id not in shipments:
+            rejected.append(BulkTrackingRejection(index=index, shipment_id=shipment_id, detail="Shipment not found"))
+            continue
+        if shipment_id not in assigned:
+            rejected.append(BulkTrackingRejection(
+                index=index, shipment_id=shipment_id, detail="You are not the assigned forwarder for this shipment"
+            ))
+            continue
+        actual_datetime = _utc(event.actual_datetime)
+        key = dedupe_key(shipment_id, event.container_number, event.status.value, actual_datetime)
+        if key in candidates:
+            duplicates += 1
+            continue
+        candidates[key] = {
+            "id": uuid.uuid4(),
+            "shipment_id": event.shipment_id,
+            "created_by": forwarder_id,
+            "status": event.status.value,
+            "location": event.location,
+            "vessel_name": event.vessel_name,
+            "voyage_number": event.voyage_number,
+            "container_number": event.container_number,
+            "description": event.description,
+            "remarks": event.remarks,
+            "estimated_datetime": _utc(event.estimated_datetime),
+            "actual_datetime": actual_datetime,
+            "documents": event.documents or [],
+            "is_milestone": event.is_milestone
+        }
+
+    if candidates:
+        # Held until commit: keeps seq in commit order per shipment, and stops a
+        # concurrent upload of the same feed slipping past the dedupe check
+        await lock_shipment_events(db, {row["shipment_id"] for row in candidates.values()})
+        actual_datetimes = {row["actual_datetime"] for row in candidates.values()}
+        matches_actual = TrackingEvent.actual_datetime.in_(actual_datetimes - {None})
+        if None in actual_datetimes:
+            matches_actual = or_(matches_actual, TrackingEvent.actual_datetime.is_(None))
+        result = await db.execute(
+            select(
+                TrackingEvent.shipment_id,
+                TrackingEvent.container_number,
+                TrackingEvent.status,
+                TrackingEvent.actual_datetime
+            ).filter(
+                TrackingEvent.shipment_id.in_({row["shipment_id"] for row in candidates.values()}),
+                matches_actual
+            )
+        )
+        for existing in result:
+            if candidates.pop(dedupe_key(*existing), None) is not None:
+                duplicates += 1
+
+    inserted: List[TrackingEvent] = []
+    if candidates:
+        rows = list(candidates.values())
+        result = await db.scalars(insert(TrackingEvent).returning(TrackingEvent), rows)
+        inserted = list(result)
+
+        # Latest milestone per shipment wins; flushed as one batched UPDATE
+        milestones: Dict[str, Tuple[datetime, str]] = {}
+        for row in rows:
+            if row["is_milestone"]:
+                event_time = row["actual_datetime"] or ingested_at
+                current = milestones.get(str(row["shipment_id"]))
+                if current is None or event_time >= current[0]:
+                    milestones[str(row["shipment_id"])] = (event_time, row["status"])
+        for shipment_id, (_, milestone_status) in milestones.items():
+            shipments[shipment_id].status = milestone_status
+
+        await db.flush()
+        await refresh_summaries(db, {row["shipment_id"] for row in rows})
+        await db.commit()
+
+    return (
+        BulkTrackingIngestResponse(
+            received=received,
+            inserted=len(inserted),
+            duplicates=duplicates,
+            rejected=sorted(rejected, key=lambda r: r.index)
+        ),
+        inserted,
+        shipments
+    )
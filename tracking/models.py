@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Boolean
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Enum, Boolean, Index, Integer, BigInteger, Identity
 from sqlalchemy.dialects.postgresql import UUID, JSONB
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -7,8 +7,17 @@ from database import Base
 
 class TrackingEvent(Base):
     __tablename__ = "tracking_events"
+    __table_args__ = (
+        # Keyset pagination / incremental sync: WHERE shipment_id = ? AND seq > ?
+        Index("ix_tracking_events_shipment_seq", "shipment_id", "seq"),
+        # Bulk ingestion dedupe key
+        Index("ix_tracking_events_dedupe", "shipment_id", "actual_datetime", "status", "container_number"),
+    )
     
     id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    # Feed position, drawn at insert; timestamp is the transaction start, so a
+    # slow transaction can commit events behind a cursor already handed out
+    seq = Column(BigInteger, Identity(), nullable=False)
     shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), nullable=False)
     created_by = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     
@@ -41,3 +50,42 @@ class TrackingEvent(Base):
     # Relationships
     shipment = relationship("Shipment", back_populates="tracking_events")
     creator = relationship("User")
+
+class ShipmentTrackingSummary(Base):
+    """
+    One row per shipment with tracking events, maintained in the same
+    transaction as each new event (see tracking.summary) so reads never
+    have to scan the event history.
+    """
+    __tablename__ = "shipment_tracking_summaries"
+    
+    shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), primary_key=True)
+    # No FK: the event may since have been archived out of tracking_events
+    latest_event_id = Column(UUID(as_uuid=True), nullable=False)
+    latest_status = Column(String(50))
+    latest_location = Column(String(200))
+    latest_vessel_name = Column(String(100))
+    # Event time (actual_datetime, else when it was recorded) of the latest event
+    latest_event_at = Column(DateTime(timezone=True))
+    
+    # Same derivation as the history endpoint: first pre-delivery ETA, last delivery time
+    estimated_arrival = Column(DateTime(timezone=True))
+    # Event time of the event the ETA came from; NULL when it came from the archive
+    estimated_arrival_event_at = Column(DateTime(timezone=True))
+    actual_arrival = Column(DateTime(timezone=True))
+    
+    event_count = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class TrackingEventArchive(Base):
+    """Where a shipment's archived tracking events live (see tracking.archive)"""
+    __tablename__ = "tracking_event_archives"
+    
+    shipment_id = Column(UUID(as_uuid=True), ForeignKey("shipments.id"), primary_key=True)
+    partition = Column(String(7), nullable=False)  # delivery month, YYYY-MM
+    file_path = Column(String(300), nullable=False)  # relative to TRACKING_ARCHIVE_PATH
+    event_count = Column(Integer, nullable=False)
+    # Summary fields the archived events contributed; summary rebuilds fold them back in
+    estimated_arrival = Column(DateTime(timezone=True))
+    actual_arrival = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
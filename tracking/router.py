@@ -1,27 +1,54 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import List, Optional
 from datetime import datetime
 
-from database import get_db
+from database import get_async_db
 from auth.dependencies import get_current_user, require_forwarder
 from auth.models import User
 from shipments.models import Shipment
-from tracking.models import TrackingEvent
-from tracking.schemas import TrackingEventCreate, TrackingEventResponse, ShipmentTrackingResponse
+from tracking.models import ShipmentTrackingSummary, TrackingEvent
+from tracking.schemas import (
+    TrackingEventCreate, TrackingEventResponse, ShipmentTrackingResponse, TrackingSummaryResponse,
+    BulkTrackingEventRequest, BulkTrackingIngestResponse, EtaPrediction
+)
+from tracking.eta import eta_engine
+from tracking.archive import read_archived_events
+from tracking.ingest import MAX_CSV_UPLOAD_BYTES, ingest_tracking_events, parse_csv_events
+from tracking.summary import lock_shipment_events, record_tracking_event
+from utils.pagination import decode_cursor, encode_cursor
+from utils.loaders import Loaders, get_loaders
+from tracking.broker import ALL_TOPIC, Subscription, shipment_topic, tracking_broker, user_topic
+from notifications.dispatcher import notify_tracking_update
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
+DEFAULT_EVENTS_PAGE_SIZE = 200
+MAX_EVENTS_PAGE_SIZE = 1000
+
 @router.get("/shipments/{shipment_id}", response_model=ShipmentTrackingResponse)
 async def get_shipment_tracking(
     shipment_id: str,
+    since: Optional[str] = Query(None, description="Cursor from a previous response; only later events are returned"),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_EVENTS_PAGE_SIZE, description=f"Page size; defaults to {DEFAULT_EVENTS_PAGE_SIZE} with `since`"),
+    include_archived: bool = Query(False, description="Also read history moved to the cold archive"),
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
-    Get complete tracking history for a shipment
+    Get tracking history for a shipment, oldest first. Without `since` or
+    `limit` the whole history is returned; otherwise keep passing
+    `next_cursor` back as `since` to page through it and, once `has_more` is
+    false, to pick up only new events.
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -41,20 +68,41 @@ async def get_shipment_tracking(
             detail="Not authorized to view tracking for this shipment"
         )
     
-    # Get all tracking events
-    events = db.query(TrackingEvent).filter(
-        TrackingEvent.shipment_id == shipment_id
-    ).order_by(TrackingEvent.timestamp).all()
+    if limit is None and since:
+        limit = DEFAULT_EVENTS_PAGE_SIZE
+    
+    # Keyset page on seq, served from ix_tracking_events_shipment_seq
+    position = decode_cursor(since) if since else None
+    query = select(TrackingEvent).filter(TrackingEvent.shipment_id == shipment_id)
+    if position is not None:
+        query = query.filter(TrackingEvent.seq > position)
+    query = query.order_by(TrackingEvent.seq)
+    if limit is not None:
+        query = query.limit(limit + 1)
+    result = await db.execute(query)
+    events = [(event.seq, TrackingEventResponse.from_orm(event)) for event in result.scalars()]
+    
+    if include_archived:
+        # Archived events keep their seq, so they merge into the same order
+        archived = [
+            (record["seq"], TrackingEventResponse.model_validate(record))
+            for record in await read_archived_events(db, shipment.id)
+            if position is None or record["seq"] > position
+        ]
+        events = sorted(archived + events, key=lambda e: e[0])
     
-    # Find estimated and actual arrival
-    estimated_arrival = None
-    actual_arrival = None
+    has_more = limit is not None and len(events) > limit
+    if limit is not None:
+        events = events[:limit]
     
-    for event in events:
-        if event.status == "delivered":
-            actual_arrival = event.actual_datetime or event.timestamp
-        elif event.estimated_datetime and not estimated_arrival:
-            estimated_arrival = event.estimated_datetime
+    if events:
+        next_cursor = encode_cursor(events[-1][0])
+    else:
+        next_cursor = since
+    
+    # Arrival dates cover the whole history, not just this page
+    summary = await db.get(ShipmentTrackingSummary, shipment.id)
+    predicted_eta = predict_shipment_eta(shipment, summary)
     
     return ShipmentTrackingResponse(
         shipment_id=str(shipment.id),
@@ -62,23 +110,82 @@ async def get_shipment_tracking(
         current_status=shipment.status,
         origin_port=shipment.origin_port,
         destination_port=shipment.destination_port,
-        estimated_arrival=estimated_arrival,
-        actual_arrival=actual_arrival,
-        events=[TrackingEventResponse.from_orm(event) for event in events]
+        estimated_arrival=summary.estimated_arrival if summary else None,
+        actual_arrival=summary.actual_arrival if summary else None,
+        events=[event for _, event in events],
+        predicted_eta=predicted_eta,
+        next_cursor=next_cursor,
+        has_more=has_more
+    )
+
+@router.get("/shipments/{shipment_id}/eta", response_model=EtaPrediction)
+async def get_predicted_eta(
+    shipment_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    Predicted arrival with a 90% interval, from historical milestone-to-delivery
+    times on this lane (and vessel, when there is enough history)
+    """
+    shipment = await loaders.shipments.load(shipment_id)
+    if not shipment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shipment not found"
+        )
+    
+    if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    if current_user.role == "buyer" and str(shipment.buyer_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    summary = await db.get(ShipmentTrackingSummary, shipment.id)
+    predicted_eta = predict_shipment_eta(shipment, summary)
+    if not predicted_eta:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No ETA available for this shipment"
+        )
+    
+    return predicted_eta
+
+def predict_shipment_eta(shipment: Shipment, summary: Optional[ShipmentTrackingSummary]) -> Optional[EtaPrediction]:
+    """
+    ETA from the latest milestone; None once delivered or without enough history.
+    The summary's latest event is the one with the latest event time, which is
+    what the engine anchors on, so no event needs reading
+    """
+    if not summary or summary.actual_arrival:
+        return None
+    return eta_engine.predict(
+        shipment.origin_port,
+        shipment.destination_port,
+        summary.latest_vessel_name,
+        summary.latest_status,
+        summary.latest_event_at
     )
 
 @router.post("/shipments/{shipment_id}/events", response_model=TrackingEventResponse)
 async def create_tracking_event(
     shipment_id: str,
     event_data: TrackingEventCreate,
-    background_tasks: BackgroundTasks,
     current_user: User = Depends(require_forwarder),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Create a new tracking event (Forwarder only)
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -87,11 +194,14 @@ async def create_tracking_event(
     
     # Check if forwarder is assigned to this shipment
     from quotes.models import Quote
-    quote = db.query(Quote).filter(
-        Quote.shipment_id == shipment_id,
-        Quote.forwarder_id == current_user.id,
-        Quote.status == "accepted"
-    ).first()
+    result = await db.execute(
+        select(Quote.id).filter(
+            Quote.shipment_id == shipment_id,
+            Quote.forwarder_id == current_user.id,
+            Quote.status == "accepted"
+        ).limit(1)
+    )
+    quote = result.scalar_one_or_none()
     
     if not quote:
         raise HTTPException(
@@ -99,6 +209,9 @@ async def create_tracking_event(
             detail="You are not the assigned forwarder for this shipment"
         )
     
+    # Held until commit, so the event's seq can't be passed by a later writer's
+    await lock_shipment_events(db, [shipment.id])
+    
     # Create tracking event
     tracking_event = TrackingEvent(
         shipment_id=shipment_id,
@@ -122,31 +235,161 @@ async def create_tracking_event(
     if event_data.is_milestone:
         shipment.status = event_data.status.value
     
-    db.commit()
-    db.refresh(tracking_event)
+    await db.flush()
+    await record_tracking_event(db, tracking_event)
+    await db.commit()
+    await db.refresh(tracking_event)
+    response = TrackingEventResponse.from_orm(tracking_event)
     
-    # Notify supplier and buyer
-    background_tasks.add_task(
-        notify_tracking_update,
-        str(shipment.supplier_id),
-        str(shipment.buyer_id),
+    await publish_tracking_event(shipment, current_user.id, response)
+    
+    # Notify supplier and buyer (queued; sent as a digest)
+    notify_tracking_update(
+        shipment.id,
+        [shipment.supplier_id, shipment.buyer_id],
         event_data.status.value,
         event_data.location,
         event_data.description
     )
     
-    return TrackingEventResponse.from_orm(tracking_event)
+    return response
+
+@router.post("/events/bulk", response_model=BulkTrackingIngestResponse)
+async def create_tracking_events_bulk(
+    request: BulkTrackingEventRequest,
+    current_user: User = Depends(require_forwarder),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ingest up to 5,000 tracking events across shipments in one transaction (Forwarder only).
+    Events for unassigned shipments are rejected individually; duplicates are skipped.
+    """
+    events = list(enumerate(request.events))
+    return await _ingest_bulk(events, [], current_user, db)
+
+@router.post("/events/bulk/csv", response_model=BulkTrackingIngestResponse)
+async def create_tracking_events_csv(
+    file: UploadFile = File(...),
+    current_user: User = Depends(require_forwarder),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Ingest tracking events from a CSV feed (Forwarder only). One event per row,
+    with a header row naming the event fields plus shipment_id; `documents`
+    holds semicolon-separated URLs.
+    """
+    content = await file.read(MAX_CSV_UPLOAD_BYTES + 1)
+    if len(content) > MAX_CSV_UPLOAD_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"CSV uploads are limited to {MAX_CSV_UPLOAD_BYTES // (1024 * 1024)} MB"
+        )
+    events, rejected = parse_csv_events(content)
+    return await _ingest_bulk(events, rejected, current_user, db)
+
+async def _ingest_bulk(events, rejected, current_user: User, db: AsyncSession):
+    result, inserted, shipments = await ingest_tracking_events(db, current_user.id, events, rejected)
+    
+    # The dispatcher folds a shipment's many updates into one digest per recipient
+    for tracking_event in inserted:
+        shipment = shipments[str(tracking_event.shipment_id)]
+        await publish_tracking_event(shipment, current_user.id, TrackingEventResponse.from_orm(tracking_event))
+        notify_tracking_update(
+            shipment.id,
+            [shipment.supplier_id, shipment.buyer_id],
+            tracking_event.status,
+            tracking_event.location,
+            tracking_event.description
+        )
+    
+    return result
+
+async def publish_tracking_event(shipment: Shipment, forwarder_id, response: TrackingEventResponse):
+    """Push to live subscribers; a broker hiccup must not fail the write"""
+    try:
+        await tracking_broker.publish(
+            [shipment_topic(shipment.id), user_topic(shipment.supplier_id), user_topic(shipment.buyer_id), user_topic(forwarder_id)],
+            response.model_dump(mode="json")
+        )
+    except Exception:
+        logger.exception("Failed to publish tracking event %s", response.id)
+
+@router.get("/shipments/{shipment_id}/events/stream")
+async def stream_shipment_events(
+    shipment_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    Server-Sent Events stream of new tracking events for one shipment.
+    Permissions are checked once at subscribe time.
+    """
+    shipment = await loaders.shipments.load(shipment_id)
+    if not shipment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shipment not found"
+        )
+    
+    if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    if current_user.role == "buyer" and str(shipment.buyer_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    # Give the connection back to the pool; the stream itself never touches the DB
+    await db.close()
+    
+    subscription = tracking_broker.subscribe([shipment_topic(shipment.id)])
+    return StreamingResponse(sse_events(subscription), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@router.get("/events/stream")
+async def stream_my_events(current_user: User = Depends(get_current_user)):
+    """
+    Server-Sent Events stream of new tracking events for every shipment the
+    current user is a party to (all shipments for admins).
+    """
+    topic = ALL_TOPIC if current_user.role == "admin" else user_topic(current_user.id)
+    subscription = tracking_broker.subscribe([topic])
+    return StreamingResponse(sse_events(subscription), media_type="text/event-stream", headers=SSE_HEADERS)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+async def sse_events(subscription: Subscription):
+    """Format broker events as SSE, with keep-alives while idle"""
+    try:
+        yield "retry: 3000\n\n"
+        while True:
+            try:
+                event = await subscription.get()
+            except ConnectionAbortedError as e:
+                yield f"event: evicted\ndata: {json.dumps({'detail': str(e)})}\n\n"
+                return
+            if event is None:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"id: {event['id']}\nevent: tracking\ndata: {json.dumps(event)}\n\n"
+    finally:
+        tracking_broker.unsubscribe(subscription)
 
 @router.get("/shipments/{shipment_id}/events/latest", response_model=TrackingEventResponse)
 async def get_latest_tracking_event(
     shipment_id: str,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
 ):
     """
     Get the latest tracking event for a shipment
     """
-    shipment = db.query(Shipment).filter(Shipment.id == shipment_id).first()
+    shipment = await loaders.shipments.load(shipment_id)
     if not shipment:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -166,9 +409,14 @@ async def get_latest_tracking_event(
             detail="Not authorized"
         )
     
-    latest_event = db.query(TrackingEvent).filter(
-        TrackingEvent.shipment_id == shipment_id
-    ).order_by(TrackingEvent.timestamp.desc()).first()
+    summary = await db.get(ShipmentTrackingSummary, shipment.id)
+    latest_event = await db.get(TrackingEvent, summary.latest_event_id) if summary else None
+    if summary and not latest_event:
+        # Delivered long ago and moved to the archive
+        archived = await read_archived_events(db, shipment.id)
+        latest_event = next((e for e in archived if e["id"] == str(summary.latest_event_id)), None)
+        if latest_event:
+            return TrackingEventResponse.model_validate(latest_event)
     
     if not latest_event:
         raise HTTPException(
@@ -178,8 +426,40 @@ async def get_latest_tracking_event(
     
     return TrackingEventResponse.from_orm(latest_event)
 
-async def notify_tracking_update(supplier_id: str, buyer_id: str, status: str, location: str, description: str):
-    """Background task to notify about tracking updates"""
-    # Implement notification logic
-    print(f"Tracking update: {status} at {location} - {description}")
-    print(f"Notifying supplier: {supplier_id}, buyer: {buyer_id}")
+@router.get("/shipments/{shipment_id}/summary", response_model=TrackingSummaryResponse)
+async def get_tracking_summary(
+    shipment_id: str,
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_async_db),
+    loaders: Loaders = Depends(get_loaders)
+):
+    """
+    Latest status, location, ETA/ATA and event count for a shipment (single-row lookup)
+    """
+    shipment = await loaders.shipments.load(shipment_id)
+    if not shipment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Shipment not found"
+        )
+    
+    if current_user.role == "supplier" and str(shipment.supplier_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    if current_user.role == "buyer" and str(shipment.buyer_id) != str(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Not authorized"
+        )
+    
+    summary = await db.get(ShipmentTrackingSummary, shipment.id)
+    if not summary:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No tracking events found"
+        )
+    
+    return TrackingSummaryResponse.model_validate(summary)
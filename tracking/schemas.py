@@ -1,6 +1,7 @@
 from pydantic import BaseModel, Field
 from typing import Optional, List
 from datetime import datetime
+from uuid import UUID
 from enum import Enum
 
 class TrackingStatus(str, Enum):
@@ -28,6 +29,25 @@ class TrackingEventCreate(BaseModel):
     documents: Optional[List[str]] = Field(default_factory=list)
     is_milestone: bool = False
 
+MAX_BULK_TRACKING_EVENTS = 5000
+
+class BulkTrackingEventCreate(TrackingEventCreate):
+    shipment_id: UUID
+
+class BulkTrackingEventRequest(BaseModel):
+    events: List[BulkTrackingEventCreate] = Field(..., min_length=1, max_length=MAX_BULK_TRACKING_EVENTS)
+
+class BulkTrackingRejection(BaseModel):
+    index: int
+    shipment_id: Optional[str] = None
+    detail: str
+
+class BulkTrackingIngestResponse(BaseModel):
+    received: int
+    inserted: int
+    duplicates: int
+    rejected: List[BulkTrackingRejection]
+
 class TrackingEventResponse(BaseModel):
     id: str
     shipment_id: str
@@ -48,6 +68,15 @@ class TrackingEventResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class EtaPrediction(BaseModel):
+    predicted_arrival: datetime
+    lower_bound: datetime
+    upper_bound: datetime
+    confidence_level: float
+    basis: str  # lane_vessel, lane or global: the most specific history that was deep enough
+    from_status: str
+    samples: int
+
 class ShipmentTrackingResponse(BaseModel):
     shipment_id: str
     shipment_number: str
@@ -57,6 +86,23 @@ class ShipmentTrackingResponse(BaseModel):
     estimated_arrival: Optional[datetime]
     actual_arrival: Optional[datetime]
     events: List[TrackingEventResponse]
+    predicted_eta: Optional[EtaPrediction] = None
+    next_cursor: Optional[str] = None  # pass back as `since` to fetch the next page / new events
+    has_more: bool = False
+    
+    class Config:
+        from_attributes = True
+
+class TrackingSummaryResponse(BaseModel):
+    shipment_id: UUID
+    latest_event_id: UUID
+    latest_status: Optional[str]
+    latest_location: Optional[str]
+    latest_event_at: Optional[datetime]
+    estimated_arrival: Optional[datetime]
+    actual_arrival: Optional[datetime]
+    event_count: int
+    updated_at: Optional[datetime]
     
     class Config:
         from_attributes = True
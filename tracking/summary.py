@@ -0,0 +1,171 @@
+import asyncio
+from typing import Iterable
+
+from sqlalchemy import and_, case, func, or_, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from tracking.models import ShipmentTrackingSummary, TrackingEvent
+
+# One transaction-scoped advisory lock per shipment, taken in the order given
+_LOCK_SQL = text("""
+SELECT pg_advisory_xact_lock(hashtextextended('tracking_events:' || shipment_id, 0))
+FROM unnest(CAST(:shipment_ids AS text[])) WITH ORDINALITY AS locked(shipment_id, position)
+ORDER BY position
+""")
+
+
+async def lock_shipment_events(db: AsyncSession, shipment_ids: Iterable) -> None:
+    """
+    Serialize event writers per shipment until commit. seq is drawn at INSERT,
+    not at commit, so two unserialized writers can commit out of seq order and
+    a reader's cursor can pass an event that isn't visible yet. Every writer
+    calls this before inserting; ids are locked sorted so batches can't deadlock.
+    """
+    await db.execute(_LOCK_SQL, {"shipment_ids": sorted({str(shipment_id) for shipment_id in shipment_ids})})
+
+
+async def record_tracking_event(db: AsyncSession, event: TrackingEvent) -> None:
+    """
+    Fold a new event into its shipment's summary row. Call after the event is
+    flushed and before commit so both land in one transaction, with the
+    shipment locked (lock_shipment_events) before the event was inserted.
+
+    Applies the rebuild's rules (_REBUILD_SQL) incrementally, so a back-dated
+    event lands the same way whichever path wrote it: the latest event is the
+    one with the latest event time (ties go to the newer event), the ETA comes
+    from the earliest pre-delivery event that has one, and the arrival is the
+    latest delivery time.
+    """
+    summary = ShipmentTrackingSummary.__table__
+    delivered = event.status == "delivered"
+    # now() is the transaction start, i.e. the event's own server-side timestamp
+    event_time = event.actual_datetime if event.actual_datetime is not None else func.now()
+    has_estimate = not delivered and event.estimated_datetime is not None
+    stmt = insert(summary).values(
+        shipment_id=event.shipment_id,
+        latest_event_id=event.id,
+        latest_status=event.status,
+        latest_location=event.location,
+        latest_vessel_name=event.vessel_name,
+        latest_event_at=event_time,
+        estimated_arrival=event.estimated_datetime if has_estimate else None,
+        estimated_arrival_event_at=event_time if has_estimate else None,
+        actual_arrival=event_time if delivered else None,
+        event_count=1
+    )
+    excluded = stmt.excluded
+    is_latest = or_(summary.c.latest_event_at.is_(None), excluded.latest_event_at >= summary.c.latest_event_at)
+    # An archived ETA has no event time and always stands, as in the rebuild
+    is_earlier_estimate = and_(
+        excluded.estimated_arrival.is_not(None),
+        or_(
+            summary.c.estimated_arrival.is_(None),
+            excluded.estimated_arrival_event_at < summary.c.estimated_arrival_event_at
+        )
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[summary.c.shipment_id],
+        set_={
+            "latest_event_id": case((is_latest, excluded.latest_event_id), else_=summary.c.latest_event_id),
+            "latest_status": case((is_latest, excluded.latest_status), else_=summary.c.latest_status),
+            "latest_location": case((is_latest, excluded.latest_location), else_=summary.c.latest_location),
+            "latest_vessel_name": case((is_latest, excluded.latest_vessel_name), else_=summary.c.latest_vessel_name),
+            "latest_event_at": case((is_latest, excluded.latest_event_at), else_=summary.c.latest_event_at),
+            "estimated_arrival": case(
+                (is_earlier_estimate, excluded.estimated_arrival), else_=summary.c.estimated_arrival
+            ),
+            "estimated_arrival_event_at": case(
+                (is_earlier_estimate, excluded.estimated_arrival_event_at), else_=summary.c.estimated_arrival_event_at
+            ),
+            # greatest() skips NULLs
+            "actual_arrival": func.greatest(summary.c.actual_arrival, excluded.actual_arrival),
+            "event_count": summary.c.event_count + 1,
+            "updated_at": func.now()
+        }
+    )
+    await db.execute(stmt)
+
+
+# Rebuilds summary rows from tracking_events in one statement; {where} narrows the shipments.
+# Events are ordered by event time, since a bulk insert gives all its rows one timestamp,
+# then by seq (insert order). record_tracking_event applies the same rules per event.
+# Archived shipments keep what their archived events contributed, so a late
+# event doesn't reset their count, ETA or delivery time
+_REBUILD_SQL = """
+INSERT INTO shipment_tracking_summaries (
+    shipment_id, latest_event_id, latest_status, latest_location, latest_vessel_name, latest_event_at,
+    estimated_arrival, estimated_arrival_event_at, actual_arrival, event_count, updated_at
+)
+SELECT
+    latest.shipment_id,
+    latest.id,
+    latest.status,
+    latest.location,
+    latest.vessel_name,
+    latest.event_at,
+    coalesce(archived.estimated_arrival, stats.estimated_arrival),
+    CASE WHEN archived.estimated_arrival IS NULL THEN stats.estimated_arrival_event_at END,
+    greatest(stats.actual_arrival, archived.actual_arrival),
+    stats.event_count + coalesce(archived.event_count, 0),
+    now()
+FROM (
+    SELECT DISTINCT ON (shipment_id)
+        shipment_id, id, status, location, vessel_name, coalesce(actual_datetime, timestamp) AS event_at
+    FROM tracking_events
+    {where}
+    ORDER BY shipment_id, coalesce(actual_datetime, timestamp) DESC, seq DESC
+) AS latest
+JOIN (
+    SELECT
+        shipment_id,
+        count(*) AS event_count,
+        (array_agg(estimated_datetime ORDER BY coalesce(actual_datetime, timestamp), seq)
+            FILTER (WHERE status IS DISTINCT FROM 'delivered' AND estimated_datetime IS NOT NULL))[1] AS estimated_arrival,
+        (array_agg(coalesce(actual_datetime, timestamp) ORDER BY coalesce(actual_datetime, timestamp), seq)
+            FILTER (WHERE status IS DISTINCT FROM 'delivered' AND estimated_datetime IS NOT NULL))[1] AS estimated_arrival_event_at,
+        max(coalesce(actual_datetime, timestamp)) FILTER (WHERE status = 'delivered') AS actual_arrival
+    FROM tracking_events
+    {where}
+    GROUP BY shipment_id
+) AS stats ON stats.shipment_id = latest.shipment_id
+LEFT JOIN tracking_event_archives AS archived ON archived.shipment_id = latest.shipment_id
+ON CONFLICT (shipment_id) DO UPDATE SET
+    latest_event_id = EXCLUDED.latest_event_id,
+    latest_status = EXCLUDED.latest_status,
+    latest_location = EXCLUDED.latest_location,
+    latest_vessel_name = EXCLUDED.latest_vessel_name,
+    latest_event_at = EXCLUDED.latest_event_at,
+    estimated_arrival = EXCLUDED.estimated_arrival,
+    estimated_arrival_event_at = EXCLUDED.estimated_arrival_event_at,
+    actual_arrival = EXCLUDED.actual_arrival,
+    event_count = EXCLUDED.event_count,
+    updated_at = EXCLUDED.updated_at
+"""
+
+BACKFILL_SQL = text(_REBUILD_SQL.format(where=""))
+REFRESH_SQL = text(_REBUILD_SQL.format(where="WHERE shipment_id = ANY(:shipment_ids)"))
+
+
+async def refresh_summaries(db: AsyncSession, shipment_ids: Iterable) -> None:
+    """Recompute the summaries of a few shipments, e.g. after a bulk insert; doesn't commit"""
+    await db.execute(REFRESH_SQL, {"shipment_ids": list(shipment_ids)})
+
+
+async def backfill_summaries(db: AsyncSession) -> int:
+    """(Re)compute the summary for every shipment with events; returns rows written"""
+    result = await db.execute(BACKFILL_SQL)
+    await db.commit()
+    return result.rowcount
+
+
+async def _backfill_from_cli() -> None:
+    from database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        written = await backfill_summaries(db)
+    print(f"Backfilled {written} shipment tracking summaries")
+
+
+if __name__ == "__main__":
+    asyncio.run(_backfill_from_cli())
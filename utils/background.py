@@ -0,0 +1,51 @@
+import asyncio
+import logging
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BackgroundWorker:
+    """
+    Long-running loop on the app's event loop, started and stopped from the
+    application lifespan. Subclasses implement `run_once()`, which does one
+    unit of work and returns how many seconds to sleep before the next run.
+    """
+
+    name = "worker"
+    error_backoff = 30.0
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def start(self) -> None:
+        if not self.running:
+            self._task = asyncio.create_task(self._run(), name=self.name)
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def run_once(self) -> float:
+        raise NotImplementedError
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                delay = await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("%s run failed", self.name)
+                delay = self.error_backoff
+            await asyncio.sleep(delay)
@@ -0,0 +1,124 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class TTLCache:
+    """
+    Bounded LRU cache with a fresh TTL and a stale-while-revalidate window.
+
+    - age < ttl: served from cache (hit)
+    - ttl <= age < ttl + stale_ttl: served stale, refreshed in the background
+    - otherwise: fetched inline (miss)
+    """
+
+    def __init__(self, name: str, maxsize: int = 1024, ttl: float = 600.0, stale_ttl: float = 3600.0):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self._entries: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._refreshing: Set[Hashable] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, float]]:
+        """Return (value, age_seconds) or None, without touching metrics"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, stored_at = entry
+        return value, time.monotonic() - stored_at
+
+    def set(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (value, time.monotonic())
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_fetch(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """Serve `key` from cache, falling back to `fetch()` on a miss"""
+        entry = self.get(key)
+        if entry is not None:
+            value, age = entry
+            if age < self.ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return value
+            if age < self.ttl + self.stale_ttl:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._schedule_refresh(key, fetch)
+                return value
+
+        self.misses += 1
+        value = await fetch()
+        self.set(key, value)
+        return value
+
+    def _schedule_refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> None:
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        task = asyncio.create_task(self._refresh(key, fetch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, key: Hashable, fetch: Callable[[], Awaitable[Any]]) -> None:
+        try:
+            value = await fetch()
+            self.set(key, value)
+            self.refreshes += 1
+        except Exception as e:
+            # Keep serving the stale value; the next stale hit retries
+            self.refresh_errors += 1
+            logger.warning("Background refresh failed for %s cache key %r: %s", self.name, key, e)
+        finally:
+            self._refreshing.discard(key)
+
+    def invalidate(self, key: Optional[Hashable] = None, match: Optional[Callable[[Hashable], bool]] = None) -> int:
+        """
+        Drop cached entries. With no arguments everything is cleared;
+        otherwise drop `key` and/or every key for which `match(key)` is true.
+        Returns the number of entries removed.
+        """
+        if key is None and match is None:
+            removed = len(self._entries)
+            self._entries.clear()
+            return removed
+
+        removed = 0
+        if key is not None and self._entries.pop(key, None) is not None:
+            removed += 1
+        if match is not None:
+            for k in [k for k in self._entries if match(k)]:
+                del self._entries[k]
+                removed += 1
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "name": self.name,
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "stale_ttl": self.stale_ttl,
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.stale_hits) / lookups if lookups else 0.0,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "evictions": self.evictions,
+        }
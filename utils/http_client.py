@@ -0,0 +1,88 @@
+import importlib.util
+from dataclasses import dataclass
+from typing import Callable, Dict
+
+import httpx
+
+# HTTP/2 needs the optional `h2` package (httpx[http2]); fall back to HTTP/1.1 keep-alive without it
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+
+@dataclass
+class UpstreamConfig:
+    """Connection pool limits and timeouts for one upstream host"""
+    base_url: str
+    max_connections: int = 100
+    max_keepalive_connections: int = 20
+    keepalive_expiry: float = 30.0
+    connect_timeout: float = 5.0
+    read_timeout: float = 15.0
+    write_timeout: float = 15.0
+    pool_timeout: float = 5.0
+    http2: bool = True
+
+
+class UpstreamClientPool:
+    """
+    App-scoped registry of long-lived httpx clients, one per upstream.
+
+    Each client keeps its own keep-alive connection pool so carrier and
+    ICEGATE calls reuse TCP/TLS connections instead of handshaking per call.
+    """
+
+    def __init__(self):
+        self._configs: Dict[str, UpstreamConfig] = {}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+
+    def register(self, name: str, config: UpstreamConfig) -> None:
+        """Register an upstream; the client is built on startup or first use"""
+        self._configs[name] = config
+
+    def _build_client(self, config: UpstreamConfig) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=config.base_url,
+            http2=config.http2 and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=config.max_connections,
+                max_keepalive_connections=config.max_keepalive_connections,
+                keepalive_expiry=config.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(
+                connect=config.connect_timeout,
+                read=config.read_timeout,
+                write=config.write_timeout,
+                pool=config.pool_timeout,
+            ),
+        )
+
+    def get(self, name: str) -> httpx.AsyncClient:
+        """Get the shared client for an upstream, creating it lazily"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            if name not in self._configs:
+                raise KeyError(f"Unknown upstream: {name}")
+            client = self._build_client(self._configs[name])
+            self._clients[name] = client
+        return client
+
+    async def startup(self) -> None:
+        """Open a client for every registered upstream"""
+        for name in self._configs:
+            self.get(name)
+
+    async def shutdown(self) -> None:
+        """Close all clients and release their pooled connections"""
+        clients = list(self._clients.values())
+        self._clients.clear()
+        for client in clients:
+            await client.aclose()
+
+
+upstream_clients = UpstreamClientPool()
+
+
+def get_upstream_client(name: str) -> Callable[[], httpx.AsyncClient]:
+    """Build a FastAPI dependency that injects the shared client for `name`"""
+    def dependency() -> httpx.AsyncClient:
+        return upstream_clients.get(name)
+    return dependency
@@ -0,0 +1,90 @@
+import asyncio
+from typing import Any, Dict, Hashable, Iterable, List, Optional
+
+from fastapi import Depends
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database import get_async_db
+from auth.models import User
+from shipments.models import Shipment
+
+
+class BatchLoader:
+    """
+    Request-scoped, DataLoader-style loader of rows by primary key.
+
+    `load()` calls made in the same event-loop turn (e.g. under
+    `asyncio.gather`) are collected and resolved with one `IN` query;
+    `load_many()` does the same for a known set of keys. Results, including
+    misses, are remembered for the rest of the request, so each row is
+    queried at most once. Create one per request: it holds the session.
+    Loaders sharing a session must share `lock`, as a session runs one
+    statement at a time.
+    """
+
+    def __init__(self, db: AsyncSession, model, lock: Optional[asyncio.Lock] = None):
+        self.db = db
+        self.model = model
+        self._lock = lock or asyncio.Lock()
+        self._cache: Dict[Hashable, Any] = {}
+        self._pending: Dict[Hashable, asyncio.Future] = {}
+        self._dispatch: Optional[asyncio.Task] = None
+        self.queries = 0
+
+    def prime(self, row) -> None:
+        """Remember a row that was already loaded some other way"""
+        self._cache.setdefault(str(row.id), row)
+
+    async def load(self, key) -> Optional[Any]:
+        key = str(key)
+        if key in self._cache:
+            return self._cache[key]
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            if self._dispatch is None:
+                # Runs after the other coroutines scheduled in this turn have queued their keys
+                self._dispatch = asyncio.ensure_future(self._dispatch_pending())
+        return await future
+
+    async def load_many(self, keys: Iterable) -> List[Optional[Any]]:
+        """Rows in the order of `keys` (None where missing), in at most one query"""
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    async def _dispatch_pending(self) -> None:
+        pending, self._pending, self._dispatch = self._pending, {}, None
+        try:
+            async with self._lock:
+                await self._fetch(pending.keys())
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(self._cache.get(key))
+
+    async def _fetch(self, keys: Iterable[str]) -> None:
+        keys = list(keys)
+        self.queries += 1
+        result = await self.db.execute(select(self.model).filter(self.model.id.in_(keys)))
+        for row in result.scalars():
+            self._cache[str(row.id)] = row
+        for key in keys:
+            self._cache.setdefault(key, None)
+
+
+class Loaders:
+    """The batch loaders of one request, sharing its session"""
+
+    def __init__(self, db: AsyncSession):
+        lock = asyncio.Lock()
+        self.users = BatchLoader(db, User, lock)
+        self.shipments = BatchLoader(db, Shipment, lock)
+
+
+async def get_loaders(db: AsyncSession = Depends(get_async_db)) -> Loaders:
+    """FastAPI dependency; the session is the same one the endpoint receives"""
+    return Loaders(db)
@@ -0,0 +1,19 @@
+import base64
+import binascii
+
+from fastapi import HTTPException, status
+
+
+def encode_cursor(position: int) -> str:
+    """Opaque keyset cursor for a sequence position"""
+    return base64.urlsafe_b64encode(str(position).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> int:
+    try:
+        return int(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
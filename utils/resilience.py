@@ -0,0 +1,280 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+import httpx
+from fastapi import HTTPException, status
+
+# Upstream responses that count as failures for breaking and are safe to retry
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+
+class UpstreamUnavailableError(HTTPException):
+    """Raised when an upstream is failing fast (open circuit) or unreachable"""
+
+    def __init__(self, upstream: str, endpoint: str, detail: str,
+                 status_code: int = status.HTTP_503_SERVICE_UNAVAILABLE,
+                 retry_after: Optional[float] = None):
+        headers = {"Retry-After": str(max(1, int(retry_after)))} if retry_after else None
+        super().__init__(
+            status_code=status_code,
+            detail=f"{upstream} upstream unavailable ({endpoint}): {detail}",
+            headers=headers
+        )
+        self.upstream = upstream
+        self.endpoint = endpoint
+
+
+class CircuitBreaker:
+    """
+    Consecutive-failure circuit breaker.
+
+    CLOSED -> OPEN after `failure_threshold` consecutive failures.
+    OPEN -> HALF_OPEN once `reset_timeout` has elapsed; a limited number of
+    probe calls are let through and the first result decides whether the
+    breaker closes again or re-opens.
+    """
+
+    CLOSED = "CLOSED"
+    OPEN = "OPEN"
+    HALF_OPEN = "HALF_OPEN"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.total_failures = 0
+        self.total_rejected = 0
+
+    def allow(self) -> bool:
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.reset_timeout:
+                self.total_rejected += 1
+                return False
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                self.total_rejected += 1
+                return False
+            self.half_open_calls += 1
+        return True
+
+    def release(self) -> None:
+        """Hand back a probe slot whose call ended without a verdict (e.g. cancelled)"""
+        if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+            self.half_open_calls -= 1
+
+    def retry_after(self) -> float:
+        return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def record_success(self) -> None:
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+
+    def record_failure(self) -> None:
+        self.total_failures += 1
+        self.consecutive_failures += 1
+        if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "total_failures": self.total_failures,
+            "total_rejected": self.total_rejected,
+            "retry_after_seconds": round(self.retry_after(), 1) if self.state == self.OPEN else 0,
+        }
+
+
+class RetryBudget:
+    """
+    Caps retries (and hedges) to a fraction of recent traffic so a degraded
+    upstream is not hammered with amplified load. Every request deposits
+    `ratio` tokens; every retry withdraws one.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.exhausted = 0
+
+    def deposit(self) -> None:
+        self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        self.exhausted += 1
+        return False
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies for hedge thresholds"""
+
+    def __init__(self, window: int = 256, min_samples: int = 20):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self.samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class ResilientUpstream:
+    """
+    Per-upstream resilience policy: one circuit breaker and latency window per
+    endpoint, jittered exponential-backoff retries for idempotent calls capped
+    by a shared retry budget, and optional hedging once a call outlives the
+    endpoint's p95 latency.
+    """
+
+    def __init__(self, name: str, max_retries: int = 2, base_backoff: float = 0.1, max_backoff: float = 2.0,
+                 failure_threshold: int = 5, reset_timeout: float = 30.0, retry_ratio: float = 0.2,
+                 hedge_percentile: float = 0.95):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge_percentile = hedge_percentile
+        self.budget = RetryBudget(ratio=retry_ratio)
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._latencies: Dict[str, LatencyTracker] = {}
+        self.retries = 0
+        self.hedges = 0
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            self._breakers[endpoint] = breaker
+        return breaker
+
+    def _latency(self, endpoint: str) -> LatencyTracker:
+        tracker = self._latencies.get(endpoint)
+        if tracker is None:
+            tracker = LatencyTracker()
+            self._latencies[endpoint] = tracker
+        return tracker
+
+    async def request(self, client: httpx.AsyncClient, method: str, url: str, endpoint: str,
+                      idempotent: bool = True, hedge: bool = False, **kwargs) -> httpx.Response:
+        """
+        Send a request through the breaker. Returns the final response (which
+        may still be an error status for the caller to map) or raises
+        UpstreamUnavailableError when the circuit is open or the upstream
+        cannot be reached.
+        """
+        breaker = self.breaker(endpoint)
+        if not breaker.allow():
+            raise UpstreamUnavailableError(self.name, endpoint, "circuit open", retry_after=breaker.retry_after())
+
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            response = None
+            try:
+                response = await self._send(client, method, url, endpoint, hedge and idempotent, **kwargs)
+            except httpx.TimeoutException:
+                breaker.record_failure()
+                error = UpstreamUnavailableError(self.name, endpoint, "timed out", status.HTTP_504_GATEWAY_TIMEOUT)
+            except httpx.TransportError as e:
+                breaker.record_failure()
+                error = UpstreamUnavailableError(self.name, endpoint, type(e).__name__, status.HTTP_502_BAD_GATEWAY)
+            except asyncio.CancelledError:
+                # The caller gave up; that says nothing about the upstream
+                breaker.release()
+                raise
+            except Exception:
+                breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRYABLE_STATUS:
+                    breaker.record_success()
+                    return response
+                breaker.record_failure()
+
+            if (not idempotent or attempt >= self.max_retries
+                    or not self.budget.withdraw() or not breaker.allow()):
+                if response is not None:
+                    return response
+                raise error
+
+            attempt += 1
+            self.retries += 1
+            # Full jitter keeps retries from synchronising across workers
+            try:
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt)))
+            except asyncio.CancelledError:
+                breaker.release()  # the slot allow() just took for the retry
+                raise
+
+    async def _timed(self, client: httpx.AsyncClient, method: str, url: str, endpoint: str, **kwargs) -> httpx.Response:
+        started = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self._latency(endpoint).record(time.perf_counter() - started)
+        return response
+
+    async def _send(self, client: httpx.AsyncClient, method: str, url: str, endpoint: str,
+                    hedge: bool, **kwargs) -> httpx.Response:
+        threshold = self._latency(endpoint).percentile(self.hedge_percentile) if hedge else None
+        if threshold is None:
+            return await self._timed(client, method, url, endpoint, **kwargs)
+
+        primary = asyncio.ensure_future(self._timed(client, method, url, endpoint, **kwargs))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or not self.budget.withdraw():
+            return await primary
+
+        self.hedges += 1
+        pending = {primary, asyncio.ensure_future(self._timed(client, method, url, endpoint, **kwargs))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def snapshot(self) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, breaker in self._breakers.items():
+            p95 = self._latency(endpoint).percentile(0.95)
+            endpoints[endpoint] = {
+                **breaker.snapshot(),
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            }
+        return {
+            "upstream": self.name,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "retry_budget_tokens": round(self.budget.tokens, 2),
+            "retry_budget_exhausted": self.budget.exhausted,
+            "endpoints": endpoints,
+        }